@@ -11,15 +11,252 @@ with components for seed data creation and multiple knowledge generation flows.
 from kfp import compiler, dsl, kubernetes
 from kfp.dsl import Dataset, Input, Output
 
+PVC_SIZE = "10Gi"
+PVC_STORAGE_CLASS = "nfs-csi"
+# The four generation components share the workspace PVC in parallel
+PVC_ACCESS_MODES = ["ReadWriteMany"]
 BASE_IMAGE = "image-registry.openshift-image-registry.svc:5000/redhat-ods-applications/jupyter-minimal-cpu-py312-ubi9:2025.1"
 
 
+def generate_in_shards(
+    flow,
+    dataset,
+    output_dir: str,
+    checkpoint_dir: str = "",
+    shard_size: int = 100,
+    artifact_format: str = "jsonl",
+    fingerprint: str = "",
+    **generate_kwargs,
+):
+    """Run ``flow.generate`` shard by shard, checkpointing every finished shard.
+
+    The seed dataset is split into shards of ``shard_size`` rows. Each shard is
+    generated, written atomically to ``checkpoint_dir`` and linked into
+    ``output_dir`` as ``gen-00000.jsonl``, ``gen-00001.jsonl``, ... (or
+    ``.parquet``) right away, so a restarted component skips every shard that
+    already finished. Checkpoint names include a hash of the shard rows, the
+    flow, ``fingerprint`` (e.g. the model name) and ``generate_kwargs``, so
+    changed inputs are never served from a stale checkpoint.
+
+    Args:
+        flow: SDG Hub flow with its model config already set
+        dataset: Seed data as a pandas DataFrame or HuggingFace Dataset
+        output_dir: Artifact directory that receives the shard files
+        checkpoint_dir: Directory that outlives a pod restart, e.g. on the
+            mounted volume (default: write the shards to ``output_dir`` only)
+        shard_size: Number of seed rows per shard (0 = a single shard)
+        artifact_format: Shard file format, ``jsonl`` or ``parquet``
+        fingerprint: Extra configuration that changes the generated data
+        **generate_kwargs: Passed to ``flow.generate`` (runtime_params, ...)
+
+    Returns:
+        Total number of generated rows across all shards
+    """
+    import hashlib
+    import json
+    import os
+    import re
+    import shutil
+    import time
+    from pathlib import Path
+
+    if hasattr(dataset, "to_pandas"):
+        dataset = dataset.to_pandas()
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if checkpoint_dir:
+        flow_slug = re.sub(r"[^a-z0-9]+", "_", flow.metadata.name.lower()).strip("_")
+        checkpoint_dir = Path(checkpoint_dir) / flow_slug
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+    # Concurrency does not change the generated data, so it is not part of the key
+    config_kwargs = {k: v for k, v in generate_kwargs.items() if k != "max_concurrency"}
+    config_json = json.dumps(
+        [flow.metadata.name, fingerprint, config_kwargs], sort_keys=True, default=str
+    )
+    shard_size = shard_size if shard_size > 0 else max(1, len(dataset))
+    num_shards = max(1, -(-len(dataset) // shard_size))
+
+    def count_rows(shard_file):
+        """Count rows from the Parquet footer or by streaming JSONL newlines."""
+        if shard_file.stat().st_size == 0:
+            return 0
+        if artifact_format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetFile(shard_file).metadata.num_rows
+        with open(shard_file, "rb") as f:
+            return sum(
+                chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b"")
+            )
+
+    total_rows = 0
+    skipped_shards = 0
+    for shard_index in range(num_shards):
+        shard = dataset.iloc[shard_index * shard_size : (shard_index + 1) * shard_size]
+        output_file = output_dir / f"gen-{shard_index:05d}.{artifact_format}"
+        checkpoint_file = output_file
+        if checkpoint_dir:
+            shard_json = shard.to_json(orient="records", lines=True)
+            shard_hash = hashlib.sha256(
+                (config_json + shard_json).encode("utf-8")
+            ).hexdigest()[:12]
+            checkpoint_file = (
+                checkpoint_dir / f"gen-{shard_index:05d}-{shard_hash}.{artifact_format}"
+            )
+
+        if checkpoint_file.exists():
+            num_rows = count_rows(checkpoint_file)
+            skipped_shards += 1
+            print(f"Shard {shard_index + 1}/{num_shards}: already generated, skipping")
+        else:
+            start = time.perf_counter()
+            try:
+                generated_data = flow.generate(shard, **generate_kwargs)
+            except Exception as e:
+                # A small shard can be filtered down to nothing by a flow block;
+                # matched by name so this helper does not import SDG Hub itself
+                if type(e).__name__ != "EmptyDatasetError":
+                    raise
+                generated_data = shard.iloc[:0]
+            num_rows = len(generated_data)
+
+            # Write under a temporary name so a crash never leaves a partial shard;
+            # an empty file marks a shard that produced no records
+            tmp_file = checkpoint_file.with_name(f".{checkpoint_file.name}.tmp")
+            if num_rows == 0:
+                tmp_file.write_bytes(b"")
+            elif artifact_format == "parquet":
+                generated_data.to_parquet(tmp_file, compression="zstd", index=False)
+            else:
+                generated_data.to_json(tmp_file, orient="records", lines=True)
+            os.replace(tmp_file, checkpoint_file)
+            print(
+                f"Shard {shard_index + 1}/{num_shards}: generated {num_rows} records "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+
+        total_rows += num_rows
+        if checkpoint_file != output_file and not output_file.exists():
+            try:
+                os.link(checkpoint_file, output_file)
+            except OSError:
+                shutil.copy2(checkpoint_file, output_file)
+
+    print(f"Generated {num_shards - skipped_shards} shards, resumed {skipped_shards}")
+    return total_rows
+
+
+def write_seed_data(
+    batches,
+    constant_columns: dict,
+    output_file: str,
+    artifact_format: str = "jsonl",
+):
+    """Stream document batches into a seed data file with constant columns.
+
+    Every seed row repeats the same ICL example and domain, so instead of
+    attaching them row by row they are broadcast once per batch: for Parquet
+    with ``pyarrow.repeat`` as Arrow columns, and for JSONL as a JSON suffix
+    that is serialized once and appended to every line. Batches are written
+    as they arrive, so the documents never pass through an intermediate file.
+
+    Args:
+        batches: Iterable of ``pyarrow.Table`` or ``RecordBatch`` with the
+            per-row columns, e.g. ``document``
+        constant_columns: Column names and the value every row gets
+        output_file: Seed data file to write
+        artifact_format: ``jsonl`` or ``parquet`` (zstd-compressed)
+
+    Returns:
+        Number of rows written
+    """
+    import json
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
+
+    constant_scalars = {
+        name: pa.scalar(value) for name, value in constant_columns.items()
+    }
+    # ", "-joined '"name": value' pairs shared by every JSONL line
+    constant_json = json.dumps(constant_columns, ensure_ascii=False)[1:-1]
+    constant_suffix = f", {constant_json}" if constant_json else ""
+
+    num_rows = 0
+    writer = None
+    jsonl_file = None
+    if artifact_format == "jsonl":
+        jsonl_file = open(output_file, "w", encoding="utf-8")  # noqa: SIM115
+    try:
+        for batch in batches:
+            overlapping = set(batch.schema.names) & set(constant_columns)
+            if overlapping:
+                raise ValueError(
+                    f"Columns are both per-row and constant: {overlapping}"
+                )
+            if jsonl_file is None:
+                columns = list(batch.columns) + [
+                    pa.repeat(scalar, batch.num_rows)
+                    for scalar in constant_scalars.values()
+                ]
+                names = batch.schema.names + list(constant_scalars)
+                table = pa.Table.from_arrays(columns, names=names)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        output_file, table.schema, compression="zstd"
+                    )
+                writer.write_table(table)
+            else:
+                keys = [
+                    f"{json.dumps(name, ensure_ascii=False)}: "
+                    for name in batch.schema.names
+                ]
+                columns = [
+                    [json.dumps(value, ensure_ascii=False) for value in column]
+                    for column in batch.to_pydict().values()
+                ]
+                jsonl_file.writelines(
+                    "{"
+                    + ", ".join(
+                        key + value for key, value in zip(keys, row, strict=True)
+                    )
+                    + constant_suffix
+                    + "}\n"
+                    for row in zip(*columns, strict=True)
+                )
+            num_rows += batch.num_rows
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+        if writer is not None:
+            writer.close()
+
+    if artifact_format == "parquet" and writer is None:
+        # No batches: still write a valid (empty) Parquet file
+        pq.write_table(
+            pa.table({
+                name: pa.array([], type=s.type) for name, s in constant_scalars.items()
+            }),
+            output_file,
+            compression="zstd",
+        )
+    return num_rows
+
+
 @dsl.component(
     base_image=BASE_IMAGE,
     packages_to_install=[
         "datasets",
         "nest-asyncio",
     ],
+    additional_funcs=[write_seed_data],
 )
 def create_seed_data_component(output_dataset: Output[Dataset]):
     """Load or create seed data from QuALITY Benchmark dataset."""
@@ -29,8 +266,8 @@ def create_seed_data_component(output_dataset: Output[Dataset]):
 
     seed_data_path = os.getenv("SEED_DATA_PATH", "seed_data.jsonl")
 
-    def create_seed_data_from_quality_benchmark(seed_data_path: str):
-        """Create seed data from QuALITY Benchmark dataset and save to file."""
+    def create_seed_data_from_quality_benchmark():
+        """Load the QuALITY Benchmark documents and the seed examples they share."""
 
         print("Loading QuALITY Benchmark dataset...")
         quality_corpus = (
@@ -51,38 +288,33 @@ def create_seed_data_component(output_dataset: Output[Dataset]):
             "domain": "articles/essays",
         }
 
-        quality_corpus = quality_corpus.map(lambda x: seed_examples)
-
-        # Save to file
-        quality_corpus.to_json(seed_data_path, orient="records", lines=True)
-        print(f"Created seed data at: {seed_data_path}")
-
-        return quality_corpus
+        return quality_corpus, seed_examples
 
     # Load seed data. If one is not provided, create it from the quality benchmark dataset.
     if not os.path.exists(seed_data_path):
         print(f"{seed_data_path} not found. Creating seed data...")
-        quality_corpus = create_seed_data_from_quality_benchmark(
-            seed_data_path=seed_data_path
-        )
+        quality_corpus, constant_columns = create_seed_data_from_quality_benchmark()
     else:
         print(f"Loading existing seed data from {seed_data_path}")
         quality_corpus = load_dataset("json", data_files=seed_data_path, split="train")
+        constant_columns = {}
 
     # Subsample the seed data. Useful for debugging.
-    subsample = int(os.getenv("SEED_DATA_SUBSAMPLE", "0"))
-    if subsample > 0:
-        quality_corpus = quality_corpus.select(range(subsample))
-        print(f"Subsampled to {subsample} samples")
-
     subsample = int(os.getenv("SEED_DATA_SUBSAMPLE", "0"))
     if subsample > 0:
         quality_corpus = quality_corpus.select(
             range(min(subsample, len(quality_corpus)))
         )
-
-    quality_corpus.to_json(output_dataset.path, orient="records", lines=True)
-    print(f"Saved seed data to: {output_dataset.path}")
+        print(f"Subsampled to {len(quality_corpus)} samples")
+
+    # The seed examples are the same for every document, so they are broadcast
+    # per Arrow batch while streaming instead of mapped onto each row
+    num_rows = write_seed_data(
+        quality_corpus.with_format("arrow").iter(batch_size=10000),
+        constant_columns,
+        output_dataset.path,
+    )
+    print(f"Saved {num_rows} seed examples to: {output_dataset.path}")
 
 
 @dsl.component(
@@ -92,10 +324,12 @@ def create_seed_data_component(output_dataset: Output[Dataset]):
         "nest-asyncio",
         "sdg_hub[examples]",  # Install SDG Hub from Git
     ],
+    additional_funcs=[generate_in_shards],
 )
 def generate_document_based_qa_component(
     input_dataset: Input[Dataset],
     output_dataset: Output[Dataset],
+    workspace_path: str = "",
 ):
     """Generate document-based QA knowledge tuning data."""
     import os
@@ -123,6 +357,12 @@ def generate_document_based_qa_component(
         api_base = os.getenv("API_BASE_URL", "https://openrouter.ai/api/v1")
         api_key = os.getenv("OPENAI_API_KEY", "EMPTY")
     max_concurrency = int(os.getenv("MAX_CONCURRENCY", "50"))
+    shard_size = int(os.getenv("SHARD_SIZE", "100"))
+    # Shards are checkpointed on the workspace PVC, so a retried pod resumes;
+    # CHECKPOINT_DIR overrides it, e.g. with a volume that outlives the run
+    checkpoint_dir = os.getenv("CHECKPOINT_DIR", "")
+    if not checkpoint_dir and workspace_path:
+        checkpoint_dir = os.path.join(workspace_path, "sdg_checkpoints")
 
     print("Loading input dataset...")
     quality_corpus = load_dataset("json", data_files=input_dataset.path, split="train")
@@ -147,12 +387,19 @@ def generate_document_based_qa_component(
         runtime_params = {"question_generation": {"max_tokens": 1024}}
 
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    # Each shard is written to the output directory as soon as it finishes
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        output_dataset.path,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        fingerprint=f"{hosted_model}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        max_concurrency=max_concurrency,
     )
 
-    generated_data.to_json(output_dataset.path, orient="records", lines=True)
-    print(f"Generated {len(generated_data)} document QA records")
+    print(f"Generated {num_generated} document QA records")
     print(f"Saved to: {output_dataset.path}")
 
 
@@ -163,9 +410,12 @@ def generate_document_based_qa_component(
         "nest-asyncio",
         "sdg_hub[examples]",  # Install SDG Hub from Git
     ],
+    additional_funcs=[generate_in_shards],
 )
 def generate_key_facts_component(
-    input_dataset: Input[Dataset], output_dataset: Output[Dataset]
+    input_dataset: Input[Dataset],
+    output_dataset: Output[Dataset],
+    workspace_path: str = "",
 ):
     """Generate key facts knowledge tuning data."""
     import os
@@ -193,6 +443,12 @@ def generate_key_facts_component(
         api_base = os.getenv("API_BASE_URL", "https://openrouter.ai/api/v1")
         api_key = os.getenv("OPENAI_API_KEY", "EMPTY")
     max_concurrency = int(os.getenv("MAX_CONCURRENCY", "50"))
+    shard_size = int(os.getenv("SHARD_SIZE", "100"))
+    # Shards are checkpointed on the workspace PVC, so a retried pod resumes;
+    # CHECKPOINT_DIR overrides it, e.g. with a volume that outlives the run
+    checkpoint_dir = os.getenv("CHECKPOINT_DIR", "")
+    if not checkpoint_dir and workspace_path:
+        checkpoint_dir = os.path.join(workspace_path, "sdg_checkpoints")
 
     print("Loading input dataset...")
     quality_corpus = load_dataset("json", data_files=input_dataset.path, split="train")
@@ -217,12 +473,19 @@ def generate_key_facts_component(
         runtime_params = {"generate_key_fact_qa": {"max_tokens": 6000}}
 
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    # Each shard is written to the output directory as soon as it finishes
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        output_dataset.path,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        fingerprint=f"{hosted_model}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        max_concurrency=max_concurrency,
     )
 
-    generated_data.to_json(output_dataset.path, orient="records", lines=True)
-    print(f"Generated {len(generated_data)} key facts records")
+    print(f"Generated {num_generated} key facts records")
     print(f"Saved to: {output_dataset.path}")
 
 
@@ -233,9 +496,12 @@ def generate_key_facts_component(
         "nest-asyncio",
         "sdg_hub[examples]",  # Install SDG Hub from Git
     ],
+    additional_funcs=[generate_in_shards],
 )
 def generate_detailed_summary_component(
-    input_dataset: Input[Dataset], output_dataset: Output[Dataset]
+    input_dataset: Input[Dataset],
+    output_dataset: Output[Dataset],
+    workspace_path: str = "",
 ):
     """Generate detailed summary knowledge tuning data."""
     import os
@@ -263,6 +529,12 @@ def generate_detailed_summary_component(
         api_key = os.getenv("OPENAI_API_KEY", "EMPTY")
     number_of_summaries = int(os.getenv("NUMBER_OF_SUMMARIES", "50"))
     max_concurrency = int(os.getenv("MAX_CONCURRENCY", "50"))
+    shard_size = int(os.getenv("SHARD_SIZE", "100"))
+    # Shards are checkpointed on the workspace PVC, so a retried pod resumes;
+    # CHECKPOINT_DIR overrides it, e.g. with a volume that outlives the run
+    checkpoint_dir = os.getenv("CHECKPOINT_DIR", "")
+    if not checkpoint_dir and workspace_path:
+        checkpoint_dir = os.path.join(workspace_path, "sdg_checkpoints")
 
     print("Loading input dataset...")
     quality_corpus = load_dataset("json", data_files=input_dataset.path, split="train")
@@ -291,12 +563,19 @@ def generate_detailed_summary_component(
         }
 
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    # Each shard is written to the output directory as soon as it finishes
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        output_dataset.path,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        fingerprint=f"{hosted_model}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        max_concurrency=max_concurrency,
     )
 
-    generated_data.to_json(output_dataset.path, orient="records", lines=True)
-    print(f"Generated {len(generated_data)} detailed summary records")
+    print(f"Generated {num_generated} detailed summary records")
     print(f"Saved to: {output_dataset.path}")
 
 
@@ -307,9 +586,12 @@ def generate_detailed_summary_component(
         "nest-asyncio",
         "sdg_hub[examples]",  # Install SDG Hub from Git
     ],
+    additional_funcs=[generate_in_shards],
 )
 def generate_extractive_summary_component(
-    input_dataset: Input[Dataset], output_dataset: Output[Dataset]
+    input_dataset: Input[Dataset],
+    output_dataset: Output[Dataset],
+    workspace_path: str = "",
 ):
     """Generate extractive summary knowledge tuning data."""
     import os
@@ -341,6 +623,12 @@ def generate_extractive_summary_component(
         api_key = os.getenv("OPENAI_API_KEY", "EMPTY")
     number_of_summaries = int(os.getenv("NUMBER_OF_SUMMARIES", "50"))
     max_concurrency = int(os.getenv("MAX_CONCURRENCY", "50"))
+    shard_size = int(os.getenv("SHARD_SIZE", "100"))
+    # Shards are checkpointed on the workspace PVC, so a retried pod resumes;
+    # CHECKPOINT_DIR overrides it, e.g. with a volume that outlives the run
+    checkpoint_dir = os.getenv("CHECKPOINT_DIR", "")
+    if not checkpoint_dir and workspace_path:
+        checkpoint_dir = os.path.join(workspace_path, "sdg_checkpoints")
 
     print("Loading input dataset...")
     quality_corpus = load_dataset("json", data_files=input_dataset.path, split="train")
@@ -379,17 +667,23 @@ def generate_extractive_summary_component(
 
     # Generate data
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    # Each shard is written to the output directory as soon as it finishes
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        output_dataset.path,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        fingerprint=f"{hosted_model}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        max_concurrency=max_concurrency,
     )
 
-    # Save output
-    generated_data.to_json(output_dataset.path, orient="records", lines=True)
-    print(f"Generated {len(generated_data)} extractive summary records")
+    print(f"Generated {num_generated} extractive summary records")
     print(f"Saved to: {output_dataset.path}")
 
 
-@dsl.component(base_image=BASE_IMAGE, packages_to_install=["datasets"])
+@dsl.component(base_image=BASE_IMAGE)
 def merge_all_outputs_component(
     extractive_data: Input[Dataset],
     detailed_data: Input[Dataset],
@@ -397,45 +691,60 @@ def merge_all_outputs_component(
     doc_qa_data: Input[Dataset],
     merged_output: Output[Dataset],
 ):
-    """Combine all generated data into a single output."""
+    """Link all generated data into a single output without rewriting it."""
+    import glob
+    import json
     import os
-
-    from datasets import load_dataset
-
-    print("Loading all datasets...")
-
-    # Load each dataset
-    extractive = load_dataset("json", data_files=extractive_data.path, split="train")
-    detailed = load_dataset("json", data_files=detailed_data.path, split="train")
-    key_facts = load_dataset("json", data_files=key_facts_data.path, split="train")
-    doc_qa = load_dataset("json", data_files=doc_qa_data.path, split="train")
-
-    # Combine all datasets
-    print(f"  - Extractive: {len(extractive)} records")
-    print(f"  - Detailed: {len(detailed)} records")
-    print(f"  - Key Facts: {len(key_facts)} records")
-    print(f"  - Doc QA: {len(doc_qa)} records")
-
-    extractive.to_json(
-        os.path.join(merged_output.path, "extractive_summary", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    detailed.to_json(
-        os.path.join(merged_output.path, "detailed_summary", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    key_facts.to_json(
-        os.path.join(merged_output.path, "key_facts_to_qa", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    doc_qa.to_json(
-        os.path.join(merged_output.path, "document_based_qa", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
+    import shutil
+
+    def count_lines(data_file, chunk_size=1 << 20):
+        """Count JSONL records by streaming newlines instead of parsing rows."""
+        num_rows = 0
+        last_byte = b"\n"
+        with open(data_file, "rb") as f:
+            while chunk := f.read(chunk_size):
+                num_rows += chunk.count(b"\n")
+                last_byte = chunk[-1:]
+        # The last record may not end with a newline
+        return num_rows + (last_byte != b"\n")
+
+    generated_dirs = {
+        "extractive_summary": extractive_data.path,
+        "detailed_summary": detailed_data.path,
+        "key_facts_to_qa": key_facts_data.path,
+        "document_based_qa": doc_qa_data.path,
+    }
+
+    print("Linking all datasets...")
+    manifest = {}
+    for dataset_folder, data_dir in generated_dirs.items():
+        dataset_output_dir = os.path.join(merged_output.path, dataset_folder)
+        os.makedirs(dataset_output_dir, exist_ok=True)
+
+        # The generation shards together are one dataset; empty ones are left out
+        num_rows = 0
+        linked_files = []
+        for data_file in sorted(glob.glob(os.path.join(data_dir, "*.jsonl"))):
+            file_rows = count_lines(data_file)
+            if file_rows == 0:
+                continue
+            file_name = os.path.basename(data_file)
+            output_file = os.path.join(dataset_output_dir, file_name)
+
+            # Hardlink the generated shard, copying only across devices
+            try:
+                os.link(data_file, output_file)
+            except OSError:
+                shutil.copy2(data_file, output_file)
+
+            num_rows += file_rows
+            linked_files.append(f"{dataset_folder}/{file_name}")
+
+        manifest[dataset_folder] = {"files": linked_files, "num_rows": num_rows}
+        print(f"  - {dataset_folder}: {num_rows} records")
+
+    with open(os.path.join(merged_output.path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
 
     print(f"Merged output saved to: {merged_output.path}")
 
@@ -443,6 +752,17 @@ def merge_all_outputs_component(
 @dsl.pipeline(
     name="Knowledge Generation Pipeline",
     description="Generate knowledge tuning datasets using SDG Hub",
+    pipeline_config=dsl.PipelineConfig(
+        workspace=dsl.WorkspaceConfig(
+            size=PVC_SIZE,
+            kubernetes=dsl.KubernetesWorkspaceConfig(
+                pvcSpecPatch={
+                    "accessModes": PVC_ACCESS_MODES,
+                    "storageClassName": PVC_STORAGE_CLASS,
+                }
+            ),
+        ),
+    ),
 )
 def knowledge_generation_pipeline():
     """
@@ -469,19 +789,23 @@ def knowledge_generation_pipeline():
 
     # Step 2-5: Generate different types of data in parallel
     extractive_summary_task = generate_extractive_summary_component(
-        input_dataset=seed_data_task.outputs["output_dataset"]
+        input_dataset=seed_data_task.outputs["output_dataset"],
+        workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
     )
 
     detailed_summary_task = generate_detailed_summary_component(
         input_dataset=seed_data_task.outputs["output_dataset"],
+        workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
     )
 
     key_facts_task = generate_key_facts_component(
         input_dataset=seed_data_task.outputs["output_dataset"],
+        workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
     )
 
     document_qa_task = generate_document_based_qa_component(
         input_dataset=seed_data_task.outputs["output_dataset"],
+        workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
     )
 
     generation_tasks = [
@@ -508,6 +832,18 @@ def knowledge_generation_pipeline():
                 "LITELLM_REQUEST_TIMEOUT": "LITELLM_REQUEST_TIMEOUT",
             },
         )
+        # Sharding keys are optional so existing secrets keep working
+        kubernetes.use_secret_as_env(
+            task,
+            secret_name="sdg-pipeline-config",
+            secret_key_to_env={
+                "SHARD_SIZE": "SHARD_SIZE",
+                "CHECKPOINT_DIR": "CHECKPOINT_DIR",
+            },
+            optional=True,
+        )
+        # Generation resumes from finished shards when the pod is retried
+        task.set_retry(num_retries=3)
 
     # Also apply environment variables to the seed data task
     kubernetes.use_secret_as_env(
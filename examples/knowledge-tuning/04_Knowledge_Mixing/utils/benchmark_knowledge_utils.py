@@ -0,0 +1,582 @@
+"""
+Benchmarks for the knowledge mixing utilities on synthetic data.
+
+Each benchmark times the current implementation in ``knowledge_utils`` against
+a row-by-row reference implementation and checks that both produce identical
+output.
+
+Usage (from the 04_Knowledge_Mixing directory):
+
+    python utils/benchmark_knowledge_utils.py messages --rows 100000
+    python utils/benchmark_knowledge_utils.py tokens --rows 200000 --workers 8
+    python utils/benchmark_knowledge_utils.py sample --raw-docs 100000
+    python utils/benchmark_knowledge_utils.py dedup --rows 20000
+    python utils/benchmark_knowledge_utils.py artifacts --rows 200000
+    python utils/benchmark_knowledge_utils.py streaming --rows 40000 --dedup
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, List
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from knowledge_utils import (  # noqa: E402
+    STREAMING_CHUNK_SIZE,
+    count_len_in_tokens,
+    dedup_qa,
+    generate_knowledge_qa_dataset,
+    get_peak_rss_mb,
+    rank_doc_qa,
+    sample_doc_qa,
+)
+
+# Mix of ASCII, escapes and non-ASCII so JSON encoding paths are exercised.
+_WORDS = [
+    "model",
+    "tuning",
+    "Red Hat",
+    "OpenShift",
+    'the "quoted" term',
+    "back\\slash",
+    "café",
+    "naïve",
+    "日本語",
+    "emoji 🚀",
+    "line\nbreak",
+    "tab\there",
+]
+
+
+def make_synthetic_qa(
+    n_rows: int,
+    n_raw_docs: int = 1000,
+    summaries_per_raw: int = 20,
+    seed: int = 0,
+    with_reasoning: bool = False,
+    raw_doc_words: int = 30,
+) -> pl.DataFrame:
+    """Build a synthetic generated Q&A dataframe with the knowledge-gen schema.
+
+    Every Q&A row repeats its raw document, as in the generated data, so
+    ``raw_doc_words`` decides how much text each row carries. Real documents
+    are chunks of about 1,500 words (roughly 10 KB).
+    """
+    rng = random.Random(seed)
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(n_words))
+
+    raw_docs = [f"Raw document {i}: {text(raw_doc_words)}" for i in range(n_raw_docs)]
+    summaries = [
+        [f"Summary {i}.{j}: {text(15)}" for j in range(summaries_per_raw)]
+        for i in range(n_raw_docs)
+    ]
+    raw_idx = [rng.randrange(n_raw_docs) for _ in range(n_rows)]
+    data = {
+        "question": [f"Question {k} about {text(4)}?" for k in range(n_rows)],
+        "response": [f"[ANSWER] {text(8)} [END]" for _ in range(n_rows)],
+        "document": [summaries[i][rng.randrange(summaries_per_raw)] for i in raw_idx],
+        "document_outline": [f"Outline {i}" for i in raw_idx],
+        "raw_document": [raw_docs[i] for i in raw_idx],
+    }
+    if with_reasoning:
+        data["reasoning"] = [text(6) for _ in range(n_rows)]
+    return pl.DataFrame(data)
+
+
+def _timed(fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _print_result(name: str, rows: int, reference_s: float, current_s: float):
+    print(
+        f"{name:<40} rows={rows:>9,}  reference={reference_s:8.2f}s  "
+        f"current={current_s:8.2f}s  speedup={reference_s / current_s:6.1f}x"
+    )
+
+
+#############################
+# generate_knowledge_qa_dataset
+#############################
+
+
+def reference_generate_knowledge_qa_dataset(
+    df: pl.DataFrame, keep_document_in_context: bool
+) -> pl.DataFrame:
+    """Row-by-row implementation (``map_elements``) used before vectorization."""
+    has_reasoning = "reasoning" in df.columns
+    df = df.with_columns(
+        pl.col("response")
+        .str.replace_all(r"\[END\]", "")
+        .str.replace_all(r"\[ANSWER\]", "")
+        .str.strip_chars()
+    )
+
+    def messages(record: dict) -> List[dict]:
+        if keep_document_in_context:
+            content = (
+                f"{record['document_outline']}\n{record['document']}\n\n"
+                f"{record['question']}"
+            )
+        else:
+            content = f"In {record['document_outline']}, {record['question']}"
+        return [
+            {"role": "user", "content": content, "thinking": None},
+            {
+                "role": "assistant",
+                "content": record["response"],
+                "thinking": record["reasoning"] if has_reasoning else "",
+            },
+        ]
+
+    columns = ["question", "response", "document", "document_outline"]
+    if has_reasoning:
+        columns.append("reasoning")
+    return df.with_columns(
+        pl.struct([
+            pl.col("document").alias("sdg_document"),
+            pl.lit("document_knowledge_qa").alias("dataset"),
+            pl.col("raw_document"),
+        ])
+        .map_elements(json.dumps, return_dtype=pl.String)
+        .alias("metadata"),
+        pl.struct(columns).map_elements(messages).alias("messages"),
+    ).select(["messages", "metadata", pl.lit(True).alias("unmask")])
+
+
+def bench_messages(args: argparse.Namespace):
+    df = make_synthetic_qa(
+        args.rows,
+        n_raw_docs=args.raw_docs,
+        seed=args.seed,
+        with_reasoning=args.reasoning,
+        raw_doc_words=args.raw_doc_words,
+    )
+    for keep_document in (False, True):
+        expected, reference_s = _timed(
+            reference_generate_knowledge_qa_dataset, df, keep_document
+        )
+        actual, current_s = _timed(
+            generate_knowledge_qa_dataset,
+            df,
+            pre_training=True,
+            keep_document_in_context=keep_document,
+        )
+        if not expected.equals(actual):
+            raise AssertionError("Vectorized output differs from the reference")
+        _print_result(
+            f"messages+metadata (document={keep_document})",
+            args.rows,
+            reference_s,
+            current_s,
+        )
+
+
+#############################
+# count_len_in_tokens
+#############################
+
+
+def reference_count_len_in_tokens(
+    df: pl.DataFrame, tokenizer: Any, column_name: str = "messages"
+) -> pl.DataFrame:
+    """Row-by-row implementation (two ``map_elements`` passes)."""
+    return df.with_columns(
+        pl.col(column_name)
+        .map_elements(
+            lambda messages: tokenizer.apply_chat_template(messages, tokenize=False),
+            return_dtype=pl.String,
+        )
+        .map_elements(lambda text: len(tokenizer.encode(text)), return_dtype=pl.Int32)
+        .alias("token_length")
+    )
+
+
+def bench_tokens(args: argparse.Namespace):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    df = generate_knowledge_qa_dataset(
+        make_synthetic_qa(args.rows, seed=args.seed),
+        keep_document_in_context=True,
+    )
+    expected, reference_s = _timed(reference_count_len_in_tokens, df, tokenizer)
+    actual, current_s = _timed(
+        count_len_in_tokens,
+        df,
+        tokenizer,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+    )
+    if not expected["token_length"].equals(actual["token_length"]):
+        raise AssertionError("Batched token lengths differ from the reference")
+    _print_result(
+        f"count_len_in_tokens (workers={args.workers})",
+        args.rows,
+        reference_s,
+        current_s,
+    )
+
+
+#############################
+# sample_doc_qa
+#############################
+
+
+def reference_sample_doc_qa(
+    df: pl.DataFrame, n_docs_per_raw: int, qa_per_doc: int
+) -> pl.DataFrame:
+    """Per-group implementation (``map_groups``) used before vectorization."""
+    df = df.with_columns(pl.struct(["question", "response"]).alias("qa_pair"))
+    df = df.group_by("document").agg(
+        pl.col("qa_pair"),
+        pl.col("raw_document").first(),
+        pl.col("document_outline").first(),
+    )
+    sampled = df.group_by("raw_document").map_groups(
+        lambda g: g.sample(n=min(n_docs_per_raw, g.height))
+    )
+    return (
+        sampled.with_columns(pl.col("qa_pair").list.slice(0, qa_per_doc))
+        .explode("qa_pair")
+        .with_columns(
+            pl.col("qa_pair").struct.field("question"),
+            pl.col("qa_pair").struct.field("response"),
+        )
+        .drop("qa_pair")
+    )
+
+
+def _summaries_per_raw(df: pl.DataFrame) -> pl.DataFrame:
+    return (
+        df.group_by("raw_document")
+        .agg(pl.col("document").n_unique().alias("n"))
+        .sort("raw_document")
+    )
+
+
+def bench_sample(args: argparse.Namespace):
+    df = make_synthetic_qa(
+        args.raw_docs * args.rows_per_raw,
+        n_raw_docs=args.raw_docs,
+        seed=args.seed,
+    )
+    expected, reference_s = _timed(
+        reference_sample_doc_qa, df, args.cut, args.qa_per_doc
+    )
+    actual, current_s = _timed(
+        sample_doc_qa,
+        df,
+        n_docs_per_raw=args.cut,
+        qa_per_doc=args.qa_per_doc,
+        seed=args.seed,
+    )
+    if not _summaries_per_raw(expected).equals(_summaries_per_raw(actual)):
+        raise AssertionError("Vectorized sampler picked a different number of docs")
+    repeat = sample_doc_qa(
+        df.sample(fraction=1.0, shuffle=True, seed=args.seed + 1),
+        n_docs_per_raw=args.cut,
+        qa_per_doc=args.qa_per_doc,
+        seed=args.seed,
+    )
+    if set(repeat["document"]) != set(actual["document"]):
+        raise AssertionError("Sampler is not deterministic for a fixed seed")
+    _print_result(
+        f"sample_doc_qa (raw_docs={args.raw_docs:,})",
+        df.height,
+        reference_s,
+        current_s,
+    )
+
+
+#############################
+# dedup_qa
+#############################
+
+
+def _with_duplicates(df: pl.DataFrame, fraction: float, seed: int) -> pl.DataFrame:
+    """Append exact copies and one-word edits of a fraction of the rows."""
+    rng = random.Random(seed)
+    copies = df.sample(fraction=fraction, seed=seed).to_dicts()
+    for i, row in enumerate(copies):
+        if i % 2:
+            words = row["response"].split(" ")
+            words[rng.randrange(len(words))] = "edited"
+            row["response"] = " ".join(words)
+    return pl.concat([df, pl.DataFrame(copies, schema=df.schema)])
+
+
+def reference_dedup_qa(
+    df: pl.DataFrame, threshold: float, ngram_size: int
+) -> pl.DataFrame:
+    """Pairwise exact Jaccard similarity against every earlier row."""
+
+    def normalize(text: str) -> str:
+        text = re.sub(r"[^\w\s]", "", text.lower())
+        return re.sub(r"\s+", " ", text).strip()
+
+    def shingles(text: str) -> set:
+        words = text.split(" ")
+        return {
+            " ".join(words[i : i + ngram_size])
+            for i in range(len(words) - ngram_size + 1)
+        }
+
+    keep, seen = [], {}
+    for row in df.iter_rows(named=True):
+        text = normalize(f"{row['question']} {row['response']}")
+        earlier = seen.setdefault(row["raw_document"], [])
+        current = shingles(text)
+        duplicate = any(
+            text == other
+            or (
+                current
+                and other_shingles
+                and len(current & other_shingles) / len(current | other_shingles)
+                >= threshold
+            )
+            for other, other_shingles in earlier
+        )
+        earlier.append((text, current))
+        keep.append(not duplicate)
+    return df.filter(pl.Series(keep))
+
+
+def bench_dedup(args: argparse.Namespace):
+    df = _with_duplicates(
+        make_synthetic_qa(args.rows, n_raw_docs=args.raw_docs, seed=args.seed),
+        args.duplicates,
+        args.seed,
+    )
+    expected, reference_s = _timed(
+        reference_dedup_qa, df, args.threshold, args.ngram_size
+    )
+    actual, current_s = _timed(
+        dedup_qa, df, near_dup_threshold=args.threshold, ngram_size=args.ngram_size
+    )
+    # MinHash-LSH only estimates similarity, so report agreement instead of
+    # requiring identical output
+    expected_kept = set(expected["question"] + expected["response"])
+    actual_kept = set(actual["question"] + actual["response"])
+    print(
+        f"  kept reference={expected.height:,} current={actual.height:,} "
+        f"agreement={len(expected_kept & actual_kept) / len(expected_kept):.4f}"
+    )
+    _print_result(
+        f"dedup_qa (threshold={args.threshold})",
+        df.height,
+        reference_s,
+        current_s,
+    )
+
+
+#############################
+# Eager vs streaming mixing
+#############################
+
+
+def _mix_corpus(
+    corpus_dir: str, output_path: str, streaming: bool, dedup: bool, cut: int, queue
+):
+    """Run the mixing steps of one summary type and report time and peak RSS."""
+    start = time.perf_counter()
+    if streaming:
+        pl.Config.set_streaming_chunk_size(STREAMING_CHUNK_SIZE)
+    pattern = os.path.join(corpus_dir, "*.parquet")
+    df = pl.scan_parquet(pattern) if streaming else pl.read_parquet(pattern)
+    if dedup:
+        df = dedup_qa(df)
+    ranked = rank_doc_qa(df, max_docs_per_raw=cut, seed=0)
+    generated = generate_knowledge_qa_dataset(
+        ranked,
+        keep_columns=[
+            "question",
+            "document_outline",
+            "raw_document",
+            "document",
+            "doc_rank",
+        ],
+        pre_training=True,
+        keep_document_in_context=True,
+    )
+    if streaming:
+        generated.sink_parquet(output_path, row_group_size=STREAMING_CHUNK_SIZE)
+    else:
+        generated.write_parquet(output_path)
+    queue.put((time.perf_counter() - start, get_peak_rss_mb()))
+
+
+def bench_streaming(args: argparse.Namespace):
+    """Compare the peak RSS of eager and streaming mixing on a Parquet corpus.
+
+    Each run happens in a fresh process so its peak RSS is its own. The
+    corpus is written in parts of realistic document size, the way the
+    generation step shards its output.
+    """
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, "corpus")
+        os.makedirs(corpus_dir)
+        part_rows = max(1, args.rows // args.parts)
+        for part in range(args.parts):
+            qa = make_synthetic_qa(
+                part_rows,
+                n_raw_docs=max(1, args.raw_docs // args.parts),
+                seed=args.seed + part,
+                raw_doc_words=args.raw_doc_words,
+            )
+            qa = _with_duplicates(qa, args.duplicates, args.seed + part)
+            qa.write_parquet(os.path.join(corpus_dir, f"part-{part:05d}.parquet"))
+        files = Path(corpus_dir).iterdir()
+        corpus_mb = sum(path.stat().st_size for path in files) / (1 << 20)
+        print(f"  corpus: {args.parts} parts, {corpus_mb:,.0f} MiB Parquet")
+
+        outputs = {}
+        for streaming in (False, True):
+            name = "streaming" if streaming else "eager"
+            outputs[name] = os.path.join(tmp_dir, f"{name}.parquet")
+            queue = context.Queue()
+            process = context.Process(
+                target=_mix_corpus,
+                args=(
+                    corpus_dir,
+                    outputs[name],
+                    streaming,
+                    args.dedup,
+                    args.cut,
+                    queue,
+                ),
+            )
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"{name} run exited with {process.exitcode}")
+            seconds, peak_rss = queue.get()
+            print(f"{name:<10} time={seconds:7.2f}s  peak RSS={peak_rss:8,.0f} MiB")
+
+        # Streaming keeps the input order, so compare the rows as sets
+        eager = pl.read_parquet(outputs["eager"])
+        streamed = pl.read_parquet(outputs["streaming"])
+        keys = ["metadata", "question", "doc_rank"]
+        if not eager.sort(keys).equals(streamed.sort(keys)):
+            raise AssertionError("streaming output differs from eager")
+
+
+#############################
+# Pipeline artifact formats
+#############################
+
+
+def bench_artifacts(args: argparse.Namespace):
+    """Compare JSONL with zstd Parquet for the generated data artifacts."""
+    df = make_synthetic_qa(args.rows, n_raw_docs=args.raw_docs, seed=args.seed)
+    formats = {
+        "jsonl": (lambda path: df.write_ndjson(path), pl.read_ndjson),
+        "parquet": (
+            lambda path: df.write_parquet(path, compression="zstd"),
+            pl.read_parquet,
+        ),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, (write, read) in formats.items():
+            path = os.path.join(tmp_dir, f"gen.{name}")
+            _, write_s = _timed(write, path)
+            loaded, read_s = _timed(read, path)
+            if not loaded.equals(df):
+                raise AssertionError(f"{name} round trip changed the data")
+            results[name] = (write_s, read_s, os.path.getsize(path) / 1e6)
+            print(
+                f"{name:<8} write={write_s:6.2f}s  read={read_s:6.2f}s  "
+                f"size={results[name][2]:9.1f} MB"
+            )
+
+    jsonl, parquet = results["jsonl"], results["parquet"]
+    _print_result(
+        "artifact write + read (jsonl -> parquet)",
+        df.height,
+        jsonl[0] + jsonl[1],
+        parquet[0] + parquet[1],
+    )
+    print(f"{'artifact size':<40} jsonl/parquet={jsonl[2] / parquet[2]:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    messages = subparsers.add_parser(
+        "messages", help="generate_knowledge_qa_dataset message/metadata building"
+    )
+    messages.add_argument("--rows", type=int, default=100_000)
+    messages.add_argument("--raw-docs", type=int, default=1000)
+    messages.add_argument("--raw-doc-words", type=int, default=1500)
+    messages.add_argument("--reasoning", action="store_true")
+    messages.add_argument("--seed", type=int, default=0)
+    messages.set_defaults(func=bench_messages)
+
+    tokens = subparsers.add_parser("tokens", help="count_len_in_tokens")
+    tokens.add_argument("--rows", type=int, default=200_000)
+    tokens.add_argument("--tokenizer", default="RedHatAI/Llama-3.1-8B-Instruct")
+    tokens.add_argument("--batch-size", type=int, default=1024)
+    tokens.add_argument("--workers", type=int, default=4)
+    tokens.add_argument("--seed", type=int, default=0)
+    tokens.set_defaults(func=bench_tokens)
+
+    sample = subparsers.add_parser("sample", help="sample_doc_qa per raw document")
+    sample.add_argument("--raw-docs", type=int, default=100_000)
+    sample.add_argument("--rows-per-raw", type=int, default=10)
+    sample.add_argument("--cut", type=int, default=5)
+    sample.add_argument("--qa-per-doc", type=int, default=3)
+    sample.add_argument("--seed", type=int, default=0)
+    sample.set_defaults(func=bench_sample)
+
+    dedup = subparsers.add_parser("dedup", help="dedup_qa exact and near duplicates")
+    dedup.add_argument("--rows", type=int, default=20_000)
+    dedup.add_argument("--raw-docs", type=int, default=100)
+    dedup.add_argument("--duplicates", type=float, default=0.2)
+    dedup.add_argument("--threshold", type=float, default=0.8)
+    dedup.add_argument("--ngram-size", type=int, default=3)
+    dedup.add_argument("--seed", type=int, default=0)
+    dedup.set_defaults(func=bench_dedup)
+
+    artifacts = subparsers.add_parser(
+        "artifacts", help="JSONL vs zstd Parquet pipeline artifacts"
+    )
+    artifacts.add_argument("--rows", type=int, default=200_000)
+    artifacts.add_argument("--raw-docs", type=int, default=1000)
+    artifacts.add_argument("--seed", type=int, default=0)
+    artifacts.set_defaults(func=bench_artifacts)
+
+    streaming = subparsers.add_parser(
+        "streaming", help="peak RSS of eager vs streaming mixing"
+    )
+    streaming.add_argument("--rows", type=int, default=40_000)
+    streaming.add_argument("--parts", type=int, default=8)
+    streaming.add_argument("--raw-docs", type=int, default=4000)
+    streaming.add_argument("--raw-doc-words", type=int, default=1500)
+    streaming.add_argument("--duplicates", type=float, default=0.1)
+    streaming.add_argument("--cut", type=int, default=10)
+    streaming.add_argument("--dedup", action="store_true")
+    streaming.add_argument("--seed", type=int, default=0)
+    streaming.set_defaults(func=bench_streaming)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,94 @@
 import json
-from typing import Any, List, Optional
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, TypeVar
 
 import polars as pl
 
+# Functions typed with FrameT accept an eager DataFrame or a LazyFrame and
+# return the same kind, so the mixing steps can also run on the streaming engine.
+FrameT = TypeVar("FrameT", pl.DataFrame, pl.LazyFrame)
 
-def get_avg_summaries_per_raw_doc(df: pl.DataFrame) -> float:
+# Rows per streaming-engine morsel and per Parquet row group when streaming.
+# Every Q&A row carries its ~10 KB raw document, so the default morsels of
+# 100,000 rows would hold gigabytes; 2,000 rows keep them around 40 MB.
+STREAMING_CHUNK_SIZE = 2000
+
+
+def get_avg_summaries_per_raw_doc(df: FrameT) -> float:
     """
     Calculate average summaries per raw document in the dataset.
 
     Args:
-        df: Input dataframe with document and raw_document columns
+        df: Input dataframe or LazyFrame with document and raw_document columns
 
     Returns:
         Average number of summaries per raw document
     """
-    # Calculate average summaries per raw document
-    summary_counts = df.group_by("raw_document").agg(
-        pl.col("document").n_unique().alias("unique_summaries")
+    # Calculate average summaries per raw document; grouping on hashes keeps
+    # 8 bytes per summary in memory instead of the texts
+    avg_summaries = (
+        df.lazy()
+        .group_by(pl.col("raw_document").hash().alias("raw_key"))
+        .agg(pl.col("document").hash().n_unique().alias("unique_summaries"))
+        .select(pl.col("unique_summaries").mean())
+        .collect(engine="streaming")
+        .item()
     )
-    avg_summaries = summary_counts["unique_summaries"].mean()
 
     return avg_summaries
 
 
-def sample_doc_qa(
-    df: pl.DataFrame, n_docs_per_raw: int = 50, qa_per_doc: int = 3
-) -> pl.DataFrame:
+def get_peak_rss_mb() -> float:
+    """Return the peak resident set size of the current process in MiB."""
+    import resource
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak_rss / (1024 * 1024)
+    return peak_rss / 1024
+
+
+def scan_generated_data(data_dir: str) -> pl.LazyFrame:
     """
-    Sample Q&A pairs from documents with optional reasoning.
+    Lazily scan the generated shard files of one dataset as a single frame.
 
-    Note: 'document' column contains summaries, 'raw_document' contains original documents.
-    n_docs_per_raw is the number of unique summaries to sample per raw document.
+    Sharded generation writes each shard with the types inferred from its own
+    rows, so a column that is all null in one shard is a Null column there
+    and a String column in the next, which a single glob scan rejects. Each
+    file is scanned on its own and the frames are concatenated with relaxed
+    types, which unifies Null with the type of the other shards and fills
+    columns a shard lacks with nulls.
 
     Args:
-        df: Input dataframe with document and Q&A data
-        n_docs_per_raw: Maximum number of unique summaries to sample per raw document (cut size)
-        qa_per_doc: Maximum number of Q&A pairs per document/summary
+        data_dir: Directory with ``*.parquet`` files, or else ``*.jsonl`` files
 
     Returns:
-        Sampled dataframe with Q&A pairs
+        LazyFrame over all non-empty shard files
     """
+    data_files = sorted(Path(data_dir).glob("*.parquet"))
+    if data_files:
+        frames = [pl.scan_parquet(data_file) for data_file in data_files]
+    else:
+        data_files = sorted(Path(data_dir).glob("*.jsonl"))
+        # Infer from every row, a shard can start with nulls in a column
+        frames = [
+            pl.scan_ndjson(data_file, infer_schema_length=None)
+            for data_file in data_files
+            if data_file.stat().st_size > 0
+        ]
+    if not frames:
+        raise FileNotFoundError(f"No *.parquet or *.jsonl data found in {data_dir}")
+    return pl.concat(frames, how="diagonal_relaxed")
+
+
+def _select_doc_qa(df: FrameT) -> FrameT:
+    """Validate Q&A data and keep the columns used for mixing."""
     # Validate required columns
     required_cols = [
         "question",
@@ -48,10 +97,49 @@ def sample_doc_qa(
         "raw_document",
         "document_outline",
     ]
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    columns = df.collect_schema().names()
+    missing_cols = [col for col in required_cols if col not in columns]
     if missing_cols:
         raise ValueError(f"Missing required columns: {missing_cols}")
 
+    selected = ["document", "raw_document", "document_outline"]
+
+    # Handle optional reasoning column
+    if "parse_response_dict_reasoning_content" in columns:
+        df = df.with_columns([
+            pl.col("parse_response_dict_reasoning_content").alias("reasoning")
+        ])
+        selected.append("reasoning")
+
+    return df.select(selected + ["question", "response"])
+
+
+def sample_doc_qa(
+    df: pl.DataFrame,
+    n_docs_per_raw: int = 50,
+    qa_per_doc: int = 3,
+    seed: Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    Sample Q&A pairs from documents with optional reasoning.
+
+    Note: 'document' column contains summaries, 'raw_document' contains original documents.
+    n_docs_per_raw is the number of unique summaries to sample per raw document.
+
+    Args:
+        df: Input dataframe with document and Q&A data
+        n_docs_per_raw: Maximum number of unique summaries to sample per raw document (cut size)
+        qa_per_doc: Maximum number of Q&A pairs per document/summary
+        seed: Random seed; the same seed always selects the same summaries
+
+    Returns:
+        Sampled dataframe with Q&A pairs
+    """
+    # Sample unique summaries per raw document (validates required columns)
+    sampled_docs = rank_doc_qa(
+        df, max_docs_per_raw=n_docs_per_raw, qa_per_doc=qa_per_doc, seed=seed
+    )
+
     # Check if cut size is feasible
     avg_summaries = get_avg_summaries_per_raw_doc(df)
     if avg_summaries < n_docs_per_raw:
@@ -59,45 +147,304 @@ def sample_doc_qa(
             f"⚠️ Warning: Cut size {n_docs_per_raw} exceeds available summaries (avg: {avg_summaries:.1f} per raw document)"
         )
 
-    # Create Q&A pair structure
-    df = df.with_columns([pl.struct(["question", "response"]).alias("qa_pair")])
+    return sampled_docs.drop("doc_rank")
 
-    # Handle optional reasoning column
-    agg_cols = [
-        pl.col("qa_pair"),
-        pl.col("raw_document").first(),
-        pl.col("document_outline").first(),
+
+def rank_doc_qa(
+    df: FrameT,
+    max_docs_per_raw: Optional[int] = None,
+    qa_per_doc: int = 3,
+    seed: Optional[int] = None,
+) -> FrameT:
+    """
+    Rank summaries within each raw document in a single random order.
+
+    Each summary gets a random key by hashing its text with ``seed`` and is
+    ranked by that key within its raw document, entirely inside Polars. The
+    ranking depends only on the seed and the summary texts, not on row order.
+    Polars does not promise the same hash values across releases, so the
+    requirements pin the Polars version to keep a seed's cuts reproducible.
+
+    Keeping the rows with ``doc_rank < n`` samples ``n`` unique summaries per
+    raw document, like ``sample_doc_qa(df, n_docs_per_raw=n)``. Because every
+    cut is taken from the same ranking, smaller cuts are subsets of larger
+    ones and one ranking serves all cut sizes.
+
+    Args:
+        df: Input dataframe with document and Q&A data
+        max_docs_per_raw: Drop summaries ranked at or beyond this (largest cut size)
+        qa_per_doc: Maximum number of Q&A pairs per document/summary
+        seed: Random seed; a new one is drawn when not given
+
+    Returns:
+        Dataframe with Q&A pairs and a doc_rank column
+    """
+    if seed is None:
+        seed = random.getrandbits(32)
+
+    df = _select_doc_qa(df).with_row_index("_row")
+    columns = df.collect_schema().names()
+
+    # Rank on a key table of row numbers and hashes, collected once. It is
+    # small enough to rank in memory, and joining it back lets the Q&A texts
+    # of a LazyFrame keep streaming.
+    keys = (
+        df.lazy()
+        .select(
+            "_row",
+            pl.col("raw_document").hash(seed=seed).alias("raw_key"),
+            pl.col("document").hash(seed=seed).alias("doc_key"),
+        )
+        .collect(engine="streaming")
+    )
+    doc_ranks = (
+        keys.group_by("doc_key")
+        .agg(pl.col("raw_key").first())
+        .with_columns(
+            (pl.col("doc_key").rank(method="ordinal").over("raw_key") - 1).alias(
+                "doc_rank"
+            )
+        )
+    )
+    if max_docs_per_raw is not None:
+        doc_ranks = doc_ranks.filter(pl.col("doc_rank") < max_docs_per_raw)
+
+    # Keep the first qa_per_doc Q&A pairs of every ranked summary
+    kept_rows = (
+        keys.join(doc_ranks.select("doc_key", "doc_rank"), on="doc_key")
+        .filter(pl.col("_row").rank(method="ordinal").over("doc_key") <= qa_per_doc)
+        .select("_row", "doc_rank")
+    )
+    if isinstance(df, pl.LazyFrame):
+        kept_rows = kept_rows.lazy()
+
+    return df.join(kept_rows, on="_row", maintain_order="left").select(
+        [col for col in columns if col not in ("_row", "question", "response")]
+        + ["doc_rank", "question", "response"]
+    )
+
+
+# Modulus of the MinHash permutations (a * h + b) % P: the largest prime
+# below 2**32, so products of 32-bit hashes fit in UInt64 and minima in UInt32.
+_MINHASH_PRIME = (1 << 32) - 5
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Choose the LSH bands and rows per band for a Jaccard threshold.
+
+    Like ``datasketch.MinHashLSH``, this minimizes the sum of the false
+    positive and false negative probabilities over the similarity range.
+    """
+
+    def integrate(bands: int, rows: int, low: float, high: float) -> float:
+        """Integrate the probability that two texts share a band."""
+        steps = 100
+        width = (high - low) / steps
+        return width * sum(
+            1 - (1 - (low + (i + 0.5) * width) ** rows) ** bands for i in range(steps)
+        )
+
+    best_params, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = integrate(bands, rows, 0.0, threshold)
+            false_negative = (1 - threshold) - integrate(bands, rows, threshold, 1.0)
+            if false_positive + false_negative < best_error:
+                best_params, best_error = (bands, rows), false_positive + false_negative
+    return best_params
+
+
+def _dedup_text() -> pl.Expr:
+    """Question and response, lowercased and stripped of punctuation."""
+    return (
+        pl.concat_str(
+            [pl.col("question").fill_null(""), pl.col("response").fill_null("")],
+            separator=" ",
+        )
+        .str.to_lowercase()
+        .str.replace_all(r"[^\w\s]", "")
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+    )
+
+
+def _near_dup_rows(
+    df: FrameT, threshold: float, num_perm: int, ngram_size: int, seed: int
+) -> FrameT:
+    """
+    Find rows that are near duplicates of an earlier row of the same raw document.
+
+    Each text is split into word n-grams, MinHashed with ``num_perm``
+    permutations and cut into bands; the bands are hashed into bucket keys.
+    Rows sharing a bucket are kept when their signatures estimate a Jaccard
+    similarity of at least ``threshold``. Texts with fewer than ``ngram_size``
+    words have no n-grams and are left to the exact check.
+    """
+    bands, rows = _lsh_params(threshold, num_perm)
+    rng = random.Random(seed)
+    permutations = [
+        (rng.randrange(1, 1 << 31), rng.randrange(0, 1 << 31))
+        for _ in range(bands * rows)
     ]
 
-    if "parse_response_dict_reasoning_content" in df.columns:
-        df = df.with_columns([
-            pl.col("parse_response_dict_reasoning_content").alias("reasoning")
-        ])
-        agg_cols.append(pl.col("reasoning").first())
+    # Word n-grams of each row, hashed to 32 bits. They are built within each
+    # row's word list, so the step streams row by row. Raw documents are
+    # carried as hashes to keep the exploded rows small.
+    ngram = pl.concat_str(
+        [pl.element().shift(-i) for i in range(ngram_size)], separator=" "
+    )
+    shingles = (
+        df.select(
+            "_row",
+            pl.col("raw_document").hash(seed=seed).alias("raw_key"),
+            pl.col("_text")
+            .str.split(" ")
+            # n-grams running past the last word are null
+            .list.eval(ngram.drop_nulls().hash(seed=seed) & 0xFFFFFFFF)
+            .alias("shingle"),
+        )
+        .explode("shingle")
+        .drop_nulls("shingle")
+    )
+
+    # MinHash signature of each row, one minimum per permutation
+    signatures = shingles.group_by("_row", "raw_key").agg([
+        ((pl.col("shingle") * a + b) % _MINHASH_PRIME)
+        .min()
+        .cast(pl.UInt32)
+        .alias(f"minhash_{i}")
+        for i, (a, b) in enumerate(permutations)
+    ])
+
+    # Hash each band (with its index) into a bucket key
+    band_keys = pl.concat_list([
+        pl.struct([
+            pl.lit(band).alias("band"),
+            *[pl.col(f"minhash_{band * rows + i}") for i in range(rows)],
+        ]).hash(seed=seed)
+        for band in range(bands)
+    ])
+
+    # Candidates share a bucket with an earlier row; keep those whose
+    # signatures agree on at least the threshold fraction of permutations
+    candidates = (
+        signatures.select("_row", "raw_key", band_keys.alias("bucket"))
+        .explode("bucket")
+        .with_columns(pl.col("_row").min().over("raw_key", "bucket").alias("first"))
+        .filter(pl.col("first") < pl.col("_row"))
+        .select("_row", "first")
+        .unique()
+    )
+    similarity = pl.mean_horizontal([
+        pl.col(f"minhash_{i}") == pl.col(f"minhash_{i}_first")
+        for i in range(len(permutations))
+    ])
+    return (
+        candidates.join(signatures.drop("raw_key"), on="_row")
+        .join(
+            signatures.drop("raw_key"),
+            left_on="first",
+            right_on="_row",
+            suffix="_first",
+        )
+        .filter(similarity >= threshold)
+        .select("_row")
+        .unique()
+    )
+
 
-    # Group by document (summaries) and aggregate Q&A pairs
-    df = df.group_by("document").agg(agg_cols)
+def dedup_qa(
+    df: FrameT,
+    near_dup_threshold: float = 0.8,
+    num_perm: int = 64,
+    ngram_size: int = 3,
+    tokenizer: Any = None,
+    seed: int = 0,
+) -> FrameT:
+    """
+    Drop exact and near-duplicate Q&A pairs within each raw document.
+
+    Question and response are lowercased and stripped of punctuation before
+    comparing. Exact duplicates are found by hashing that text; the rest are
+    compared with MinHash-LSH on word n-grams, and a pair is dropped when it
+    is estimated to be similar to an earlier pair of the same raw document.
+    The first occurrence is always kept. A LazyFrame stays lazy: the
+    duplicates are found once, on a collected table of row numbers and
+    hashes, and joined back so the Q&A texts keep streaming.
+
+    Args:
+        df: Input dataframe or LazyFrame with question, response and raw_document
+        near_dup_threshold: Estimated Jaccard similarity above which pairs are
+            near duplicates; 1.0 or more keeps only the exact check
+        num_perm: Number of MinHash permutations
+        ngram_size: Number of words per n-gram
+        tokenizer: Optional tokenizer used to report how many tokens were removed
+        seed: Seed for the hash functions
 
-    # Sample unique summaries per raw document
-    sampled_docs = df.group_by("raw_document").map_groups(
-        lambda g: g.sample(n=min(n_docs_per_raw, g.height))
+    Returns:
+        Dataframe without the duplicate Q&A pairs
+    """
+    required_cols = ["question", "response", "raw_document"]
+    columns = df.collect_schema().names()
+    missing_cols = [col for col in required_cols if col not in columns]
+    if missing_cols:
+        raise ValueError(f"Missing required columns: {missing_cols}")
+
+    df = df.with_row_index("_row")
+    text = df.lazy().select("_row", "raw_document", _dedup_text().alias("_text"))
+
+    # Exact duplicates, found on a collected table of row numbers and hashes
+    exact_dups = (
+        text.select(
+            "_row",
+            pl.col("raw_document").hash(seed=seed).alias("raw_key"),
+            pl.col("_text").hash(seed=seed).alias("text_key"),
+        )
+        .collect(engine="streaming")
+        .filter(~pl.struct("raw_key", "text_key").is_first_distinct())
+        .select("_row")
     )
 
-    # Limit Q&A pairs per summary and explode
-    sampled_docs = sampled_docs.with_columns(
-        pl.col("qa_pair").list.slice(0, qa_per_doc)
-    ).explode(pl.col("qa_pair"))
+    if near_dup_threshold < 1.0:
+        # Exact duplicates are already dropped, so only compare the rest
+        near_dups = _near_dup_rows(
+            text.join(exact_dups.lazy(), on="_row", how="anti"),
+            near_dup_threshold,
+            num_perm,
+            ngram_size,
+            seed,
+        ).collect(engine="streaming")
+    else:
+        near_dups = exact_dups.clear()
 
-    # Extract question and response from struct
-    sampled_docs = sampled_docs.with_columns([
-        pl.col("qa_pair").struct.field("question").alias("question"),
-        pl.col("qa_pair").struct.field("response").alias("response"),
-    ]).drop("qa_pair")
+    # Report what was removed and how many tokens it saves
+    removed = pl.concat([exact_dups, near_dups])
+    report = (
+        f"  Removed {exact_dups.height:,} exact and {near_dups.height:,} "
+        "near-duplicate Q&A pairs"
+    )
+    if tokenizer is not None and removed.height > 0:
+        removed_qa = (
+            df.lazy()
+            .join(removed.lazy(), on="_row", how="semi")
+            .select("question", "response")
+            .collect(engine="streaming")
+        )
+        texts = removed_qa["question"].fill_null("").to_list()
+        texts += removed_qa["response"].fill_null("").to_list()
+        removed_tokens = sum(
+            _encode_lengths(tokenizer, texts, add_special_tokens=False)
+        )
+        report += f" ({removed_tokens:,} tokens)"
+    print(report)
 
-    return sampled_docs
+    if isinstance(df, pl.LazyFrame):
+        removed = removed.lazy()
+    return df.join(removed, on="_row", how="anti", maintain_order="left").drop("_row")
 
 
-def _clean_response_text(df: pl.DataFrame) -> pl.DataFrame:
+def _clean_response_text(df: FrameT) -> FrameT:
     """Clean response text by removing markers and whitespace."""
     return df.with_columns(
         pl.col("response")
@@ -108,87 +455,79 @@ def _clean_response_text(df: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def _create_metadata(df: pl.DataFrame) -> pl.Expr:
-    """Create metadata JSON structure."""
-    return (
-        pl.struct([
-            pl.col("document").alias("sdg_document"),
-            pl.lit("document_knowledge_qa").alias("dataset"),
-            pl.col("raw_document"),
-        ])
-        .map_elements(json.dumps)
-        .alias("metadata")
-    )
-
-
-def _create_messages_with_reasoning(record: dict) -> List[dict]:
-    """Create message structure with reasoning (thinking)."""
-    return [
-        {
-            "role": "user",
-            "content": f"{record['document_outline']}\n{record['document']}\n\n{record['question']}",
-            "thinking": None,
-        },
-        {
-            "role": "assistant",
-            "content": record["response"],
-            "thinking": record["reasoning"],
-        },
-    ]
+def _json_string_batch(values: pl.Series) -> pl.Series:
+    """JSON-encode a batch of strings, running ``json.dumps`` once per value.
 
+    Raw documents repeat on every Q&A row, so each distinct value is encoded
+    once per batch and joined back instead of being scanned for every row.
+    """
+    distinct = values.drop_nulls().unique()
+    encoded = [json.dumps(value) for value in distinct.to_list()]
+    return values.replace_strict(
+        distinct, encoded, default=None, return_dtype=pl.String
+    ).fill_null("null")
 
-def _create_messages_with_reasoning_no_document(record: dict) -> List[dict]:
-    """Create message structure with reasoning."""
-    return [
-        {
-            "role": "user",
-            "content": f"In {record['document_outline']}, {record['question']}",
-            "thinking": None,
-        },
-        {
-            "role": "assistant",
-            "content": record["response"],
-            "thinking": record["reasoning"],
-        },
-    ]
 
+def _json_string(column: str) -> pl.Expr:
+    """JSON-encode a string column exactly like ``json.dumps`` does."""
+    return pl.col(column).map_batches(
+        _json_string_batch, return_dtype=pl.String, is_elementwise=True
+    )
 
-def _create_messages_without_reasoning(record: dict) -> List[dict]:
-    """Create message structure without reasoning."""
-    return [
-        {
-            "role": "user",
-            "content": f"{record['document_outline']}\n{record['document']}\n\n{record['question']}",
-            "thinking": None,
-        },
-        {"role": "assistant", "content": record["response"], "thinking": ""},
-    ]
 
+def _create_metadata() -> pl.Expr:
+    """Create metadata JSON structure."""
+    return pl.concat_str([
+        pl.lit('{"sdg_document": '),
+        _json_string("document"),
+        pl.lit(', "dataset": "document_knowledge_qa", "raw_document": '),
+        _json_string("raw_document"),
+        pl.lit("}"),
+    ]).alias("metadata")
+
+
+def _create_messages(has_reasoning: bool, keep_document_in_context: bool) -> pl.Expr:
+    """Create the user/assistant message list, with optional reasoning."""
+
+    # Missing values render as "None", as they would in an f-string.
+    def text(column: str) -> pl.Expr:
+        return pl.col(column).fill_null("None")
+
+    if keep_document_in_context:
+        content = pl.format(
+            "{}\n{}\n\n{}",
+            text("document_outline"),
+            text("document"),
+            text("question"),
+        )
+    else:
+        content = pl.format("In {}, {}", text("document_outline"), text("question"))
 
-def _create_messages_without_reasoning_no_document(record: dict) -> List[dict]:
-    """Create message structure without reasoning."""
-    return [
-        {
-            "role": "user",
-            "content": f"In {record['document_outline']}, {record['question']}",
-            "thinking": None,
-        },
-        {"role": "assistant", "content": record["response"], "thinking": ""},
-    ]
+    user = pl.struct(
+        pl.lit("user").alias("role"),
+        content.alias("content"),
+        pl.lit(None, dtype=pl.String).alias("thinking"),
+    )
+    assistant = pl.struct(
+        pl.lit("assistant").alias("role"),
+        pl.col("response").alias("content"),
+        (pl.col("reasoning") if has_reasoning else pl.lit("")).alias("thinking"),
+    )
+    return pl.concat_list([user, assistant]).alias("messages")
 
 
 def generate_knowledge_qa_dataset(
-    generated_dataset: pl.DataFrame,
+    generated_dataset: FrameT,
     keep_columns: Optional[List[str]] = None,
     pre_training: bool = False,
     dataset_name: str = "document_knowledge_qa",
     keep_document_in_context: bool = False,
-) -> pl.DataFrame:
+) -> FrameT:
     """
     Generate knowledge Q&A dataset in chat format.
 
     Args:
-        generated_dataset: Input dataframe with Q&A data
+        generated_dataset: Input dataframe or LazyFrame with Q&A data
         keep_columns: Additional columns to keep in output
         pre_training: Whether to add unmask column for pre-training
         dataset_name: Name for the dataset metadata
@@ -207,9 +546,8 @@ def generate_knowledge_qa_dataset(
         "document_outline",
         "raw_document",
     ]
-    missing_cols = [
-        col for col in required_cols if col not in generated_dataset.columns
-    ]
+    columns = generated_dataset.collect_schema().names()
+    missing_cols = [col for col in required_cols if col not in columns]
     if missing_cols:
         raise ValueError(f"Missing required columns: {missing_cols}")
 
@@ -217,52 +555,13 @@ def generate_knowledge_qa_dataset(
     generated_dataset = _clean_response_text(generated_dataset)
 
     # Create base columns
-    base_columns = [_create_metadata(generated_dataset)]
+    base_columns = [_create_metadata()]
 
     # Handle reasoning column
-    has_reasoning = "reasoning" in generated_dataset.columns
+    has_reasoning = "reasoning" in columns
 
     # TODO: Fix the name of reasoning column, test with reasoning model
-    if has_reasoning and not keep_document_in_context:
-        message_columns = [
-            "question",
-            "response",
-            "document",
-            "document_outline",
-            "reasoning",
-        ]
-        messages_expr = (
-            pl.struct(message_columns)
-            .map_elements(_create_messages_with_reasoning_no_document)
-            .alias("messages")
-        )
-    elif has_reasoning and keep_document_in_context:
-        message_columns = [
-            "question",
-            "response",
-            "document",
-            "document_outline",
-            "reasoning",
-        ]
-        messages_expr = (
-            pl.struct(message_columns)
-            .map_elements(_create_messages_with_reasoning)
-            .alias("messages")
-        )
-    elif keep_document_in_context:
-        message_columns = ["question", "response", "document", "document_outline"]
-        messages_expr = (
-            pl.struct(message_columns)
-            .map_elements(_create_messages_without_reasoning)
-            .alias("messages")
-        )
-    else:
-        message_columns = ["question", "response", "document", "document_outline"]
-        messages_expr = (
-            pl.struct(message_columns)
-            .map_elements(_create_messages_without_reasoning_no_document)
-            .alias("messages")
-        )
+    messages_expr = _create_messages(has_reasoning, keep_document_in_context)
 
     base_columns.append(messages_expr)
 
@@ -281,34 +580,282 @@ def generate_knowledge_qa_dataset(
     return knowledge_ds
 
 
+# Token counts of rendered chat-template prefixes, keyed by tokenizer and
+# prefix text, so repeated calls and cuts only encode the shared header once.
+_PREFIX_TOKEN_COUNTS: Dict[Tuple[str, str], int] = {}
+
+
+def _encode_lengths(
+    tokenizer: Any, texts: List[str], add_special_tokens: bool = True
+) -> List[int]:
+    """Count tokens for a batch of texts, using the fast tokenizer batch API."""
+    if getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(
+            texts,
+            add_special_tokens=add_special_tokens,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+    if add_special_tokens:
+        return [len(tokenizer.encode(text)) for text in texts]
+    return [len(tokenizer.encode(text, add_special_tokens=False)) for text in texts]
+
+
+def _template_prefix(tokenizer: Any, texts: List[str]) -> str:
+    """
+    Return the rendered prefix shared by all texts, cut after a special token.
+
+    Added tokens are split out before the rest of the text is tokenized, so
+    the token count of the prefix plus that of the remainder equals the
+    count of the whole text.
+    """
+    get_added_vocab = getattr(tokenizer, "get_added_vocab", None)
+    if get_added_vocab is None or len(texts) < 2:
+        return ""
+    prefix = os.path.commonprefix(texts)
+    end = max(
+        (prefix.rfind(token) + len(token) for token in get_added_vocab()),
+        default=0,
+    )
+    return prefix[:end] if end > 0 else ""
+
+
+def _token_lengths(
+    tokenizer: Any,
+    conversations: List[List[dict]],
+    batch_size: int,
+    num_workers: int,
+) -> List[int]:
+    """Render and count tokens for conversations in batches."""
+
+    def render(batch: List[List[dict]]) -> List[str]:
+        """Apply chat template to each conversation."""
+        return [
+            tokenizer.apply_chat_template(messages, tokenize=False)
+            for messages in batch
+        ]
+
+    def count_with_prefix(texts: List[str], prefix: str) -> List[int]:
+        """Count tokens, encoding only the text after the cached prefix."""
+        prefix_len = len(prefix)
+        key = (getattr(tokenizer, "name_or_path", ""), prefix)
+        if key not in _PREFIX_TOKEN_COUNTS:
+            _PREFIX_TOKEN_COUNTS[key] = _encode_lengths(tokenizer, [prefix])[0]
+        suffix_lengths = _encode_lengths(
+            tokenizer,
+            [text[prefix_len:] for text in texts],
+            add_special_tokens=False,
+        )
+        return [_PREFIX_TOKEN_COUNTS[key] + n for n in suffix_lengths]
+
+    batches = [
+        conversations[i : i + batch_size]
+        for i in range(0, len(conversations), batch_size)
+    ]
+    if not batches:
+        return []
+
+    # Find the shared prefix on the first batch and keep it only if it
+    # reproduces the full-text counts exactly.
+    first_texts = render(batches[0])
+    token_lengths = _encode_lengths(tokenizer, first_texts)
+    prefix = _template_prefix(tokenizer, first_texts)
+    if prefix and count_with_prefix(first_texts, prefix) != token_lengths:
+        prefix = ""
+
+    def count_batch(batch: List[List[dict]]) -> List[int]:
+        texts = render(batch)
+        if prefix and all(text.startswith(prefix) for text in texts):
+            return count_with_prefix(texts, prefix)
+        return _encode_lengths(tokenizer, texts)
+
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        for lengths in executor.map(count_batch, batches[1:]):
+            token_lengths.extend(lengths)
+
+    return token_lengths
+
+
 def count_len_in_tokens(
-    df: pl.DataFrame, tokenizer: Any, column_name: str = "messages"
-) -> pl.DataFrame:
+    df: FrameT,
+    tokenizer: Any,
+    column_name: str = "messages",
+    batch_size: int = 1024,
+    num_workers: int = 1,
+) -> FrameT:
     """
     Count token length of messages using tokenizer.
 
+    Templates are rendered and encoded in batches of ``batch_size`` rows,
+    spread over ``num_workers`` threads. The token count of the chat-template
+    prefix shared by every row is computed once and cached; it is only used
+    after checking it gives the same counts as encoding the full text.
+
+    For a LazyFrame, tokens are counted batch by batch when the frame is
+    collected or sunk, so the streaming engine never holds all rows.
+
     Args:
-        df: Input dataframe
+        df: Input dataframe or LazyFrame
         tokenizer: HuggingFace tokenizer with apply_chat_template method
         column_name: Column containing messages to tokenize
+        batch_size: Number of rows rendered and encoded per batch
+        num_workers: Number of threads encoding batches in parallel
 
     Returns:
         Dataframe with added token_length column
     """
-    if column_name not in df.columns:
+    if column_name not in df.collect_schema().names():
         raise ValueError(f"Column '{column_name}' not found in dataframe")
 
-    def apply_chat_template(messages: List[dict]) -> str:
-        """Apply chat template to messages."""
-        return tokenizer.apply_chat_template(messages, tokenize=False)
+    if isinstance(df, pl.LazyFrame):
+        return df.with_columns(
+            pl.col(column_name)
+            .map_batches(
+                lambda messages: pl.Series(
+                    _token_lengths(
+                        tokenizer, messages.to_list(), batch_size, num_workers
+                    ),
+                    dtype=pl.Int32,
+                ),
+                return_dtype=pl.Int32,
+                is_elementwise=True,
+            )
+            .alias("token_length")
+        )
 
-    def count_tokens(text: str) -> int:
-        """Count tokens in text."""
-        return len(tokenizer.encode(text))
+    start = time.perf_counter()
+    token_lengths = _token_lengths(
+        tokenizer, df[column_name].to_list(), batch_size, num_workers
+    )
+    elapsed = time.perf_counter() - start
+    total_tokens = sum(token_lengths)
+    print(
+        f"  Counted {total_tokens:,} tokens in {len(token_lengths):,} samples "
+        f"({total_tokens / max(elapsed, 1e-9):,.0f} tokens/sec)"
+    )
 
-    return df.with_columns(
-        pl.col(column_name)
-        .map_elements(apply_chat_template, return_dtype=pl.String)
-        .map_elements(count_tokens, return_dtype=pl.Int32)
-        .alias("token_length")
+    return df.with_columns(pl.Series("token_length", token_lengths, dtype=pl.Int32))
+
+
+def pack_token_lengths(
+    token_lengths: List[int], max_seq_len: int
+) -> Tuple[List[int], Dict[str, Any]]:
+    """
+    Assign samples to packs of at most ``max_seq_len`` tokens.
+
+    Uses best-fit decreasing: samples are placed longest first into the open
+    pack with the least room that still fits them. Samples of ``max_seq_len``
+    tokens or more get a pack of their own.
+
+    Args:
+        token_lengths: Token length of every sample
+        max_seq_len: Maximum number of tokens per pack
+
+    Returns:
+        Tuple of the pack id of every sample and packing statistics
+        (number of packs, token efficiency and samples over max_seq_len)
+    """
+    if max_seq_len <= 0:
+        raise ValueError(f"max_seq_len must be positive, got {max_seq_len}")
+
+    # Open packs grouped by the room they have left, with a Fenwick tree over
+    # the group sizes to find the tightest fitting pack in O(log max_seq_len)
+    packs_by_room: List[List[int]] = [[] for _ in range(max_seq_len + 1)]
+    tree = [0] * (max_seq_len + 2)
+    top_step = 1 << (len(tree) - 1).bit_length()
+
+    def update(room: int, delta: int):
+        index = room + 1
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def count_below(room: int) -> int:
+        """Number of open packs with less than ``room`` tokens left."""
+        total = 0
+        while room > 0:
+            total += tree[room]
+            room -= room & -room
+        return total
+
+    def find_room(k: int) -> int:
+        """Room left in the k-th open pack when ordered by room (1-based)."""
+        position, step = 0, top_step
+        while step:
+            if position + step < len(tree) and tree[position + step] < k:
+                position += step
+                k -= tree[position]
+            step >>= 1
+        return position
+
+    pack_ids = [0] * len(token_lengths)
+    n_packs = open_packs = oversized = 0
+    for i in sorted(range(len(token_lengths)), key=lambda i: -token_lengths[i]):
+        length = token_lengths[i]
+        if length >= max_seq_len:
+            oversized += length > max_seq_len
+            pack_ids[i] = n_packs
+            n_packs += 1
+            continue
+
+        below = count_below(length)
+        if below < open_packs:
+            room = find_room(below + 1)
+            pack = packs_by_room[room].pop()
+            update(room, -1)
+            open_packs -= 1
+        else:
+            room, pack = max_seq_len, n_packs
+            n_packs += 1
+
+        pack_ids[i] = pack
+        room -= length
+        if room > 0:
+            packs_by_room[room].append(pack)
+            update(room, 1)
+            open_packs += 1
+
+    packed_tokens = sum(min(length, max_seq_len) for length in token_lengths)
+    stats = {
+        "packs": n_packs,
+        "efficiency": packed_tokens / (n_packs * max_seq_len) if n_packs else 0.0,
+        "oversized": oversized,
+    }
+    return pack_ids, stats
+
+
+def pack_by_token_length(
+    df: FrameT, max_seq_len: int, column_name: str = "token_length"
+) -> Tuple[FrameT, Dict[str, Any]]:
+    """
+    Add a pack_id column and order the rows pack by pack.
+
+    Only the token lengths are collected to plan the packs, so a LazyFrame
+    stays lazy until it is sunk. Sorting would hold the whole dataset in
+    memory, so a LazyFrame keeps the order of its samples and the packs are
+    formed by grouping on pack_id when reading it back.
+
+    Args:
+        df: Input dataframe or LazyFrame with token lengths
+        max_seq_len: Maximum number of tokens per pack
+        column_name: Column containing the token length of each sample
+
+    Returns:
+        Tuple of the packed dataframe and the statistics of pack_token_lengths
+    """
+    token_lengths = (
+        df.lazy().select(column_name).collect(engine="streaming").to_series().to_list()
     )
+    pack_ids, stats = pack_token_lengths(token_lengths, max_seq_len)
+    packs = pl.DataFrame(
+        {"pack_id": pack_ids}, schema={"pack_id": pl.UInt32}
+    ).with_row_index("_row")
+    if isinstance(df, pl.LazyFrame):
+        packs = packs.lazy()
+
+    packed = df.with_row_index("_row").join(packs, on="_row", maintain_order="left")
+    if isinstance(packed, pl.DataFrame):
+        # Keep the original order of the samples within each pack
+        packed = packed.sort("pack_id", "_row")
+    return packed.drop("_row"), stats
@@ -0,0 +1,291 @@
+"""
+Benchmarks for the document processing helpers on synthetic data.
+
+``chunk`` times the current token-based chunker against the word-based
+reference it replaced, including the second pass that encoded every chunk
+again (with a fresh ``tiktoken.get_encoding`` call per chunk) to report its
+size. Afterwards the chunks of both are re-encoded to check them against
+``--max-tokens``.
+
+``seed`` times building the seed data from chunks with ``write_seed_data``
+against the reference that wrote ``chunks.jsonl``, read it back with
+``datasets`` and attached the ICL fields with a per-row ``map``, and checks
+that both produce the same rows.
+
+Usage (from the Kubeflow_Pipeline directory):
+
+    python benchmark_document_utils.py chunk --size-mb 10
+    python benchmark_document_utils.py chunk --max-tokens 1024 --overlap 100
+    python benchmark_document_utils.py seed --rows 1000000
+    python benchmark_document_utils.py seed --rows 1000000 --format parquet
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import tiktoken
+
+sys.path.insert(0, str(Path(__file__).parent / "components"))
+
+from document_utils import chunk_markdown, write_seed_data  # noqa: E402
+
+_WORDS = [
+    "client",
+    "identification",
+    "reporting",
+    "entity",
+    "transaction",
+    "threshold",
+    "verification",
+    "beneficial",
+    "ownership",
+    "compliance",
+    "résumé",
+    "naïve",
+    "日本語",
+    "émoji 🚀",
+    "$10,000",
+    "(a)",
+]
+
+
+def make_markdown_corpus(size_bytes: int, seed: int = 0) -> str:
+    """Build a Markdown document with headings, paragraphs, lists, tables and code."""
+    rng = random.Random(seed)
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(n_words))
+
+    parts = []
+    size = 0
+    section = 0
+    while size < size_bytes:
+        section += 1
+        kind = rng.random()
+        if kind < 0.1:
+            part = f"## {section}. {text(6)}"
+        elif kind < 0.6:
+            part = text(rng.randint(20, 400))
+        elif kind < 0.8:
+            part = "\n".join(f"- {text(rng.randint(3, 25))}" for _ in range(6))
+        elif kind < 0.9:
+            rows = [
+                f"| {text(2)} | {text(3)} | {rng.randint(0, 9999)} |" for _ in range(8)
+            ]
+            part = "| Term | Meaning | Value |\n|---|---|---|\n" + "\n".join(rows)
+        else:
+            part = "```\n" + "\n".join(text(8) for _ in range(10)) + "\n```"
+        parts.append(part)
+        size += len(part.encode("utf-8")) + 2
+    return "\n\n".join(parts)
+
+
+def reference_chunk_markdown(
+    text: str, max_tokens: int = 200, overlap: int = 50
+) -> List[str]:
+    """Word-based implementation used before chunking counted tokens."""
+    from markdown_it import MarkdownIt
+
+    blocks = []
+    buf = []
+    for tok in MarkdownIt().parse(text):
+        if tok.block and tok.type.endswith("_open"):
+            buf = []
+        elif tok.block and tok.type.endswith("_close"):
+            if buf:
+                blocks.append("\n".join(buf).strip())
+                buf = []
+        elif tok.content:
+            buf.append(tok.content)
+    if buf:
+        blocks.append("\n".join(buf).strip())
+
+    chunks = []
+    current_words = []
+    for block in blocks:
+        for w in block.split():
+            current_words.append(w)
+            if len(current_words) >= max_tokens:
+                chunks.append(" ".join(current_words))
+                current_words = current_words[-overlap:] if overlap > 0 else []
+    if current_words:
+        chunks.append(" ".join(current_words))
+    return chunks
+
+
+def reference_chunk_and_count(text: str, max_tokens: int, overlap: int, name: str):
+    """Reference chunking followed by the per-chunk size pass of the component."""
+    chunks = reference_chunk_markdown(text, max_tokens=max_tokens, overlap=overlap)
+    sizes = []
+    for chunk in chunks:
+        enc = tiktoken.get_encoding(name)
+        sizes.append(len(enc.encode(chunk)))
+    return list(zip(chunks, sizes, strict=True))
+
+
+def current_chunk_and_count(text: str, max_tokens: int, overlap: int, name: str):
+    """Current chunking; sizes are counted while chunking."""
+    encoding = tiktoken.get_encoding(name)
+    return chunk_markdown(
+        text, max_tokens=max_tokens, overlap=overlap, encoding=encoding
+    )
+
+
+def _timed(fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_chunk(args):
+    corpus = make_markdown_corpus(int(args.size_mb * 1024**2), seed=args.seed)
+    size_mb = len(corpus.encode("utf-8")) / 1024**2
+    encoding = tiktoken.get_encoding(args.encoding)  # Warm up the BPE file cache
+
+    for name, fn in [
+        ("reference (words + re-encode)", reference_chunk_and_count),
+        ("current (tokens, batched)", current_chunk_and_count),
+    ]:
+        chunks, seconds = _timed(
+            fn, corpus, args.max_tokens, args.overlap, args.encoding
+        )
+        real_sizes = [
+            len(tokens)
+            for tokens in encoding.encode_ordinary_batch([c for c, _ in chunks])
+        ]
+        over_limit = sum(size > args.max_tokens for size in real_sizes)
+        print(
+            f"{name:<32} corpus={size_mb:6.1f}MB  time={seconds:7.2f}s  "
+            f"throughput={size_mb / seconds:6.2f}MB/s  chunks={len(chunks):>7,}  "
+            f"max_tokens={max(real_sizes):>6,}  over_limit={over_limit:>6,}"
+        )
+
+
+_ICL = {
+    "document_outline": "Customer due diligence requirements for financial institutions",
+    "icl_document": " ".join(_WORDS * 12),
+    "icl_query_1": "Which records must be kept when a client is identified?",
+    "icl_query_2": "When does a transaction exceed the reporting threshold?",
+    "icl_query_3": "Who counts as a beneficial owner of an entity?",
+    "domain": "finance",
+}
+
+
+def make_chunks(rows: int, words: int, seed: int = 0) -> List[tuple]:
+    """Build ``(chunk, num_tokens)`` tuples as returned by chunk_markdown."""
+    rng = random.Random(seed)
+    return [(" ".join(rng.choices(_WORDS, k=words)), words * 2) for _ in range(rows)]
+
+
+def reference_seed_data(chunks, icl, output_dir: Path, artifact_format: str):
+    """Round trip through chunks.jsonl and a per-row ``map``, as before."""
+    from datasets import load_dataset
+
+    chunks_file = output_dir / "chunks.jsonl"
+    with open(chunks_file, "w", encoding="utf-8") as f:
+        for chunk, num_tokens in chunks:
+            f.write(json.dumps({"chunk": chunk, "num_tokens": num_tokens}) + "\n")
+    seed_data = (
+        load_dataset(
+            "json", data_files=[str(chunks_file)], cache_dir=str(output_dir / "hf")
+        )
+        .rename_columns({"chunk": "document"})
+        .select_columns("document")
+    )["train"].map(lambda x: icl)
+    output_file = output_dir / f"reference.{artifact_format}"
+    if artifact_format == "parquet":
+        # Newer datasets releases reject a compression argument; keep the default
+        seed_data.to_parquet(str(output_file))
+    else:
+        seed_data.to_json(str(output_file), orient="records", lines=True)
+    return output_file
+
+
+def current_seed_data(chunks, icl, output_dir: Path, artifact_format: str):
+    """Stream Arrow batches into write_seed_data, as document_processing does."""
+    import pyarrow as pa
+
+    batch_size = 65536
+    documents = (
+        pa.record_batch({
+            "document": [chunk for chunk, _ in chunks[start : start + batch_size]]
+        })
+        for start in range(0, len(chunks), batch_size)
+    )
+    output_file = output_dir / f"current.{artifact_format}"
+    write_seed_data(documents, icl, str(output_file), artifact_format)
+    return output_file
+
+
+def _read_rows(path: Path, artifact_format: str):
+    if artifact_format == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=4096):
+            yield from batch.to_pylist()
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def bench_seed(args):
+    chunks = make_chunks(args.rows, args.chunk_words, seed=args.seed)
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in [
+            ("reference (jsonl round trip + map)", reference_seed_data),
+            ("current (streamed, broadcast)", current_seed_data),
+        ]:
+            output_file, seconds = _timed(fn, chunks, _ICL, Path(tmp), args.format)
+            outputs[name] = output_file
+            size_mb = output_file.stat().st_size / 1024**2
+            print(
+                f"{name:<36} rows={args.rows:>9,}  time={seconds:7.2f}s  "
+                f"rows/s={args.rows / seconds:>10,.0f}  "
+                f"{args.format}={size_mb:8.1f}MB"
+            )
+        del chunks  # Make room for reading both outputs back
+        reference, current = outputs.values()
+        mismatches = sum(
+            a != b
+            for a, b in zip(
+                _read_rows(reference, args.format),
+                _read_rows(current, args.format),
+                strict=True,
+            )
+        )
+        print(f"mismatched rows: {mismatches:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    chunk = subparsers.add_parser("chunk", help="chunk_markdown and chunk sizes")
+    chunk.add_argument("--size-mb", type=float, default=10.0)
+    chunk.add_argument("--max-tokens", type=int, default=512)
+    chunk.add_argument("--overlap", type=int, default=50)
+    chunk.add_argument("--encoding", default="cl100k_base")
+    chunk.add_argument("--seed", type=int, default=0)
+    chunk.set_defaults(func=bench_chunk)
+
+    seed = subparsers.add_parser("seed", help="write_seed_data from chunks")
+    seed.add_argument("--rows", type=int, default=1_000_000)
+    seed.add_argument("--chunk-words", type=int, default=100)
+    seed.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    seed.add_argument("--seed", type=int, default=0)
+    seed.set_defaults(func=bench_seed)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
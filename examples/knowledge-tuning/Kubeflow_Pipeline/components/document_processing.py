@@ -1,5 +1,13 @@
 from kfp import dsl
 
+from components.document_utils import (
+    cache_conversions,
+    chunk_markdown,
+    source_fingerprint,
+    stream_conversions,
+    write_seed_data,
+)
+
 DOCLING_BASE_IMAGE = "quay.io/fabianofranz/docling-ubi9:2.54.0"
 
 
@@ -7,12 +15,19 @@ DOCLING_BASE_IMAGE = "quay.io/fabianofranz/docling-ubi9:2.54.0"
     base_image=DOCLING_BASE_IMAGE,
     packages_to_install=[
         "torch",
-        "datasets>=4.2.0",
+        "pyarrow>=15.0.0",
         "docling>=2.53.0",
         "markdown-it-py>=4.0.0",
         "tiktoken>=0.11.0",
         "python-dotenv>=1.1.1",
     ],
+    additional_funcs=[
+        stream_conversions,
+        source_fingerprint,
+        cache_conversions,
+        chunk_markdown,
+        write_seed_data,
+    ],
 )
 def document_processing(
     artifacts_path: dsl.Input[dsl.Artifact],
@@ -26,13 +41,18 @@ def document_processing(
     icl_query1: str = None,
     icl_query2: str = None,
     icl_query3: str = None,
+    artifact_format: str = "jsonl",
+    conversion_workers: int = 2,
+    conversion_queue_size: int = 8,
+    cache_dir: str = "",
 ):
-    import glob
+    import os
+    import threading
+    import time
     from pathlib import Path
-    from typing import List
 
+    import pyarrow as pa
     import tiktoken
-    from datasets import load_dataset
     from docling.datamodel.base_models import InputFormat
     from docling.datamodel.pipeline_options import PdfPipelineOptions
     from docling.document_converter import (
@@ -63,6 +83,11 @@ def document_processing(
     if not WEB_URLS:
         raise ValueError("web_urls must contain at least one non-empty URL")
 
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
+
     # Let Docling use the default cache location where models were downloaded
     pdf_pipeline_options = PdfPipelineOptions()
     pdf_pipeline_options.artifacts_path = Path(artifacts_path.path)
@@ -70,84 +95,40 @@ def document_processing(
 
     html_options = HTMLFormatOption()
 
-    converter = DocumentConverter(
-        format_options={InputFormat.PDF: pdf_options, InputFormat.HTML: html_options}
-    )
-
-    for name, url in WEB_URLS:
-        result = converter.convert(url)
-        result.document.save_as_markdown(f"{DOCLING_OUTPUT_DIR}/{name}.md")
-
-    print(
-        f"Number of md files in {DOCLING_OUTPUT_DIR}: ",
-        len(glob.glob(f"{DOCLING_OUTPUT_DIR}/*.md")),
-    )
-
-    def chunk_markdown(
-        text: str, max_tokens: int = 200, overlap: int = 50
-    ) -> List[str]:
-        """
-        Splits Markdown text into chunks at block-level elements
-        (headings, paragraphs, lists, tables, code, blockquotes).
-        Adds overlap (in words) between all consecutive chunks.
-
-        Args:
-            text: The markdown text to be chunked
-            max_tokens: Maximum number of words per chunk
-            overlap: Number of overlapping words between consecutive chunks
-
-        Returns:
-            List of text chunks with specified overlap
-        """
-        from markdown_it import MarkdownIt
-
-        # Initialize the Markdown parser to understand the document structure
-        md = MarkdownIt()
-        tokens = md.parse(text)
-
-        # To ensure that you do not split the text in the middle of headings or lists,
-        # group tokens into block-level segments to preserve the Markdown structure
-        blocks = []
-        buf = []
-        for tok in tokens:
-            if tok.block and tok.type.endswith("_open"):
-                buf = []
-            elif tok.block and tok.type.endswith("_close"):
-                if buf:
-                    blocks.append("\n".join(buf).strip())
-                    buf = []
-            elif tok.content:
-                buf.append(tok.content)
-        if buf:
-            blocks.append("\n".join(buf).strip())
-
-        # Split blocks into chunks with overlap to maintain context continuity
-        chunks = []
-        current_words = []
-        for block in blocks:
-            words = block.split()
-            for w in words:
-                current_words.append(w)
-                if len(current_words) >= max_tokens:
-                    # Emit a complete chunk
-                    chunks.append(" ".join(current_words))
-                    # Prepare next buffer with overlap from the end of this chunk
-                    # to ensure context continuity between chunks
-                    current_words = current_words[-overlap:] if overlap > 0 else []
-
-        # Add any remaining words as the final chunk
-        if current_words:
-            chunks.append(" ".join(current_words))
-
-        return chunks
+    # Each worker thread gets its own converter (and its own Docling models),
+    # so conversions never share pipeline state
+    worker_state = threading.local()
+
+    def convert_to_markdown(name, url):
+        if not hasattr(worker_state, "converter"):
+            worker_state.converter = DocumentConverter(
+                format_options={
+                    InputFormat.PDF: pdf_options,
+                    InputFormat.HTML: html_options,
+                }
+            )
+        result = worker_state.converter.convert(url)
+        return result.document.export_to_markdown()
+
+    cache_stats = None
+    if cache_dir:
+        # Reuse the Markdown of sources whose content has not changed since an
+        # earlier run; a new Docling version invalidates the cache
+        from importlib.metadata import version
+
+        convert_to_markdown, cache_stats = cache_conversions(
+            convert_to_markdown,
+            os.path.join(cache_dir, "docling_markdown"),
+            config=f"docling=={version('docling')}",
+        )
 
     def save_chunks_to_jsonl(chunks, filename):
         """
-        Save a list of strings to a JSONL file where each line is a JSON object
-        with the key 'chunk'. Returns the path to the saved file.
+        Save chunks to a JSONL file where each line is a JSON object with the
+        keys 'chunk' and 'num_tokens'. Returns the path to the saved file.
 
         Args:
-            chunks (list of str): List of text chunks to save.
+            chunks (list of tuple): List of (text, num_tokens) chunks to save.
             filename (str): Path to the output .jsonl file (string or Path).
 
         Returns:
@@ -157,49 +138,75 @@ def document_processing(
 
         path = Path(filename)
         with path.open("w", encoding="utf-8") as f:
-            for chunk in chunks:
-                json_line = json.dumps({"chunk": chunk}, ensure_ascii=False)
+            for chunk, num_tokens in chunks:
+                json_line = json.dumps(
+                    {"chunk": chunk, "num_tokens": num_tokens}, ensure_ascii=False
+                )
                 f.write(json_line + "\n")
         print(f"Saved {len(chunks)} chunks to {path}")
         return path
 
-    markdown_files = sorted(DOCLING_OUTPUT_DIR.glob("*.md"))
-    if not markdown_files:
-        raise FileNotFoundError(
-            f"No markdown files were generated in {DOCLING_OUTPUT_DIR}"
+    # Fetch and convert the sources in parallel and chunk each document as
+    # soon as it is converted; the bounded queue caps how many converted
+    # documents wait in memory. The markdown is kept as a side output.
+    print(
+        f"Converting {len(WEB_URLS)} sources with {conversion_workers} workers "
+        f"(queue size {conversion_queue_size})"
+    )
+    # Load the tokenizer once; chunk sizes are counted in its tokens
+    encoding = tiktoken.get_encoding("cl100k_base")
+    start = time.perf_counter()
+    chunks_by_source = [None] * len(WEB_URLS)
+    for index, name, markdown in stream_conversions(
+        WEB_URLS,
+        convert_to_markdown,
+        max_workers=conversion_workers,
+        queue_size=conversion_queue_size,
+    ):
+        (DOCLING_OUTPUT_DIR / f"{name}.md").write_text(markdown, encoding="utf-8")
+        chunks_by_source[index] = chunk_markdown(
+            markdown,
+            max_tokens=chunk_max_tokens,
+            overlap=chunk_overlap_tokens,
+            encoding=encoding,
         )
-
-    print(f"Number of Markdown files : {len(markdown_files)}")
-    print(f"List of Markdown files : {markdown_files}")
-    chunks = []
-    print("Chunking of markdown files")
-    print("-----------------------------------", end="\n\n\n")
-    for markdown_file in markdown_files:
-        print(f"Chunking file : {markdown_file} \n\n")
-        text = markdown_file.read_text(encoding="utf-8")
-        chunks.extend(
-            chunk_markdown(
-                text,
-                max_tokens=chunk_max_tokens,
-                overlap=chunk_overlap_tokens,
-            )
+        print(
+            f"Converted and chunked {name} ({WEB_URLS[index][1]}): "
+            f"{len(chunks_by_source[index])} chunks"
+        )
+    print(f"Converted {len(WEB_URLS)} sources in {time.perf_counter() - start:.1f}s")
+    if cache_stats is not None:
+        print(
+            f"Conversion cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses"
         )
 
+    # Keep the chunks in source order, whatever order the conversions finished in
+    chunks = [chunk for source_chunks in chunks_by_source for chunk in source_chunks]
+    if not chunks:
+        raise ValueError(f"No chunks were produced from {len(WEB_URLS)} sources")
+
     _ = save_chunks_to_jsonl(chunks, f"{OUTPUT_DIR}/chunks.jsonl")
 
-    i = 1
-    min_tokens = 6000
-    max_tokens = 8000
-    for chunk in chunks:
-        enc = tiktoken.get_encoding("cl100k_base")
-        token_count = len(enc.encode(chunk))
-        if (token_count < min_tokens or token_count > max_tokens) and (
-            i != len(chunks)
-        ):
-            print(
-                f"\033[31mWARNING: Chunk {i} ({chunk[:30]} ... {chunk[-30:]}) {token_count} tokens\033[0m"
-            )
-        i += 1
+    # Chunk sizes come from chunking itself, so nothing is encoded twice
+    chunk_sizes = [num_tokens for _, num_tokens in chunks]
+    print(
+        f"Chunk sizes: min {min(chunk_sizes)}, "
+        f"mean {sum(chunk_sizes) / len(chunk_sizes):.0f}, "
+        f"max {max(chunk_sizes)} tokens (limit {chunk_max_tokens})"
+    )
+    i = 0
+    for source_chunks in chunks_by_source:
+        for position, (chunk, token_count) in enumerate(source_chunks):
+            i += 1
+            # The last chunk of a source is usually short
+            if (
+                token_count < chunk_max_tokens // 4
+                and position < len(source_chunks) - 1
+            ):
+                print(
+                    f"\033[31mWARNING: Chunk {i} ({chunk[:30]} ... {chunk[-30:]}) {token_count} tokens\033[0m"
+                )
 
     icl = {
         "document_outline": document_outline,
@@ -210,19 +217,15 @@ def document_processing(
         "domain": domain,
     }
 
-    chunks_files = [f"{OUTPUT_DIR}/chunks.jsonl"]
-
-    # Load the dataset from the JSON file
-    chunks = (
-        load_dataset("json", data_files=chunks_files)
-        .rename_columns({"chunk": "document"})
-        .select_columns("document")
+    # Stream the chunks straight into the seed data; the ICL fields are the same
+    # for every chunk, so they are broadcast per batch instead of mapped per row
+    batch_size = 65536
+    documents = (
+        pa.record_batch({
+            "document": [chunk for chunk, _ in chunks[start : start + batch_size]]
+        })
+        for start in range(0, len(chunks), batch_size)
     )
-    # chunks is a DatasetDict. By default, the dataset for the chunks is put in the "train" split in the DatasetDict
-    chunks = chunks["train"]
-
-    # Map the ICL fields to each document chunk (if you want to use the same ICL for all, as shown here)
-    seed_data = chunks.map(lambda x: icl)
-
-    # Save the seed data to a JSONL file
-    seed_data.to_json(f"{OUTPUT_DIR}/seed_data.jsonl", orient="records", lines=True)
+    seed_data_file = f"{OUTPUT_DIR}/seed_data.{artifact_format}"
+    num_rows = write_seed_data(documents, icl, seed_data_file, artifact_format)
+    print(f"Saved {num_rows} seed examples to {seed_data_file}")
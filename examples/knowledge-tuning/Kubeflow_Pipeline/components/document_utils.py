@@ -0,0 +1,380 @@
+"""Helpers shared by the document processing component.
+
+KFP lightweight components cannot import local modules at runtime, so each
+helper here is a self-contained function (imports inside the body) that the
+components embed with ``@dsl.component(additional_funcs=[...])``.
+"""
+
+
+def stream_conversions(sources, convert, max_workers: int = 4, queue_size: int = 8):
+    """Convert sources on a worker pool and yield the results as they finish.
+
+    Each worker calls ``convert(name, source)`` and puts the result on a
+    bounded queue, so at most ``queue_size`` converted documents wait in
+    memory while the consumer (e.g. chunking) catches up; workers block until
+    there is room. Results are yielded in completion order, tagged with the
+    index of their source so the caller can restore the input order.
+
+    Args:
+        sources: List of ``(name, source)`` tuples, e.g. ``("url-1", url)``
+        convert: Function that converts one source, called from worker threads
+        max_workers: Number of sources converted at the same time
+        queue_size: Maximum number of converted results waiting to be consumed
+
+    Yields:
+        ``(index, name, result)`` tuples in completion order
+
+    Raises:
+        The first exception raised by ``convert``, after the pool stops
+    """
+    import queue
+    import threading
+
+    results = queue.Queue(maxsize=max(1, queue_size))
+    pending = queue.Queue()
+    for index, (name, source) in enumerate(sources):
+        pending.put((index, name, source))
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                index, name, source = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                item = (index, name, convert(name, source), None)
+            except Exception as e:  # Re-raised by the consumer
+                item = (index, name, None, e)
+            # Block while the queue is full, but give up once the consumer stops
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    workers = [
+        threading.Thread(target=worker, daemon=True)
+        for _ in range(max(1, min(max_workers, len(sources))))
+    ]
+    for thread in workers:
+        thread.start()
+
+    try:
+        for _ in range(len(sources)):
+            index, name, result, error = results.get()
+            if error is not None:
+                raise error
+            yield index, name, result
+    finally:
+        # Also runs when the consumer fails or stops iterating early
+        stop.set()
+        for thread in workers:
+            thread.join()
+
+
+def source_fingerprint(source: str, timeout: float = 30.0) -> str:
+    """Return a string that changes whenever the content of a source changes.
+
+    For URLs, a ``HEAD`` request reads the ``ETag`` or, failing that, the
+    ``Last-Modified`` and ``Content-Length`` headers. URLs without either
+    header, and local files, are hashed by their content.
+
+    Args:
+        source: HTTP(S) URL or local file path
+        timeout: Timeout in seconds for each HTTP request
+
+    Returns:
+        Fingerprint such as ``etag:"abc"`` or ``sha256:<hex digest>``
+    """
+    import hashlib
+    import urllib.error
+    import urllib.request
+
+    digest = hashlib.sha256()
+    if source.startswith(("http://", "https://")):
+        try:
+            request = urllib.request.Request(source, method="HEAD")
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                headers = response.headers
+        except (urllib.error.URLError, OSError):
+            headers = {}  # Some servers reject HEAD; hash the content instead
+        if headers.get("ETag"):
+            return f"etag:{headers['ETag']}"
+        if headers.get("Last-Modified"):
+            return (
+                f"last-modified:{headers['Last-Modified']}:"
+                f"{headers.get('Content-Length', '')}"
+            )
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            for block in iter(lambda: response.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def cache_conversions(convert, cache_dir: str, config: str = ""):
+    """Wrap a converter so unchanged sources are served from a disk cache.
+
+    Each source is keyed by its :func:`source_fingerprint` and ``config``
+    (e.g. the Docling version), and its converted Markdown is stored under
+    that key in ``cache_dir``. A changed source gets a new key and is
+    converted again. The wrapper is thread-safe, so it can be passed to
+    :func:`stream_conversions`.
+
+    Args:
+        convert: Function ``convert(name, source)`` that returns Markdown
+        cache_dir: Cache directory that outlives the run, e.g. on a PVC
+        config: Conversion settings that change the Markdown output
+
+    Returns:
+        Tuple of the wrapped converter and a dictionary of cache statistics
+        (``hits``, ``misses``), updated in place
+    """
+    import hashlib
+    import json
+    import os
+    import threading
+    from pathlib import Path
+
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stats = {"hits": 0, "misses": 0}
+    stats_lock = threading.Lock()
+
+    def cached_convert(name, source):
+        fingerprint = source_fingerprint(source)
+        key = hashlib.sha256(
+            json.dumps([source, fingerprint, config]).encode("utf-8")
+        ).hexdigest()
+        entry_file = cache_dir / key[:2] / f"{key}.md"
+        try:
+            markdown = entry_file.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            markdown = None
+
+        if markdown is not None:
+            with stats_lock:
+                stats["hits"] += 1
+            print(f"Cache hit: {name} ({source}, {fingerprint})")
+            return markdown
+
+        markdown = convert(name, source)
+        entry_file.parent.mkdir(exist_ok=True)
+        tmp_file = entry_file.with_name(
+            f".{entry_file.name}.{os.getpid()}.{threading.get_ident()}"
+        )
+        tmp_file.write_text(markdown, encoding="utf-8")
+        os.replace(tmp_file, entry_file)
+        with stats_lock:
+            stats["misses"] += 1
+        print(f"Cache miss: {name} ({source}, {fingerprint})")
+        return markdown
+
+    return cached_convert, stats
+
+
+def chunk_markdown(
+    text: str,
+    max_tokens: int = 512,
+    overlap: int = 50,
+    encoding=None,
+):
+    """Split Markdown text into chunks of at most ``max_tokens`` real tokens.
+
+    The text is split into block-level elements (headings, paragraphs, lists,
+    tables, code, blockquotes), all blocks are tokenized in one batched call,
+    and whole blocks are packed into each chunk while they fit. A block that
+    does not fit starts the next chunk, and a block longer than ``max_tokens``
+    is split at token boundaries that do not cut a character in two.
+    Consecutive chunks share their last and first ``overlap`` tokens. Every
+    token is handled a constant number of times, so chunking is linear in the
+    size of the text.
+
+    Args:
+        text: The markdown text to be chunked
+        max_tokens: Maximum number of tokens per chunk
+        overlap: Number of overlapping tokens between consecutive chunks
+        encoding: tiktoken encoding to count tokens with; get it once and
+            reuse it for every document (default: ``cl100k_base``)
+
+    Returns:
+        List of ``(chunk, num_tokens)`` tuples
+    """
+    from markdown_it import MarkdownIt
+
+    if max_tokens <= 0 or not 0 <= overlap < max_tokens:
+        raise ValueError(
+            f"Need 0 <= overlap < max_tokens, got overlap={overlap} "
+            f"and max_tokens={max_tokens}"
+        )
+    if encoding is None:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+
+    # To ensure that you do not split the text in the middle of headings or lists,
+    # group tokens into block-level segments to preserve the Markdown structure
+    blocks = []
+    buf = []
+    for tok in MarkdownIt().parse(text):
+        if tok.block and tok.type.endswith("_open"):
+            buf = []
+        elif tok.block and tok.type.endswith("_close"):
+            if buf:
+                blocks.append("\n".join(buf).strip())
+                buf = []
+        elif tok.content:
+            buf.append(tok.content)
+    if buf:
+        blocks.append("\n".join(buf).strip())
+
+    separator = encoding.encode_ordinary("\n\n")
+    chunks = []
+    current = []
+    new_tokens = 0  # Tokens in `current` that are not overlap
+
+    def splits_character(token):
+        """Whether a token starts inside a multi-byte UTF-8 character."""
+        return 0x80 <= encoding.decode_single_token_bytes(token)[0] < 0xC0
+
+    def emit():
+        nonlocal current, new_tokens
+        chunks.append((encoding.decode(current), len(current)))
+        # Carry the end of this chunk over to keep context between chunks
+        keep_from = max(0, len(current) - overlap) if overlap else len(current)
+        while keep_from < len(current) and splits_character(current[keep_from]):
+            keep_from += 1
+        current = current[keep_from:]
+        new_tokens = 0
+
+    for block_tokens in encoding.encode_ordinary_batch([b for b in blocks if b]):
+        if (
+            new_tokens
+            and len(current) + len(separator) + len(block_tokens) > max_tokens
+        ):
+            # Start the next chunk at the block boundary instead of splitting it
+            emit()
+        pieces = separator + block_tokens if current else block_tokens
+        start = 0
+        while len(current) + len(pieces) - start > max_tokens:
+            end = start + max_tokens - len(current)
+            # Never cut a character in two, so each chunk decodes cleanly
+            while end > start + 1 and splits_character(pieces[end]):
+                end -= 1
+            current.extend(pieces[start:end])
+            new_tokens += end - start
+            start = end
+            emit()
+        current.extend(pieces[start:])
+        new_tokens += len(pieces) - start
+
+    if new_tokens:
+        chunks.append((encoding.decode(current), len(current)))
+    return chunks
+
+
+def write_seed_data(
+    batches,
+    constant_columns: dict,
+    output_file: str,
+    artifact_format: str = "jsonl",
+):
+    """Stream document batches into a seed data file with constant columns.
+
+    Every seed row repeats the same ICL example and domain, so instead of
+    attaching them row by row they are broadcast once per batch: for Parquet
+    with ``pyarrow.repeat`` as Arrow columns, and for JSONL as a JSON suffix
+    that is serialized once and appended to every line. Batches are written
+    as they arrive, so the documents never pass through an intermediate file.
+
+    Args:
+        batches: Iterable of ``pyarrow.Table`` or ``RecordBatch`` with the
+            per-row columns, e.g. ``document``
+        constant_columns: Column names and the value every row gets
+        output_file: Seed data file to write
+        artifact_format: ``jsonl`` or ``parquet`` (zstd-compressed)
+
+    Returns:
+        Number of rows written
+    """
+    import json
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
+
+    constant_scalars = {
+        name: pa.scalar(value) for name, value in constant_columns.items()
+    }
+    # ", "-joined '"name": value' pairs shared by every JSONL line
+    constant_json = json.dumps(constant_columns, ensure_ascii=False)[1:-1]
+    constant_suffix = f", {constant_json}" if constant_json else ""
+
+    num_rows = 0
+    writer = None
+    jsonl_file = None
+    if artifact_format == "jsonl":
+        jsonl_file = open(output_file, "w", encoding="utf-8")  # noqa: SIM115
+    try:
+        for batch in batches:
+            overlapping = set(batch.schema.names) & set(constant_columns)
+            if overlapping:
+                raise ValueError(
+                    f"Columns are both per-row and constant: {overlapping}"
+                )
+            if jsonl_file is None:
+                columns = list(batch.columns) + [
+                    pa.repeat(scalar, batch.num_rows)
+                    for scalar in constant_scalars.values()
+                ]
+                names = batch.schema.names + list(constant_scalars)
+                table = pa.Table.from_arrays(columns, names=names)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        output_file, table.schema, compression="zstd"
+                    )
+                writer.write_table(table)
+            else:
+                keys = [
+                    f"{json.dumps(name, ensure_ascii=False)}: "
+                    for name in batch.schema.names
+                ]
+                columns = [
+                    [json.dumps(value, ensure_ascii=False) for value in column]
+                    for column in batch.to_pydict().values()
+                ]
+                jsonl_file.writelines(
+                    "{"
+                    + ", ".join(
+                        key + value for key, value in zip(keys, row, strict=True)
+                    )
+                    + constant_suffix
+                    + "}\n"
+                    for row in zip(*columns, strict=True)
+                )
+            num_rows += batch.num_rows
+    finally:
+        if jsonl_file is not None:
+            jsonl_file.close()
+        if writer is not None:
+            writer.close()
+
+    if artifact_format == "parquet" and writer is None:
+        # No batches: still write a valid (empty) Parquet file
+        pq.write_table(
+            pa.table({
+                name: pa.array([], type=s.type) for name, s in constant_scalars.items()
+            }),
+            output_file,
+            compression="zstd",
+        )
+    return num_rows
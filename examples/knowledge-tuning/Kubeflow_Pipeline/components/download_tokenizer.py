@@ -0,0 +1,38 @@
+from kfp import dsl
+
+BASE_IMAGE = "quay.io/opendatahub/odh-training-th04-cpu-torch29-py312-rhel9:cpu-3.3"
+
+
+@dsl.component(
+    base_image=BASE_IMAGE,
+    packages_to_install=[
+        "transformers>=4.57.1",
+    ],
+)
+def download_tokenizer(
+    output_path: dsl.Output[dsl.Artifact],
+    tokenizer_model_name: str = "RedHatAI/Llama-3.1-8B-Instruct",
+    revision: str = "main",
+):
+    """Download a tokenizer and its chat template into a cacheable artifact."""
+    import time  # pylint: disable=import-outside-toplevel
+    from pathlib import Path  # pylint: disable=import-outside-toplevel
+
+    from transformers import AutoTokenizer  # pylint: disable=import-outside-toplevel
+
+    output_path_p = Path(output_path.path)
+    output_path_p.mkdir(parents=True, exist_ok=True)
+
+    print(f"Downloading tokenizer: {tokenizer_model_name} (revision {revision})")
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(
+        tokenizer_model_name, revision=revision, trust_remote_code=True
+    )
+    # save_pretrained also writes the chat template, so it loads offline later
+    tokenizer.save_pretrained(output_path_p)
+    download_seconds = time.perf_counter() - start
+    print(f"Saved tokenizer to {output_path_p} in {download_seconds:.2f}s")
+
+    output_path.metadata["tokenizer_model_name"] = tokenizer_model_name
+    output_path.metadata["revision"] = revision
+    output_path.metadata["download_seconds"] = round(download_seconds, 2)
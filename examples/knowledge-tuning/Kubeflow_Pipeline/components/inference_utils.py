@@ -0,0 +1,1169 @@
+"""Helpers shared by the SDG generation components.
+
+KFP lightweight components cannot import local modules at runtime, so each
+helper here is a self-contained function (imports inside the body) that the
+components embed with ``@dsl.component(additional_funcs=[...])``.
+"""
+
+
+def install_endpoint_governor(
+    governor_dir: str,
+    endpoint: str,
+    max_in_flight: int,
+    max_tokens_per_second: float = 0,
+    max_retries: int = 5,
+    poll_interval: float = 0.1,
+    max_poll_interval: float = 2.0,
+    llm_module=None,
+):
+    """Share one request and token budget across processes calling an endpoint.
+
+    Wraps the ``acompletion`` used by SDG Hub's LLMChatBlock so every request
+    first takes one of ``max_in_flight`` lock-file slots kept under
+    ``governor_dir`` for the request's ``api_base``. With ``governor_dir`` on
+    the shared workspace PVC, all generation components that talk to the same
+    endpoint stay under one in-flight and tokens/sec budget, so they can run in
+    parallel without overloading it. Each endpoint has its own budget.
+
+    Rate limit (429) and timeout errors halve the shared concurrency limit and
+    back off exponentially before retrying; every ``limit`` successful requests
+    grow it back by one slot.
+
+    The lock and state file work runs in worker threads, off the event loop.
+    Only one coroutine per endpoint polls the shared state while the others
+    wait in process. It backs off from ``poll_interval`` to
+    ``max_poll_interval``, and a slot freed in this process wakes it at once.
+
+    Args:
+        governor_dir: Directory for the slot locks and shared state
+        endpoint: API base URL for requests that do not set ``api_base``
+        max_in_flight: Maximum number of concurrent requests across all processes
+        max_tokens_per_second: Token budget across all processes (0 = unlimited)
+        max_retries: Retries for a request that is rate limited or times out
+        poll_interval: Seconds to wait after a first failed attempt to take a slot
+        max_poll_interval: Longest wait between attempts to take a slot
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Dictionary of request statistics for this process, updated in place
+    """
+    import asyncio
+    import fcntl
+    import hashlib
+    import json
+    import os
+    import random
+    import threading
+    import time
+    from contextlib import contextmanager
+
+    if llm_module is None:
+        from sdg_hub.core.blocks.llm import llm_chat_block as llm_module
+
+    # flock falls back to per-process POSIX locks on NFS, so track our own slots
+    # and serialize this process's threads on the shared state ourselves
+    held_slots = {}
+    state_lock = threading.Lock()
+    pollers = {}
+    stats = {
+        "requests": 0,
+        "retries": 0,
+        "rate_limited": 0,
+        "timeouts": 0,
+        "total_tokens": 0,
+        "wait_seconds": 0.0,
+        "peak_in_flight": 0,
+    }
+
+    def endpoint_state_dir(api_base):
+        """Return the state directory of an endpoint, creating it on first use."""
+        endpoint_key = hashlib.sha256(api_base.encode("utf-8")).hexdigest()[:16]
+        state_dir = os.path.join(governor_dir, endpoint_key)
+        if state_dir not in held_slots:
+            os.makedirs(state_dir, exist_ok=True)
+            held_slots[state_dir] = set()
+        return state_dir
+
+    @contextmanager
+    def locked_state(state_dir):
+        """Read, refill and write back the shared state under an exclusive lock."""
+        state_file = os.path.join(state_dir, "state.json")
+        with state_lock, open(os.path.join(state_dir, "state.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(state_file) as f:
+                        state = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    state = {}
+                now = time.time()
+                state.setdefault("limit", max_in_flight)
+                state.setdefault("tokens", float(max_tokens_per_second))
+                state.setdefault("refilled_at", now)
+                state.setdefault("backoff", 0.0)
+                state.setdefault("backoff_until", 0.0)
+                state.setdefault("successes", 0)
+                # The state outlives the run, so respect a lowered max_in_flight
+                state["limit"] = min(state["limit"], max_in_flight)
+                if max_tokens_per_second > 0:
+                    elapsed = max(0.0, now - state["refilled_at"])
+                    state["tokens"] = min(
+                        float(max_tokens_per_second),
+                        state["tokens"] + elapsed * max_tokens_per_second,
+                    )
+                state["refilled_at"] = now
+
+                yield state
+
+                tmp_file = f"{state_file}.{os.getpid()}"
+                with open(tmp_file, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_file, state_file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def try_acquire_slot(state_dir):
+        """Take a free slot below the shared limit, or return None."""
+        with locked_state(state_dir) as state:
+            if time.time() < state["backoff_until"]:
+                return None
+            if max_tokens_per_second > 0 and state["tokens"] <= 0:
+                return None
+            limit = state["limit"]
+
+        for slot in range(limit):
+            if slot in held_slots[state_dir]:
+                continue
+            fd = os.open(
+                os.path.join(state_dir, f"slot_{slot}.lock"), os.O_CREAT | os.O_RDWR
+            )
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            held_slots[state_dir].add(slot)
+            return slot, fd
+        return None
+
+    def release_slot(state_dir, slot, fd, used_tokens, outcome):
+        """Free the slot, charge its tokens and adapt the shared limit."""
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+        held_slots[state_dir].discard(slot)
+
+        with locked_state(state_dir) as state:
+            now = time.time()
+            state["tokens"] -= used_tokens
+            if outcome == "throttled":
+                # Only the first failure of a burst shrinks the limit
+                if now >= state["backoff_until"]:
+                    state["limit"] = max(1, state["limit"] // 2)
+                    state["backoff"] = min(60.0, max(1.0, state["backoff"] * 2))
+                    state["backoff_until"] = now + state["backoff"] * random.uniform(
+                        0.5, 1.0
+                    )
+                state["successes"] = 0
+            elif outcome == "success":
+                state["backoff"] = 0.0
+                state["successes"] += 1
+                if state["successes"] >= state["limit"]:
+                    state["limit"] = min(max_in_flight, state["limit"] + 1)
+                    state["successes"] = 0
+
+    def is_throttled(error):
+        """Return True for rate limit (429) and timeout (408) errors."""
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return True
+        return getattr(error, "status_code", None) in (408, 429)
+
+    def local_poller(state_dir):
+        """Return the poll lock and slot release event of an endpoint."""
+        loop = asyncio.get_running_loop()
+        poller = pollers.get(state_dir)
+        if poller is None or poller[0] is not loop:
+            poller = pollers[state_dir] = (loop, asyncio.Lock(), asyncio.Event())
+        return poller[1], poller[2]
+
+    async def acquire_slot(state_dir):
+        """Wait for a slot; only the holder of the poll lock polls the state."""
+        poll_lock, released = local_poller(state_dir)
+        async with poll_lock:
+            delay = poll_interval
+            while True:
+                released.clear()
+                acquired = await asyncio.to_thread(try_acquire_slot, state_dir)
+                if acquired is not None:
+                    return acquired
+                try:
+                    await asyncio.wait_for(
+                        released.wait(), delay * random.uniform(1.0, 1.5)
+                    )
+                except TimeoutError:
+                    delay = min(max_poll_interval, delay * 2)
+
+    original_acompletion = llm_module.acompletion
+
+    async def governed_acompletion(*args, **kwargs):
+        state_dir = endpoint_state_dir(kwargs.get("api_base") or endpoint)
+        for attempt in range(max_retries + 1):
+            wait_start = time.perf_counter()
+            acquired = await acquire_slot(state_dir)
+            stats["wait_seconds"] += time.perf_counter() - wait_start
+            stats["requests"] += 1
+            in_flight = sum(len(slots) for slots in held_slots.values())
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], in_flight)
+
+            slot, fd = acquired
+            used_tokens = 0
+            outcome = "error"
+            try:
+                response = await original_acompletion(*args, **kwargs)
+                usage = getattr(response, "usage", None)
+                used_tokens = getattr(usage, "total_tokens", 0) or 0
+                stats["total_tokens"] += used_tokens
+                outcome = "success"
+                return response
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                outcome = "throttled"
+                if getattr(e, "status_code", None) == 429:
+                    stats["rate_limited"] += 1
+                else:
+                    stats["timeouts"] += 1
+                if attempt == max_retries:
+                    raise
+            finally:
+                await asyncio.to_thread(
+                    release_slot, state_dir, slot, fd, used_tokens, outcome
+                )
+                local_poller(state_dir)[1].set()
+            stats["retries"] += 1
+
+    llm_module.acompletion = governed_acompletion
+    return stats
+
+
+def parse_endpoints(api_base: str):
+    """Parse ``"url[=weight],url[=weight],..."`` into ``(url, weight)`` pairs.
+
+    Args:
+        api_base: One API base URL, or a comma-separated list with optional weights
+
+    Returns:
+        List of ``(url, weight)`` tuples; the weight defaults to 1
+    """
+    endpoints = []
+    for item in api_base.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, weight = item.rpartition("=")
+        try:
+            endpoints.append((url, float(weight)) if url else (item, 1.0))
+        except ValueError:
+            endpoints.append((item, 1.0))  # "=" belongs to the URL itself
+    if not endpoints:
+        raise ValueError("api_base must contain at least one endpoint")
+    for url, weight in endpoints:
+        if weight <= 0:
+            raise ValueError(
+                f"Endpoint weight must be positive, got {weight} for {url}"
+            )
+    return endpoints
+
+
+def install_endpoint_balancer(
+    endpoints,
+    api_key: str = "",
+    health_check: bool = True,
+    max_failures: int = 3,
+    eject_seconds: float = 30.0,
+    llm_module=None,
+):
+    """Spread LLM requests over several endpoints, least outstanding first.
+
+    Wraps the ``acompletion`` used by SDG Hub's LLMChatBlock and sets each
+    request's ``api_base`` to the healthy endpoint with the fewest outstanding
+    requests relative to its weight. Endpoints that fail the initial
+    ``/models`` health check, or ``max_failures`` requests in a row with a
+    connection error, timeout or 5xx, are ejected for ``eject_seconds``
+    (doubling on every repeated ejection), and the failed request is retried
+    on another endpoint.
+
+    Install it after :func:`install_endpoint_governor`, so each endpoint keeps
+    its own in-flight budget, and before :func:`install_response_cache`.
+
+    Args:
+        endpoints: List of ``(url, weight)`` pairs, see :func:`parse_endpoints`
+        api_key: API key sent with the health checks
+        health_check: Probe every endpoint before the first request
+        max_failures: Consecutive failures after which an endpoint is ejected
+        eject_seconds: Initial time an ejected endpoint gets no requests
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Dictionary of per-endpoint statistics for this process, updated in place
+    """
+    import asyncio
+    import time
+    import urllib.error
+    import urllib.request
+
+    if llm_module is None:
+        from sdg_hub.core.blocks.llm import llm_chat_block as llm_module
+
+    start = time.monotonic()
+    endpoint_stats = {
+        url: {
+            "weight": weight,
+            "requests": 0,
+            "failures": 0,
+            "ejections": 0,
+            "outstanding": 0,
+            "total_tokens": 0,
+            "requests_per_second": 0.0,
+            "tokens_per_second": 0.0,
+        }
+        for url, weight in endpoints
+    }
+    ejected_until = dict.fromkeys(endpoint_stats, 0.0)
+    consecutive_failures = dict.fromkeys(endpoint_stats, 0)
+    eject_level = dict.fromkeys(endpoint_stats, 0)
+
+    def eject(url, reason):
+        """Stop routing to an endpoint, for longer on every repeated ejection."""
+        seconds = eject_seconds * 2 ** min(eject_level[url], 5)
+        ejected_until[url] = time.monotonic() + seconds
+        eject_level[url] += 1
+        # After re-admission a single failure ejects the endpoint again
+        consecutive_failures[url] = max_failures - 1
+        endpoint_stats[url]["ejections"] += 1
+        print(f"Ejected endpoint {url} for {seconds:.0f}s: {reason}")
+
+    def probe(url):
+        """Return True if the endpoint answers its /models route."""
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        request = urllib.request.Request(f"{url.rstrip('/')}/models", headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=10):
+                return True
+        except urllib.error.HTTPError as e:
+            return e.code < 500  # Reachable, e.g. /models needs other auth
+        except OSError:
+            return False
+
+    def pick(tried):
+        """Pick the least loaded healthy endpoint that was not tried yet."""
+        now = time.monotonic()
+        untried = [url for url in endpoint_stats if url not in tried]
+        healthy = [url for url in untried if ejected_until[url] <= now]
+        # With every endpoint ejected, use the one that comes back first
+        candidates = healthy or [min(untried, key=ejected_until.get)]
+        return min(
+            candidates,
+            key=lambda url: (
+                (endpoint_stats[url]["outstanding"] + 1) / endpoint_stats[url]["weight"]
+            ),
+        )
+
+    def is_endpoint_failure(error):
+        """Return True for errors that point at an unhealthy endpoint."""
+        if isinstance(error, (asyncio.TimeoutError, ConnectionError, TimeoutError)):
+            return True
+        status_code = getattr(error, "status_code", None)
+        return status_code == 408 or (status_code or 0) >= 500
+
+    if health_check:
+        for url in endpoint_stats:
+            if not probe(url):
+                eject(url, "health check failed")
+
+    original_acompletion = llm_module.acompletion
+
+    async def balanced_acompletion(*args, **kwargs):
+        tried = set()
+        while True:
+            url = pick(tried)
+            stats = endpoint_stats[url]
+            stats["outstanding"] += 1
+            stats["requests"] += 1
+            try:
+                response = await original_acompletion(
+                    *args, **{**kwargs, "api_base": url}
+                )
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                stats["failures"] += 1
+                consecutive_failures[url] += 1
+                if consecutive_failures[url] >= max_failures:
+                    eject(url, f"{consecutive_failures[url]} failures, last: {e!r}")
+                tried.add(url)
+                if len(tried) == len(endpoint_stats):
+                    raise
+                continue
+            finally:
+                stats["outstanding"] -= 1
+
+            consecutive_failures[url] = 0
+            eject_level[url] = 0
+            usage = getattr(response, "usage", None)
+            stats["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+            elapsed = max(time.monotonic() - start, 1e-9)
+            stats["requests_per_second"] = round(stats["requests"] / elapsed, 3)
+            stats["tokens_per_second"] = round(stats["total_tokens"] / elapsed, 1)
+            return response
+
+    llm_module.acompletion = balanced_acompletion
+    return endpoint_stats
+
+
+def install_response_cache(
+    cache_dir: str,
+    max_size_gb: float = 10.0,
+    llm_module=None,
+):
+    """Serve repeated LLM requests from a content-addressed cache on disk.
+
+    Wraps the ``acompletion`` used by SDG Hub's LLMChatBlock. Each request is
+    keyed by a hash of the model, the rendered messages and every sampling
+    parameter (``n``, ``seed``, ``temperature``, ``max_tokens``, ...); the
+    endpoint, API key and timeouts are left out so they can change without
+    invalidating the cache. Responses are stored as small JSON files, and the
+    least recently used ones are evicted once the cache outgrows
+    ``max_size_gb``.
+
+    Install it after :func:`install_endpoint_governor` so cache hits do not
+    take an endpoint slot.
+
+    Args:
+        cache_dir: Cache directory, e.g. on the workspace PVC
+        max_size_gb: Size above which the least recently used entries are evicted
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Dictionary of cache statistics for this process, updated in place
+    """
+    import hashlib
+    import json
+    import os
+    from pathlib import Path
+    from types import SimpleNamespace
+
+    if llm_module is None:
+        from sdg_hub.core.blocks.llm import llm_chat_block as llm_module
+
+    # Transport settings that do not change the generated text
+    ignored_kwargs = {
+        "api_base",
+        "api_key",
+        "base_url",
+        "drop_params",
+        "num_retries",
+        "timeout",
+    }
+    max_bytes = int(max_size_gb * 1024**3)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stats = {"hits": 0, "misses": 0, "hit_rate": 0.0, "evicted": 0, "write_errors": 0}
+    cache_bytes = sum(f.stat().st_size for f in cache_dir.glob("*/*.json"))
+
+    def cache_key(kwargs):
+        """Hash the model, messages and sampling parameters of a request."""
+        request = {k: v for k, v in kwargs.items() if k not in ignored_kwargs}
+        request_json = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(request_json.encode("utf-8")).hexdigest()
+
+    def message_fields(message):
+        """Keep the JSON-serializable fields SDG Hub reads from a message."""
+        fields = {
+            k: v
+            for k, v in getattr(message, "__dict__", {}).items()
+            if isinstance(v, (str, int, float, bool, list, dict, type(None)))
+        }
+        fields["content"] = message.content
+        return fields
+
+    def evict():
+        """Delete the least recently used entries down to 90% of the limit."""
+        entries = []
+        for f in cache_dir.glob("*/*.json"):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, f))
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries, key=lambda entry: entry[0]):
+            if total <= 0.9 * max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            stats["evicted"] += 1
+        return total
+
+    def update_hit_rate():
+        stats["hit_rate"] = round(stats["hits"] / (stats["hits"] + stats["misses"]), 4)
+
+    original_acompletion = llm_module.acompletion
+
+    async def cached_acompletion(*args, **kwargs):
+        nonlocal cache_bytes
+
+        key = cache_key(kwargs)
+        entry_file = cache_dir / key[:2] / f"{key}.json"
+        try:
+            with open(entry_file, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+
+        if entry is not None:
+            os.utime(entry_file)  # Mark as recently used for eviction
+            stats["hits"] += 1
+            update_hit_rate()
+            return SimpleNamespace(
+                choices=[
+                    SimpleNamespace(message=SimpleNamespace(**message))
+                    for message in entry["messages"]
+                ],
+                usage=None,
+            )
+
+        stats["misses"] += 1
+        update_hit_rate()
+        response = await original_acompletion(*args, **kwargs)
+
+        # The request is paid for at this point, so a response that cannot be
+        # cached (nested objects, a full disk) is returned uncached
+        tmp_file = entry_file.with_name(f".{entry_file.name}.{os.getpid()}")
+        try:
+            entry_bytes = json.dumps({
+                "messages": [message_fields(c.message) for c in response.choices]
+            }).encode("utf-8")
+            entry_file.parent.mkdir(exist_ok=True)
+            tmp_file.write_bytes(entry_bytes)
+            os.replace(tmp_file, entry_file)
+        except (TypeError, ValueError, OSError) as e:
+            tmp_file.unlink(missing_ok=True)
+            if not stats["write_errors"]:
+                print(f"LLM response cache: not caching a response ({e!r})")
+            stats["write_errors"] += 1
+            return response
+        cache_bytes += len(entry_bytes)
+        if cache_bytes > max_bytes:
+            cache_bytes = evict()
+        return response
+
+    llm_module.acompletion = cached_acompletion
+    return stats
+
+
+def install_prefix_tracker(llm_module=None):
+    """Measure how much of each LLM prompt repeats the prompt sent before it.
+
+    Inference servers with prefix caching (e.g. vLLM) reuse the KV cache of a
+    prompt prefix they have just seen, so requests that share a long prefix
+    are cheapest when they are sent back to back. The tracker wraps the
+    ``acompletion`` used by SDG Hub's LLMChatBlock and, in send order, counts
+    the characters each rendered prompt shares with the previous one.
+
+    Install it before the other wrappers so it only sees requests that
+    actually reach an endpoint, in the order they are sent.
+
+    Args:
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Dictionary of ordering statistics for this process, updated in place
+    """
+    import os
+
+    if llm_module is None:
+        from sdg_hub.core.blocks.llm import llm_chat_block as llm_module
+
+    stats = {
+        "requests": 0,
+        "prompt_chars": 0,
+        "shared_prefix_chars": 0,
+        "shared_prefix_ratio": 0.0,
+    }
+    previous_prompt = ""
+    original_acompletion = llm_module.acompletion
+
+    async def tracked_acompletion(*args, **kwargs):
+        nonlocal previous_prompt
+
+        prompt = "".join(
+            f"{message.get('role', '')}\n{message.get('content', '')}\n"
+            for message in kwargs.get("messages") or []
+        )
+        shared_chars = len(os.path.commonprefix([previous_prompt, prompt]))
+        previous_prompt = prompt
+        stats["requests"] += 1
+        stats["prompt_chars"] += len(prompt)
+        stats["shared_prefix_chars"] += shared_chars
+        stats["shared_prefix_ratio"] = round(
+            stats["shared_prefix_chars"] / max(1, stats["prompt_chars"]), 4
+        )
+        return await original_acompletion(*args, **kwargs)
+
+    llm_module.acompletion = tracked_acompletion
+    return stats
+
+
+def install_request_telemetry(llm_module=None):
+    """Record the tokens, latency, outcome and concurrency of every LLM request.
+
+    Wraps the ``acompletion`` used by SDG Hub's LLMChatBlock. For each request
+    it records when it started, how long it took, the prompt and completion
+    tokens the endpoint reported, the error class if it failed and how many
+    requests of this process were in flight when it was sent. Pass the result
+    to :func:`write_generation_metrics` once generation is done.
+
+    Install it before the other wrappers so each retry shows up as its own
+    request and cache hits are not counted as endpoint requests.
+
+    Args:
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Dictionary with the list of request records, appended to in place
+    """
+    import time
+
+    if llm_module is None:
+        from sdg_hub.core.blocks.llm import llm_chat_block as llm_module
+
+    telemetry = {"started_at": time.time(), "requests": []}
+    clock_start = time.perf_counter()
+    in_flight = 0
+    original_acompletion = llm_module.acompletion
+
+    async def recorded_acompletion(*args, **kwargs):
+        nonlocal in_flight
+
+        in_flight += 1
+        record = {
+            "start_seconds": round(time.perf_counter() - clock_start, 4),
+            "concurrency": in_flight,
+            "n": kwargs.get("n", 1) or 1,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            response = await original_acompletion(*args, **kwargs)
+        except Exception as e:
+            record["error"] = type(e).__name__
+            raise
+        else:
+            usage = getattr(response, "usage", None)
+            record["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+            record["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+            return response
+        finally:
+            in_flight -= 1
+            record["latency_seconds"] = round(time.perf_counter() - start, 4)
+            telemetry["requests"].append(record)
+
+    llm_module.acompletion = recorded_acompletion
+    return telemetry
+
+
+def write_generation_metrics(telemetry, output_dir: str, extra_stats=None):
+    """Summarize request telemetry and write it as a metrics artifact.
+
+    Writes ``metrics.json`` with the run summary, a breakdown by concurrency
+    level and every request record, and ``summary.md`` with the same summary
+    as Markdown tables. The per-concurrency rows show how latency, errors and
+    estimated throughput change as more requests are in flight, which is what
+    ``max_concurrency`` and ``endpoint_max_in_flight`` should be sized from.
+
+    Args:
+        telemetry: Result of :func:`install_request_telemetry`
+        output_dir: Artifact directory that receives the files
+        extra_stats: Other statistics to include, e.g. the governor stats
+
+    Returns:
+        Dictionary with the run summary
+    """
+    import json
+    import math
+    from collections import Counter
+    from pathlib import Path
+
+    requests = telemetry["requests"]
+
+    def percentile(values, q):
+        """Nearest-rank percentile of an unsorted list (0.0 if empty)."""
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def summarize(records):
+        latencies = [r["latency_seconds"] for r in records if r["error"] is None]
+        return {
+            "requests": len(records),
+            "errors": sum(r["error"] is not None for r in records),
+            "latency_p50_seconds": round(percentile(latencies, 0.5), 3),
+            "latency_p90_seconds": round(percentile(latencies, 0.9), 3),
+            "latency_p99_seconds": round(percentile(latencies, 0.99), 3),
+        }
+
+    wall_seconds = max(
+        (r["start_seconds"] + r["latency_seconds"] for r in requests), default=0.0
+    ) - min((r["start_seconds"] for r in requests), default=0.0)
+    prompt_tokens = sum(r["prompt_tokens"] for r in requests)
+    completion_tokens = sum(r["completion_tokens"] for r in requests)
+    error_classes = Counter(r["error"] for r in requests if r["error"] is not None)
+    summary = summarize(requests)
+    summary.update({
+        "error_rate": round(summary["errors"] / max(1, len(requests)), 4),
+        "timeouts": sum(
+            count for name, count in error_classes.items() if "Timeout" in name
+        ),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(requests) / max(wall_seconds, 1e-9), 3),
+        "prompt_tokens_per_second": round(prompt_tokens / max(wall_seconds, 1e-9), 1),
+        "completion_tokens_per_second": round(
+            completion_tokens / max(wall_seconds, 1e-9), 1
+        ),
+        "peak_concurrency": max((r["concurrency"] for r in requests), default=0),
+    })
+
+    by_concurrency = []
+    for level in sorted({r["concurrency"] for r in requests}):
+        records = [r for r in requests if r["concurrency"] == level]
+        row = {"concurrency": level, **summarize(records)}
+        per_request_rates = [
+            r["completion_tokens"] / r["latency_seconds"]
+            for r in records
+            if r["error"] is None and r["latency_seconds"] > 0
+        ]
+        # With `level` requests in flight, each decoding at the mean rate
+        row["estimated_completion_tokens_per_second"] = round(
+            level * sum(per_request_rates) / max(1, len(per_request_rates)), 1
+        )
+        by_concurrency.append(row)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / "metrics.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "started_at": telemetry["started_at"],
+                "summary": summary,
+                "error_classes": dict(error_classes),
+                "by_concurrency": by_concurrency,
+                "stats": extra_stats or {},
+                "requests": requests,
+            },
+            f,
+            indent=2,
+        )
+
+    def markdown_table(rows):
+        header = list(rows[0])
+        lines = [
+            "| " + " | ".join(header) + " |",
+            "|" + "|".join("---" for _ in header) + "|",
+        ]
+        lines.extend(
+            "| " + " | ".join(str(row[k]) for k in header) + " |" for row in rows
+        )
+        return "\n".join(lines)
+
+    sections = [
+        "## Generation summary",
+        markdown_table([{"metric": k, "value": v} for k, v in summary.items()]),
+    ]
+    if error_classes:
+        sections += [
+            "## Errors",
+            markdown_table([
+                {"error": name, "count": count}
+                for name, count in error_classes.most_common()
+            ]),
+        ]
+    if by_concurrency:
+        sections += ["## By concurrency", markdown_table(by_concurrency)]
+    summary_markdown = "\n\n".join(sections) + "\n"
+    (output_dir / "summary.md").write_text(summary_markdown, encoding="utf-8")
+    print(summary_markdown)
+    return summary
+
+
+def install_generation_services(
+    endpoints,
+    api_key: str = "",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: float = 0,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
+    track_prefixes: bool = False,
+    llm_module=None,
+):
+    """Install the request wrappers every SDG generation component uses.
+
+    Request telemetry (and the prefix tracker with ``track_prefixes``) wraps
+    ``acompletion`` innermost, so every request and retry is recorded as it
+    is sent. Around it go, when configured, the endpoint governor on the
+    workspace PVC, the balancer for several endpoints and the response cache.
+    The cache needs its own ``llm_cache_dir``: the workspace PVC is created
+    for each run, so a cache there could never be hit by a later run.
+
+    Args:
+        endpoints: ``(url, weight)`` pairs from :func:`parse_endpoints`
+        api_key: API key for the balancer's health checks
+        workspace_path: Shared workspace PVC ("" = no governor or checkpoints)
+        endpoint_max_in_flight: Governor request budget (0 = no governor)
+        endpoint_max_tokens_per_second: Governor token budget (0 = unlimited)
+        llm_cache_dir: Persistent response cache directory ("" = no cache)
+        llm_cache_max_size_gb: Response cache size (0 = no cache)
+        track_prefixes: Also measure the prompt prefix shared between requests
+        llm_module: Module whose ``acompletion`` is wrapped (default: SDG Hub's)
+
+    Returns:
+        Tuple of the shard checkpoint directory ("" without a workspace) and a
+        ``report(metrics_dir, extra_stats=None)`` function that prints the
+        wrapper stats, writes the generation metrics and returns their summary
+    """
+    import os
+
+    prefix_stats = None
+    if track_prefixes:
+        prefix_stats = install_prefix_tracker(llm_module=llm_module)
+    telemetry = install_request_telemetry(llm_module=llm_module)
+
+    governor_stats = None
+    if workspace_path and endpoint_max_in_flight > 0:
+        # Share one request/token budget with the other generation components
+        governor_stats = install_endpoint_governor(
+            os.path.join(workspace_path, "endpoint_governor"),
+            endpoints[0][0],
+            max_in_flight=endpoint_max_in_flight,
+            max_tokens_per_second=endpoint_max_tokens_per_second,
+            llm_module=llm_module,
+        )
+
+    balancer_stats = None
+    if len(endpoints) > 1:
+        # Route each request to the least loaded healthy endpoint
+        balancer_stats = install_endpoint_balancer(
+            endpoints, api_key=api_key, llm_module=llm_module
+        )
+
+    cache_stats = None
+    if llm_cache_max_size_gb > 0 and llm_cache_dir:
+        # Unchanged documents are served from the cache instead of the endpoint
+        cache_stats = install_response_cache(
+            llm_cache_dir,
+            max_size_gb=llm_cache_max_size_gb,
+            llm_module=llm_module,
+        )
+
+    # Shards are checkpointed on the workspace PVC, so a retried pod resumes
+    checkpoint_dir = ""
+    if workspace_path:
+        checkpoint_dir = os.path.join(workspace_path, "sdg_checkpoints")
+
+    def report(metrics_dir, extra_stats=None):
+        stats = {
+            "governor": governor_stats,
+            "balancer": balancer_stats,
+            "cache": cache_stats,
+        }
+        if prefix_stats is not None:
+            print(f"Prompt prefix sharing stats: {prefix_stats}")
+            stats["prompt_prefix_sharing"] = prefix_stats
+        if governor_stats is not None:
+            print(f"Endpoint governor stats: {governor_stats}")
+        if balancer_stats is not None:
+            print("Endpoint balancer stats:")
+            for endpoint_url, endpoint_stats in balancer_stats.items():
+                print(f"  {endpoint_url}: {endpoint_stats}")
+        if cache_stats is not None:
+            print(f"LLM response cache stats: {cache_stats}")
+        stats.update(extra_stats or {})
+        return write_generation_metrics(telemetry, metrics_dir, extra_stats=stats)
+
+    return checkpoint_dir, report
+
+
+def load_seed_data(input_dir: str, seed_data_subsample: int = 0):
+    """Load the seed data written by document processing.
+
+    Reads ``seed_data.parquet`` from ``input_dir``, or ``seed_data.jsonl`` when
+    there is no Parquet file, and checks it has the columns the SDG flows use.
+
+    Args:
+        input_dir: Seed data artifact directory
+        seed_data_subsample: Keep only the first rows (0 = all rows)
+
+    Returns:
+        Seed data as a pandas DataFrame
+    """
+    import os
+
+    import pandas as pd
+
+    seed_data_file = os.path.join(input_dir, "seed_data.parquet")
+    if os.path.exists(seed_data_file):
+        print("Seed data file path:", seed_data_file)
+        quality_corpus = pd.read_parquet(seed_data_file)
+    else:
+        seed_data_file = os.path.join(input_dir, "seed_data.jsonl")
+        print("Seed data file path:", seed_data_file)
+        quality_corpus = pd.read_json(seed_data_file, lines=True)
+
+    seed_columns = ["document", "document_outline", "domain", "icl_document"]
+    missing_cols = [col for col in seed_columns if col not in quality_corpus.columns]
+    if missing_cols:
+        raise ValueError(f"Seed data is missing required columns: {missing_cols}")
+
+    if seed_data_subsample > 0:
+        quality_corpus = quality_corpus.iloc[:seed_data_subsample]
+    return quality_corpus
+
+
+def order_by_shared_prefix(dataset, prefix_columns):
+    """Stably sort seed rows so that rows whose prompts share a prefix are adjacent.
+
+    The flow prompts render ``prefix_columns`` (e.g. the document outline and
+    the document) in that order, so sorting rows by those values puts chunks
+    with the same outline and repeated documents next to each other, and
+    SDG Hub sends their requests back to back.
+
+    Args:
+        dataset: Seed data as a pandas DataFrame
+        prefix_columns: Columns in the order the prompts render them
+
+    Returns:
+        Tuple of the reordered DataFrame and a dictionary with the characters
+        adjacent rows share before and after ordering
+    """
+    import os
+
+    prefixes = [
+        "\n".join(str(value) for value in row)
+        for row in zip(*(dataset[column] for column in prefix_columns), strict=True)
+    ]
+    # sorted() is stable, so rows with equal prefixes keep their input order
+    order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+
+    def adjacent_shared_chars(keys):
+        return sum(
+            len(os.path.commonprefix([previous, current]))
+            for previous, current in zip(keys, keys[1:], strict=False)
+        )
+
+    stats = {
+        "rows": len(prefixes),
+        "unique_prefixes": len(set(prefixes)),
+        "prefix_chars": sum(len(prefix) for prefix in prefixes),
+        "adjacent_shared_chars_before": adjacent_shared_chars(prefixes),
+        "adjacent_shared_chars_after": adjacent_shared_chars([
+            prefixes[i] for i in order
+        ]),
+    }
+    return dataset.iloc[order].reset_index(drop=True), stats
+
+
+def generate_in_shards(
+    flow,
+    dataset,
+    output_dir: str,
+    checkpoint_dir: str = "",
+    shard_size: int = 100,
+    artifact_format: str = "jsonl",
+    fingerprint: str = "",
+    **generate_kwargs,
+):
+    """Run ``flow.generate`` shard by shard, checkpointing every finished shard.
+
+    The seed dataset is split into shards of ``shard_size`` rows. Each shard is
+    generated, written atomically to ``checkpoint_dir`` and linked into
+    ``output_dir`` as ``gen-00000.jsonl``, ``gen-00001.jsonl``, ... (or
+    ``.parquet``) right away, so a restarted component skips every shard that
+    already finished. Checkpoint names include a hash of the shard rows, the
+    flow, ``fingerprint`` (e.g. the model name) and ``generate_kwargs``, so
+    changed inputs are never served from a stale checkpoint.
+
+    Args:
+        flow: SDG Hub flow with its model config already set
+        dataset: Seed data as a pandas DataFrame or HuggingFace Dataset
+        output_dir: Artifact directory that receives the shard files
+        checkpoint_dir: Directory that outlives a pod restart, e.g. on the
+            workspace PVC (default: write the shards to ``output_dir`` only)
+        shard_size: Number of seed rows per shard (0 = a single shard)
+        artifact_format: Shard file format, ``jsonl`` or ``parquet``
+        fingerprint: Extra configuration that changes the generated data
+        **generate_kwargs: Passed to ``flow.generate`` (runtime_params, ...)
+
+    Returns:
+        Total number of generated rows across all shards
+    """
+    (num_rows,) = generate_flows_in_shards(
+        [(flow, output_dir, generate_kwargs)],
+        dataset,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=fingerprint,
+    )
+    return num_rows
+
+
+def generate_flows_in_shards(
+    flow_runs,
+    dataset,
+    checkpoint_dir: str = "",
+    shard_size: int = 100,
+    artifact_format: str = "jsonl",
+    fingerprint: str = "",
+):
+    """Run several flows over one seed dataset, shard by shard.
+
+    Every shard is generated by each flow in turn before the next shard
+    starts. Shards are checkpointed per flow exactly as described in
+    :func:`generate_in_shards`.
+
+    Args:
+        flow_runs: List of ``(flow, output_dir, generate_kwargs)`` tuples, where
+            ``generate_kwargs`` is passed to ``flow.generate``
+        dataset: Seed data as a pandas DataFrame or HuggingFace Dataset
+        checkpoint_dir: Directory that outlives a pod restart, e.g. on the
+            workspace PVC (default: write the shards to the output dirs only)
+        shard_size: Number of seed rows per shard (0 = a single shard)
+        artifact_format: Shard file format, ``jsonl`` or ``parquet``
+        fingerprint: Extra configuration that changes the generated data
+
+    Returns:
+        List with the total number of generated rows of each flow run
+    """
+    import hashlib
+    import json
+    import os
+    import re
+    import shutil
+    import time
+    from pathlib import Path
+
+    if hasattr(dataset, "to_pandas"):
+        dataset = dataset.to_pandas()
+
+    runs = []
+    for flow, output_dir, generate_kwargs in flow_runs:
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        flow_checkpoint_dir = None
+        if checkpoint_dir:
+            flow_slug = re.sub(r"[^a-z0-9]+", "_", flow.metadata.name.lower())
+            flow_checkpoint_dir = Path(checkpoint_dir) / flow_slug.strip("_")
+            flow_checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        # Concurrency does not change the generated data, so it is not part of the key
+        config_kwargs = {
+            k: v for k, v in generate_kwargs.items() if k != "max_concurrency"
+        }
+        config_json = json.dumps(
+            [flow.metadata.name, fingerprint, config_kwargs],
+            sort_keys=True,
+            default=str,
+        )
+        runs.append((
+            flow,
+            output_dir,
+            generate_kwargs,
+            flow_checkpoint_dir,
+            config_json,
+        ))
+
+    shard_size = shard_size if shard_size > 0 else max(1, len(dataset))
+    num_shards = max(1, -(-len(dataset) // shard_size))
+
+    def count_rows(shard_file):
+        """Count rows from the Parquet footer or by streaming JSONL newlines."""
+        if shard_file.stat().st_size == 0:
+            return 0
+        if artifact_format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetFile(shard_file).metadata.num_rows
+        with open(shard_file, "rb") as f:
+            return sum(
+                chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b"")
+            )
+
+    total_rows = [0] * len(runs)
+    skipped_shards = 0
+    for shard_index in range(num_shards):
+        shard = dataset.iloc[shard_index * shard_size : (shard_index + 1) * shard_size]
+        shard_json = (
+            shard.to_json(orient="records", lines=True) if checkpoint_dir else ""
+        )
+        for run_index, run in enumerate(runs):
+            flow, output_dir, generate_kwargs, flow_checkpoint_dir, config_json = run
+            shard_label = f"Shard {shard_index + 1}/{num_shards}"
+            if len(runs) > 1:
+                shard_label += f" ({flow.metadata.name})"
+            output_file = output_dir / f"gen-{shard_index:05d}.{artifact_format}"
+            checkpoint_file = output_file
+            if flow_checkpoint_dir:
+                shard_hash = hashlib.sha256(
+                    (config_json + shard_json).encode("utf-8")
+                ).hexdigest()[:12]
+                checkpoint_file = (
+                    flow_checkpoint_dir
+                    / f"gen-{shard_index:05d}-{shard_hash}.{artifact_format}"
+                )
+
+            if checkpoint_file.exists():
+                num_rows = count_rows(checkpoint_file)
+                skipped_shards += 1
+                print(f"{shard_label}: already generated, skipping")
+            else:
+                start = time.perf_counter()
+                try:
+                    generated_data = flow.generate(shard, **generate_kwargs)
+                except Exception as e:
+                    # A small shard can be filtered down to nothing by a flow block;
+                    # matched by name so this helper does not import SDG Hub itself
+                    if type(e).__name__ != "EmptyDatasetError":
+                        raise
+                    generated_data = shard.iloc[:0]
+                num_rows = len(generated_data)
+
+                # Write under a temporary name so a crash never leaves a partial
+                # shard; an empty file marks a shard that produced no records
+                tmp_file = checkpoint_file.with_name(f".{checkpoint_file.name}.tmp")
+                if num_rows == 0:
+                    tmp_file.write_bytes(b"")
+                elif artifact_format == "parquet":
+                    generated_data.to_parquet(tmp_file, compression="zstd", index=False)
+                else:
+                    generated_data.to_json(tmp_file, orient="records", lines=True)
+                os.replace(tmp_file, checkpoint_file)
+                print(
+                    f"{shard_label}: generated {num_rows} records "
+                    f"in {time.perf_counter() - start:.1f}s"
+                )
+
+            total_rows[run_index] += num_rows
+            if checkpoint_file != output_file and not output_file.exists():
+                try:
+                    os.link(checkpoint_file, output_file)
+                except OSError:
+                    shutil.copy2(checkpoint_file, output_file)
+
+    num_generated = num_shards * len(runs) - skipped_shards
+    print(f"Generated {num_generated} shards, resumed {skipped_shards}")
+    return total_rows
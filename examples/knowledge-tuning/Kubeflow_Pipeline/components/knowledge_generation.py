@@ -1,6 +1,21 @@
 from kfp import dsl
 from kfp.dsl import Dataset, Input, Output
 
+from components.inference_utils import (
+    generate_flows_in_shards,
+    generate_in_shards,
+    install_endpoint_balancer,
+    install_endpoint_governor,
+    install_generation_services,
+    install_prefix_tracker,
+    install_request_telemetry,
+    install_response_cache,
+    load_seed_data,
+    order_by_shared_prefix,
+    parse_endpoints,
+    write_generation_metrics,
+)
+
 BASE_IMAGE = "quay.io/fabianofranz/docling-ubi9:2.54.0"
 
 
@@ -11,10 +26,23 @@ BASE_IMAGE = "quay.io/fabianofranz/docling-ubi9:2.54.0"
         "sdg-hub>=0.6.0",
         "datasets>=3.6.0",
     ],
+    additional_funcs=[
+        load_seed_data,
+        parse_endpoints,
+        install_endpoint_governor,
+        install_endpoint_balancer,
+        install_response_cache,
+        install_request_telemetry,
+        write_generation_metrics,
+        install_generation_services,
+        generate_flows_in_shards,
+        generate_in_shards,
+    ],
 )
 def generate_extractive_summaries(
     input_dataset: Input[dsl.Artifact],
     output_path: Output[dsl.Artifact],
+    metrics_output: Output[dsl.Artifact],
     model_name: str,
     api_key: str,
     api_base: str,
@@ -23,13 +51,19 @@ def generate_extractive_summaries(
     number_of_summaries: int = 5,
     max_concurrency: int = 5,
     inference_timeout: int = 920,
+    artifact_format: str = "jsonl",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: int = 0,
+    shard_size: int = 100,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
 ):
     """Generate document-based QA knowledge tuning data."""
 
     import os
 
     import nest_asyncio
-    import pandas as pd
     from sdg_hub import Flow, FlowRegistry
 
     nest_asyncio.apply()
@@ -46,14 +80,13 @@ def generate_extractive_summaries(
 
     print("INFERENCE TIMEOUT SET : -- > ", os.environ["LITELLM_REQUEST_TIMEOUT"])
 
-    # Load the seed data that was generated when you ran the Data Processing notebook
-
-    seed_data_file = os.path.join(input_dataset.path, "seed_data.jsonl")
-    print("Seed data file path:", seed_data_file)
-    quality_corpus = pd.read_json(seed_data_file, lines=True)
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
 
-    if seed_data_subsample > 0:
-        quality_corpus = quality_corpus.iloc[:seed_data_subsample]
+    # Load the seed data that was generated when you ran the Data Processing notebook
+    quality_corpus = load_seed_data(input_dataset.path, seed_data_subsample)
 
     print(f"Generating document-based QA for {len(quality_corpus)} documents...")
 
@@ -63,9 +96,11 @@ def generate_extractive_summaries(
     )
     flow = Flow.from_yaml(flow_path)
 
+    # api_base may list several endpoints as "url=weight,url=weight"
+    endpoints = parse_endpoints(api_base)
     flow.set_model_config(
         model=model_name,
-        api_base=api_base,
+        api_base=endpoints[0][0],
         api_key=api_key,
         enable_reasoning=enable_reasoning,
     )
@@ -85,13 +120,32 @@ def generate_extractive_summaries(
     # else:
     #     runtime_params = {"gen_extractive_summary": {"n": number_of_summaries}}
 
+    checkpoint_dir, report_generation = install_generation_services(
+        endpoints,
+        api_key=api_key,
+        workspace_path=workspace_path,
+        endpoint_max_in_flight=endpoint_max_in_flight,
+        endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_size_gb=llm_cache_max_size_gb,
+    )
+
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        OUTPUT_DIR,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=f"{model_name}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        # max_concurrency applies per endpoint, so throughput scales with them
+        max_concurrency=max_concurrency * len(endpoints),
     )
+    metrics_output.metadata.update(report_generation(metrics_output.path))
 
-    generated_data.to_json(OUTPUT_DIR / "gen.jsonl", orient="records", lines=True)
-    print(f"Generated {len(generated_data)} document QA records")
+    print(f"Generated {num_generated} document QA records")
     print(f"Saved to: {OUTPUT_DIR}")
 
 
@@ -102,10 +156,23 @@ def generate_extractive_summaries(
         "sdg-hub>=0.6.0",
         "datasets>=3.6.0",
     ],
+    additional_funcs=[
+        load_seed_data,
+        parse_endpoints,
+        install_endpoint_governor,
+        install_endpoint_balancer,
+        install_response_cache,
+        install_request_telemetry,
+        write_generation_metrics,
+        install_generation_services,
+        generate_flows_in_shards,
+        generate_in_shards,
+    ],
 )
 def generate_detailed_summaries(
     input_dataset: Input[dsl.Artifact],
     output_path: Output[dsl.Artifact],
+    metrics_output: Output[dsl.Artifact],
     model_name: str,
     api_key: str,
     api_base: str,
@@ -114,11 +181,17 @@ def generate_detailed_summaries(
     max_concurrency: int = 5,
     number_of_summaries: int = 5,
     inference_timeout: int = 920,
+    artifact_format: str = "jsonl",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: int = 0,
+    shard_size: int = 100,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
 ):
     import os
 
     import nest_asyncio
-    import pandas as pd
     from sdg_hub import Flow, FlowRegistry
 
     nest_asyncio.apply()
@@ -135,14 +208,13 @@ def generate_detailed_summaries(
 
     print("INFERENCE TIMEOUT SET : -- > ", os.environ["LITELLM_REQUEST_TIMEOUT"])
 
-    # Load the seed data that was generated when you ran the Data Processing notebook
-
-    seed_data_file = os.path.join(input_dataset.path, "seed_data.jsonl")
-    print("Seed data file path:", seed_data_file)
-    quality_corpus = pd.read_json(seed_data_file, lines=True)
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
 
-    if seed_data_subsample > 0:
-        quality_corpus = quality_corpus.iloc[:seed_data_subsample]
+    # Load the seed data that was generated when you ran the Data Processing notebook
+    quality_corpus = load_seed_data(input_dataset.path, seed_data_subsample)
 
     print(f"Generating detailed summaries for {len(quality_corpus)} documents...")
 
@@ -152,9 +224,11 @@ def generate_detailed_summaries(
     )
     flow = Flow.from_yaml(flow_path)
 
+    # api_base may list several endpoints as "url=weight,url=weight"
+    endpoints = parse_endpoints(api_base)
     flow.set_model_config(
         model=model_name,
-        api_base=api_base,
+        api_base=endpoints[0][0],
         api_key=api_key,
         enable_reasoning=enable_reasoning,
     )
@@ -167,13 +241,32 @@ def generate_detailed_summaries(
             "gen_detailed_summary": {"n": number_of_summaries, "max_tokens": 6000},
         }
 
+    checkpoint_dir, report_generation = install_generation_services(
+        endpoints,
+        api_key=api_key,
+        workspace_path=workspace_path,
+        endpoint_max_in_flight=endpoint_max_in_flight,
+        endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_size_gb=llm_cache_max_size_gb,
+    )
+
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        OUTPUT_DIR,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=f"{model_name}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        # max_concurrency applies per endpoint, so throughput scales with them
+        max_concurrency=max_concurrency * len(endpoints),
     )
+    metrics_output.metadata.update(report_generation(metrics_output.path))
 
-    generated_data.to_json(OUTPUT_DIR / "gen.jsonl", orient="records", lines=True)
-    print(f"Generated {len(generated_data)} detailed summary records")
+    print(f"Generated {num_generated} detailed summary records")
     print(f"Saved to: {OUTPUT_DIR}")
 
 
@@ -184,10 +277,23 @@ def generate_detailed_summaries(
         "sdg-hub>=0.6.0",
         "datasets>=3.6.0",
     ],
+    additional_funcs=[
+        load_seed_data,
+        parse_endpoints,
+        install_endpoint_governor,
+        install_endpoint_balancer,
+        install_response_cache,
+        install_request_telemetry,
+        write_generation_metrics,
+        install_generation_services,
+        generate_flows_in_shards,
+        generate_in_shards,
+    ],
 )
 def generate_key_facts_summary(
     input_dataset: Input[dsl.Artifact],
     output_path: Output[dsl.Artifact],
+    metrics_output: Output[dsl.Artifact],
     model_name: str,
     api_key: str,
     api_base: str,
@@ -195,11 +301,17 @@ def generate_key_facts_summary(
     enable_reasoning: bool = False,
     max_concurrency: int = 5,
     inference_timeout: int = 920,
+    artifact_format: str = "jsonl",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: int = 0,
+    shard_size: int = 100,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
 ):
     import os
 
     import nest_asyncio
-    import pandas as pd
     from sdg_hub import Flow, FlowRegistry
 
     nest_asyncio.apply()
@@ -216,14 +328,13 @@ def generate_key_facts_summary(
 
     print("INFERENCE TIMEOUT SET : -- > ", os.environ["LITELLM_REQUEST_TIMEOUT"])
 
-    # Load the seed data that was generated when you ran the Data Processing notebook
-
-    seed_data_file = os.path.join(input_dataset.path, "seed_data.jsonl")
-    print("Seed data file path:", seed_data_file)
-    quality_corpus = pd.read_json(seed_data_file, lines=True)
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
 
-    if seed_data_subsample > 0:
-        quality_corpus = quality_corpus.iloc[:seed_data_subsample]
+    # Load the seed data that was generated when you ran the Data Processing notebook
+    quality_corpus = load_seed_data(input_dataset.path, seed_data_subsample)
 
     print(f"Generating detailed summaries for {len(quality_corpus)} documents...")
 
@@ -233,9 +344,11 @@ def generate_key_facts_summary(
     )
     flow = Flow.from_yaml(flow_path)
 
+    # api_base may list several endpoints as "url=weight,url=weight"
+    endpoints = parse_endpoints(api_base)
     flow.set_model_config(
         model=model_name,
-        api_base=api_base,
+        api_base=endpoints[0][0],
         api_key=api_key,
         enable_reasoning=enable_reasoning,
     )
@@ -244,13 +357,32 @@ def generate_key_facts_summary(
     if enable_reasoning:
         runtime_params = {"generate_key_fact_qa": {"max_tokens": 6000}}
 
+    checkpoint_dir, report_generation = install_generation_services(
+        endpoints,
+        api_key=api_key,
+        workspace_path=workspace_path,
+        endpoint_max_in_flight=endpoint_max_in_flight,
+        endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_size_gb=llm_cache_max_size_gb,
+    )
+
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        OUTPUT_DIR,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=f"{model_name}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        # max_concurrency applies per endpoint, so throughput scales with them
+        max_concurrency=max_concurrency * len(endpoints),
     )
+    metrics_output.metadata.update(report_generation(metrics_output.path))
 
-    generated_data.to_json(OUTPUT_DIR / "gen.jsonl", orient="records", lines=True)
-    print(f"Generated {len(generated_data)} key facts records")
+    print(f"Generated {num_generated} key facts records")
     print(f"Saved to: {OUTPUT_DIR}")
 
 
@@ -261,10 +393,23 @@ def generate_key_facts_summary(
         "sdg-hub>=0.6.0",
         "datasets>=3.6.0",
     ],
+    additional_funcs=[
+        load_seed_data,
+        parse_endpoints,
+        install_endpoint_governor,
+        install_endpoint_balancer,
+        install_response_cache,
+        install_request_telemetry,
+        write_generation_metrics,
+        install_generation_services,
+        generate_flows_in_shards,
+        generate_in_shards,
+    ],
 )
 def generate_document_based_qa(
     input_dataset: Input[dsl.Artifact],
     output_path: Output[dsl.Artifact],
+    metrics_output: Output[dsl.Artifact],
     model_name: str,
     api_key: str,
     api_base: str,
@@ -272,11 +417,17 @@ def generate_document_based_qa(
     enable_reasoning: bool = False,
     max_concurrency: int = 5,
     inference_timeout: int = 920,
+    artifact_format: str = "jsonl",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: int = 0,
+    shard_size: int = 100,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
 ):
     import os
 
     import nest_asyncio
-    import pandas as pd
     from sdg_hub import Flow, FlowRegistry
 
     nest_asyncio.apply()
@@ -293,14 +444,13 @@ def generate_document_based_qa(
 
     print("INFERENCE TIMEOUT SET : -- > ", os.environ["LITELLM_REQUEST_TIMEOUT"])
 
-    # Load the seed data that was generated when you ran the Data Processing notebook
-
-    seed_data_file = os.path.join(input_dataset.path, "seed_data.jsonl")
-    print("Seed data file path:", seed_data_file)
-    quality_corpus = pd.read_json(seed_data_file, lines=True)
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
 
-    if seed_data_subsample > 0:
-        quality_corpus = quality_corpus.iloc[:seed_data_subsample]
+    # Load the seed data that was generated when you ran the Data Processing notebook
+    quality_corpus = load_seed_data(input_dataset.path, seed_data_subsample)
 
     print(f"Generating detailed summaries for {len(quality_corpus)} documents...")
 
@@ -310,9 +460,11 @@ def generate_document_based_qa(
     )
     flow = Flow.from_yaml(flow_path)
 
+    # api_base may list several endpoints as "url=weight,url=weight"
+    endpoints = parse_endpoints(api_base)
     flow.set_model_config(
         model=model_name,
-        api_base=api_base,
+        api_base=endpoints[0][0],
         api_key=api_key,
         enable_reasoning=enable_reasoning,
     )
@@ -321,82 +473,315 @@ def generate_document_based_qa(
     if enable_reasoning:
         runtime_params = {"question_generation": {"max_tokens": 1024}}
 
+    checkpoint_dir, report_generation = install_generation_services(
+        endpoints,
+        api_key=api_key,
+        workspace_path=workspace_path,
+        endpoint_max_in_flight=endpoint_max_in_flight,
+        endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_size_gb=llm_cache_max_size_gb,
+    )
+
     print("Starting generation...")
-    generated_data = flow.generate(
-        quality_corpus, runtime_params=runtime_params, max_concurrency=max_concurrency
+    num_generated = generate_in_shards(
+        flow,
+        quality_corpus,
+        OUTPUT_DIR,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=f"{model_name}:{enable_reasoning}",
+        runtime_params=runtime_params,
+        # max_concurrency applies per endpoint, so throughput scales with them
+        max_concurrency=max_concurrency * len(endpoints),
     )
+    metrics_output.metadata.update(report_generation(metrics_output.path))
 
-    generated_data.to_json(OUTPUT_DIR / "gen.jsonl", orient="records", lines=True)
-    print(f"Generated {len(generated_data)} document QA records")
+    print(f"Generated {num_generated} document QA records")
     print(f"Saved to: {OUTPUT_DIR}")
 
 
-@dsl.component(base_image=BASE_IMAGE, packages_to_install=["datasets"])
+@dsl.component(
+    base_image=BASE_IMAGE,
+    packages_to_install=[
+        "nest-asyncio",
+        "sdg-hub>=0.6.0",
+        "datasets>=3.6.0",
+    ],
+    additional_funcs=[
+        load_seed_data,
+        parse_endpoints,
+        install_endpoint_governor,
+        install_endpoint_balancer,
+        install_response_cache,
+        install_request_telemetry,
+        write_generation_metrics,
+        install_prefix_tracker,
+        install_generation_services,
+        order_by_shared_prefix,
+        generate_flows_in_shards,
+    ],
+)
+def generate_knowledge_datasets(
+    input_dataset: Input[dsl.Artifact],
+    extractive_output: Output[dsl.Artifact],
+    detailed_output: Output[dsl.Artifact],
+    key_facts_output: Output[dsl.Artifact],
+    doc_qa_output: Output[dsl.Artifact],
+    metrics_output: Output[dsl.Artifact],
+    model_name: str,
+    api_key: str,
+    api_base: str,
+    seed_data_subsample: int = 0,
+    enable_reasoning: bool = False,
+    number_of_summaries: int = 5,
+    max_concurrency: int = 5,
+    inference_timeout: int = 920,
+    artifact_format: str = "jsonl",
+    workspace_path: str = "",
+    endpoint_max_in_flight: int = 0,
+    endpoint_max_tokens_per_second: int = 0,
+    shard_size: int = 100,
+    llm_cache_dir: str = "",
+    llm_cache_max_size_gb: float = 0.0,
+):
+    """Generate all four knowledge datasets in a single pass over the seed data.
+
+    The seed data is loaded once and ordered so rows with the same document
+    are adjacent. Each shard then runs through the extractive summary,
+    detailed summary, key facts and document QA flows in turn. The flows run
+    one after another, so this component sends at most ``max_concurrency``
+    requests per endpoint, a quarter of what the four parallel components can.
+    """
+    import os
+
+    import nest_asyncio
+    from sdg_hub import Flow, FlowRegistry
+
+    nest_asyncio.apply()
+
+    os.environ["LITELLM_REQUEST_TIMEOUT"] = str(inference_timeout)
+
+    print("INFERENCE TIMEOUT SET : -- > ", os.environ["LITELLM_REQUEST_TIMEOUT"])
+
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
+
+    # Load the seed data once for all flows
+    quality_corpus = load_seed_data(input_dataset.path, seed_data_subsample)
+
+    # The summary and QA prompts render the outline, then the document
+    quality_corpus, ordering_stats = order_by_shared_prefix(
+        quality_corpus, ["document_outline", "document"]
+    )
+    print(f"Seed data prefix ordering stats: {ordering_stats}")
+
+    print(f"Generating knowledge datasets for {len(quality_corpus)} documents...")
+
+    # api_base may list several endpoints as "url=weight,url=weight"
+    endpoints = parse_endpoints(api_base)
+
+    extractive_params = {"gen_extractive_summary": {"n": number_of_summaries}}
+    detailed_params = {"gen_detailed_summary": {"n": number_of_summaries}}
+    key_facts_params = {}
+    doc_qa_params = {}
+    if enable_reasoning:
+        extractive_params["gen_extractive_summary"]["max_tokens"] = 6000
+        extractive_params["question_generation"] = {"max_tokens": 1024}
+        detailed_params["gen_detailed_summary"]["max_tokens"] = 6000
+        detailed_params["question_generation"] = {"max_tokens": 1024}
+        key_facts_params = {"generate_key_fact_qa": {"max_tokens": 6000}}
+        doc_qa_params = {"question_generation": {"max_tokens": 1024}}
+
+    FlowRegistry.discover_flows()
+    flow_runs = []
+    for flow_name, output_artifact, runtime_params in [
+        (
+            "Extractive Summary Knowledge Tuning Dataset Generation Flow",
+            extractive_output,
+            extractive_params,
+        ),
+        (
+            "Detailed Summary Knowledge Tuning Dataset Generation Flow",
+            detailed_output,
+            detailed_params,
+        ),
+        (
+            "Key Facts Knowledge Tuning Dataset Generation Flow",
+            key_facts_output,
+            key_facts_params,
+        ),
+        (
+            "Document Based Knowledge Tuning Dataset Generation Flow",
+            doc_qa_output,
+            doc_qa_params,
+        ),
+    ]:
+        flow = Flow.from_yaml(FlowRegistry.get_flow_path(flow_name))
+        flow.set_model_config(
+            model=model_name,
+            api_base=endpoints[0][0],
+            api_key=api_key,
+            enable_reasoning=enable_reasoning,
+        )
+        generate_kwargs = {
+            "runtime_params": runtime_params,
+            # max_concurrency applies per endpoint, so throughput scales with them
+            "max_concurrency": max_concurrency * len(endpoints),
+        }
+        flow_runs.append((flow, output_artifact.path, generate_kwargs))
+
+    checkpoint_dir, report_generation = install_generation_services(
+        endpoints,
+        api_key=api_key,
+        workspace_path=workspace_path,
+        endpoint_max_in_flight=endpoint_max_in_flight,
+        endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+        llm_cache_dir=llm_cache_dir,
+        llm_cache_max_size_gb=llm_cache_max_size_gb,
+        track_prefixes=True,
+    )
+
+    print("Starting generation...")
+    num_generated = generate_flows_in_shards(
+        flow_runs,
+        quality_corpus,
+        checkpoint_dir=checkpoint_dir,
+        shard_size=shard_size,
+        artifact_format=artifact_format,
+        fingerprint=f"{model_name}:{enable_reasoning}",
+    )
+    metrics_output.metadata.update(
+        report_generation(
+            metrics_output.path,
+            extra_stats={"seed_prefix_ordering": ordering_stats},
+        )
+    )
+
+    for (flow, output_dir, _), flow_rows in zip(flow_runs, num_generated, strict=True):
+        print(f"Generated {flow_rows} records with {flow.metadata.name}")
+        print(f"Saved to: {output_dir}")
+
+
+@dsl.component(base_image=BASE_IMAGE, packages_to_install=["pyarrow"])
 def merge_all_outputs_component(
     extractive_data: Input[Dataset],
     detailed_data: Input[Dataset],
     key_facts_data: Input[Dataset],
     doc_qa_data: Input[Dataset],
     merged_output: Output[Dataset],
+    artifact_format: str = "jsonl",
 ):
-    """Combine all generated data into a single output."""
+    """Link all generated data into a single output without rewriting it."""
+    import json
     import os
+    import shutil
     from pathlib import Path
 
-    from datasets import load_dataset
-
-    print("Loading all datasets...")
-
-    # Load each dataset
-    extractive = load_dataset(
-        "json", data_files=os.path.join(extractive_data.path, "*.jsonl"), split="train"
-    )
-    detailed = load_dataset(
-        "json", data_files=os.path.join(detailed_data.path, "*.jsonl"), split="train"
-    )
-    key_facts = load_dataset(
-        "json", data_files=os.path.join(key_facts_data.path, "*.jsonl"), split="train"
-    )
-    doc_qa = load_dataset(
-        "json", data_files=os.path.join(doc_qa_data.path, "*.jsonl"), split="train"
-    )
+    import pyarrow.parquet as pq
+
+    if artifact_format not in ("jsonl", "parquet"):
+        raise ValueError(
+            f"Invalid artifact_format: {artifact_format}. Must be 'jsonl' or 'parquet'"
+        )
+
+    def read_columns(data_file):
+        """Read column names from the Parquet footer or the first JSONL record."""
+        if data_file.suffix == ".parquet":
+            return pq.read_schema(data_file).names
+        with open(data_file, encoding="utf-8") as f:
+            first_line = f.readline()
+        return list(json.loads(first_line)) if first_line.strip() else []
+
+    def count_rows(data_file, chunk_size=1 << 20):
+        """Count rows from the Parquet footer or by streaming JSONL newlines."""
+        if data_file.stat().st_size == 0:
+            return 0
+        if data_file.suffix == ".parquet":
+            return pq.ParquetFile(data_file).metadata.num_rows
+        num_rows = 0
+        last_byte = b"\n"
+        with open(data_file, "rb") as f:
+            while chunk := f.read(chunk_size):
+                num_rows += chunk.count(b"\n")
+                last_byte = chunk[-1:]
+        # The last record may not end with a newline
+        return num_rows + (last_byte != b"\n")
+
+    def link_or_copy(src, dst):
+        """Hardlink src to dst, copying only when they are on different devices."""
+        if dst.exists():
+            dst.unlink()
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    generated_inputs = {
+        "extractive_summary": (extractive_data.path, "raw_document"),
+        "detailed_summary": (detailed_data.path, "raw_document"),
+        "key_facts_to_qa": (key_facts_data.path, "raw_document"),
+        "document_based_qa": (doc_qa_data.path, "base_document"),
+    }
 
-    # Combine all datasets
-    print(f"  - Extractive: {len(extractive)} records")
-    print(f"  - Detailed: {len(detailed)} records")
-    print(f"  - Key Facts: {len(key_facts)} records")
-    print(f"  - Doc QA: {len(doc_qa)} records")
-
-    dataset_output_folders = [
-        "extractive_summary",
-        "detailed_summary",
-        "key_facts_to_qa",
-        "document_based_qa",
+    print("Linking all datasets...")
+    manifest = {"artifact_format": artifact_format, "datasets": {}}
+    # Prefer artifact_format, but detect the format each input was written in,
+    # e.g. when a cached generation step ran with the other format
+    data_formats = [artifact_format] + [
+        data_format
+        for data_format in ("parquet", "jsonl")
+        if data_format != artifact_format
     ]
-    for dataset_folder in dataset_output_folders:
+    for dataset_folder, (data_path, raw_document_column) in generated_inputs.items():
+        for data_format in data_formats:
+            data_files = sorted(Path(data_path).glob(f"*.{data_format}"))
+            if data_files:
+                break
+        else:
+            raise FileNotFoundError(
+                f"No *.parquet or *.jsonl files found in {data_path}"
+            )
+
+        required_cols = [
+            "question",
+            "response",
+            "document",
+            "document_outline",
+            raw_document_column,
+        ]
         dataset_output_dir = Path(merged_output.path) / dataset_folder
         dataset_output_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Created output directory for {dataset_folder}")
 
-    extractive.to_json(
-        os.path.join(merged_output.path, "extractive_summary", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    detailed.to_json(
-        os.path.join(merged_output.path, "detailed_summary", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    key_facts.to_json(
-        os.path.join(merged_output.path, "key_facts_to_qa", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
-    doc_qa.to_json(
-        os.path.join(merged_output.path, "document_based_qa", "gen.jsonl"),
-        orient="records",
-        lines=True,
-    )
+        # Sharded generation writes one file per shard; together they are one
+        # dataset, and empty shards are left out
+        num_rows = 0
+        linked_files = []
+        for data_file in data_files:
+            file_rows = count_rows(data_file)
+            if file_rows == 0:
+                continue
+            columns = read_columns(data_file)
+            missing_cols = [col for col in required_cols if col not in columns]
+            if missing_cols:
+                raise ValueError(
+                    f"{data_file} is missing required columns: {missing_cols}"
+                )
+            num_rows += file_rows
+            link_or_copy(data_file, dataset_output_dir / data_file.name)
+            linked_files.append(f"{dataset_folder}/{data_file.name}")
+
+        manifest["datasets"][dataset_folder] = {
+            "format": data_format,
+            "files": linked_files,
+            "num_rows": num_rows,
+        }
+        print(f"  - {dataset_folder}: {num_rows} records ({data_format})")
+
+    with open(Path(merged_output.path) / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
 
     print(f"Merged output saved to: {merged_output.path}")
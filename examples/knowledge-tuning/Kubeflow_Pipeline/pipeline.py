@@ -2,11 +2,13 @@ import kfp
 import kfp.kubernetes
 from components.document_processing import document_processing
 from components.download_docling_models import download_docling_models
+from components.download_tokenizer import download_tokenizer
 from components.knowledge_generation import (
     generate_detailed_summaries,
     generate_document_based_qa,
     generate_extractive_summaries,
     generate_key_facts_summary,
+    generate_knowledge_datasets,
     merge_all_outputs_component,
 )
 from components.knowledge_mixing import knowledge_mixing
@@ -16,6 +18,26 @@ from kfp_components.components.training.finetuning import train_model
 PVC_SIZE = "80Gi"
 PVC_STORAGE_CLASS = "nfs-csi"
 PVC_ACCESS_MODES = ["ReadWriteMany"]
+# Generation resumes from its checkpointed shards when a pod is retried
+GENERATION_RETRIES = 3
+# Name an existing PVC here to cache the LLM responses of the generation
+# components across pipeline runs; without it the cache is off, since the
+# per-run workspace PVC could never serve a later run
+LLM_CACHE_PVC = ""
+LLM_CACHE_MOUNT_PATH = "/llm-cache"
+# Name an existing PVC here to keep converted documents across pipeline runs;
+# document processing then only converts sources whose content changed
+DOCUMENT_CACHE_PVC = ""
+DOCUMENT_CACHE_MOUNT_PATH = "/document-cache"
+# Every conversion worker loads its own copy of the Docling models, so raise
+# the memory limit together with conversion_workers
+DOCUMENT_PROCESSING_CPU = "2"
+DOCUMENT_PROCESSING_MEMORY_REQUEST = "8Gi"
+DOCUMENT_PROCESSING_MEMORY_LIMIT = "16Gi"
+# Run the four SDG flows in one component that loads the seed data once.
+# The flows then run one after another in a single pod, at the concurrency of
+# one component, so the default runs each flow in its own parallel component
+SHARED_DOCUMENT_PASS = False
 
 
 @dsl.pipeline(
@@ -44,6 +66,8 @@ def convert_pipeline(
     icl_query1: str = "None",
     icl_query2: str = "None",
     icl_query3: str = "None",
+    artifact_format: str = "jsonl",
+    conversion_workers: int = 2,
     # Knowledge generation parameters
     model_name: str = "openai/gpt-oss-20b",
     api_key: str = "",
@@ -53,11 +77,22 @@ def convert_pipeline(
     number_of_summaries: int = 1,
     max_concurrency: int = 5,
     inference_timeout: int = 2500,
+    endpoint_max_in_flight: int = 16,
+    endpoint_max_tokens_per_second: int = 0,
+    generation_shard_size: int = 100,
+    llm_cache_max_size_gb: float = 10.0,
     # Knowledge Mixing parameters
     tokenizer_model_name: str = "Qwen/Qwen2.5-1.5B-Instruct",
+    tokenizer_revision: str = "main",
     cut_size: str = "1,5,10",
     qa_per_doc: int = 3,
     save_gpt_oss_format: bool = False,
+    streaming: bool = False,
+    sampling_seed: int = 42,
+    dedup: bool = False,
+    near_dup_threshold: float = 0.8,
+    packing_max_seq_len: int = 0,
+    token_count_workers: int = 4,
     # Model Training parameters
     student_model_name: str = "Qwen/Qwen2.5-1.5B-Instruct",
     training_resource_gpu_per_worker: int = 8,
@@ -83,83 +118,189 @@ def convert_pipeline(
         icl_query1=icl_query1,
         icl_query2=icl_query2,
         icl_query3=icl_query3,
+        artifact_format=artifact_format,
+        conversion_workers=conversion_workers,
+        cache_dir=DOCUMENT_CACHE_MOUNT_PATH if DOCUMENT_CACHE_PVC else "",
     )
+    # Not cached by KFP, since the sources can change behind the same URLs;
+    # unchanged sources are served from the document cache instead
     document_processing_task.set_caching_options(False)
+    document_processing_task.set_cpu_request(DOCUMENT_PROCESSING_CPU)
+    document_processing_task.set_memory_request(DOCUMENT_PROCESSING_MEMORY_REQUEST)
+    document_processing_task.set_memory_limit(DOCUMENT_PROCESSING_MEMORY_LIMIT)
+    if DOCUMENT_CACHE_PVC:
+        kfp.kubernetes.mount_pvc(
+            document_processing_task,
+            pvc_name=DOCUMENT_CACHE_PVC,
+            mount_path=DOCUMENT_CACHE_MOUNT_PATH,
+        )
 
     # Step 2: Knowledge Generation
     # Knowledge Generation - Generate 4 different types of datasets
-    detailed_summary_task = generate_detailed_summaries(
-        input_dataset=document_processing_task.outputs["output_path"],
-        model_name=model_name,
-        api_key=api_key,
-        api_base=api_base,
-        seed_data_subsample=seed_data_subsample,
-        enable_reasoning=enable_reasoning,
-        max_concurrency=max_concurrency,
-        inference_timeout=inference_timeout,
-        number_of_summaries=number_of_summaries,
-    )
-    detailed_summary_task.set_caching_options(False)
-
-    extractive_summary_task = generate_extractive_summaries(
-        input_dataset=document_processing_task.outputs["output_path"],
-        model_name=model_name,
-        api_key=api_key,
-        api_base=api_base,
-        seed_data_subsample=seed_data_subsample,
-        enable_reasoning=enable_reasoning,
-        number_of_summaries=number_of_summaries,
-        max_concurrency=max_concurrency,
-        inference_timeout=inference_timeout,
-    )
-    extractive_summary_task.set_caching_options(False)
-
-    key_facts_summary_task = generate_key_facts_summary(
-        input_dataset=document_processing_task.outputs["output_path"],
-        model_name=model_name,
-        api_key=api_key,
-        api_base=api_base,
-        seed_data_subsample=seed_data_subsample,
-        enable_reasoning=enable_reasoning,
-        max_concurrency=max_concurrency,
-        inference_timeout=inference_timeout,
-    )
-    key_facts_summary_task.set_caching_options(False)
-
-    document_based_qa_task = generate_document_based_qa(
-        input_dataset=document_processing_task.outputs["output_path"],
-        model_name=model_name,
-        api_key=api_key,
-        api_base=api_base,
-        seed_data_subsample=seed_data_subsample,
-        enable_reasoning=enable_reasoning,
-        max_concurrency=max_concurrency,
-        inference_timeout=inference_timeout,
-    )
-    document_based_qa_task.set_caching_options(False)
+    if SHARED_DOCUMENT_PASS:
+        knowledge_generation_task = generate_knowledge_datasets(
+            input_dataset=document_processing_task.outputs["output_path"],
+            model_name=model_name,
+            api_key=api_key,
+            api_base=api_base,
+            seed_data_subsample=seed_data_subsample,
+            enable_reasoning=enable_reasoning,
+            number_of_summaries=number_of_summaries,
+            max_concurrency=max_concurrency,
+            inference_timeout=inference_timeout,
+            artifact_format=artifact_format,
+            workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
+            endpoint_max_in_flight=endpoint_max_in_flight,
+            endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+            shard_size=generation_shard_size,
+            llm_cache_dir=LLM_CACHE_MOUNT_PATH if LLM_CACHE_PVC else "",
+            llm_cache_max_size_gb=llm_cache_max_size_gb,
+        )
+        knowledge_generation_task.set_caching_options(False)
+        knowledge_generation_task.set_retry(num_retries=GENERATION_RETRIES)
+        generation_tasks = [knowledge_generation_task]
+        generated_data = {
+            "extractive_data": knowledge_generation_task.outputs["extractive_output"],
+            "detailed_data": knowledge_generation_task.outputs["detailed_output"],
+            "key_facts_data": knowledge_generation_task.outputs["key_facts_output"],
+            "doc_qa_data": knowledge_generation_task.outputs["doc_qa_output"],
+        }
+    else:
+        detailed_summary_task = generate_detailed_summaries(
+            input_dataset=document_processing_task.outputs["output_path"],
+            model_name=model_name,
+            api_key=api_key,
+            api_base=api_base,
+            seed_data_subsample=seed_data_subsample,
+            enable_reasoning=enable_reasoning,
+            max_concurrency=max_concurrency,
+            inference_timeout=inference_timeout,
+            number_of_summaries=number_of_summaries,
+            artifact_format=artifact_format,
+            workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
+            endpoint_max_in_flight=endpoint_max_in_flight,
+            endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+            shard_size=generation_shard_size,
+            llm_cache_dir=LLM_CACHE_MOUNT_PATH if LLM_CACHE_PVC else "",
+            llm_cache_max_size_gb=llm_cache_max_size_gb,
+        )
+        detailed_summary_task.set_caching_options(False)
+        detailed_summary_task.set_retry(num_retries=GENERATION_RETRIES)
 
-    # Extractive summary is heavy on the inference server
-    # So its not feasible to parallize this process with the dataset
-    extractive_summary_task.after(
-        document_based_qa_task, detailed_summary_task, key_facts_summary_task
-    )
+        extractive_summary_task = generate_extractive_summaries(
+            input_dataset=document_processing_task.outputs["output_path"],
+            model_name=model_name,
+            api_key=api_key,
+            api_base=api_base,
+            seed_data_subsample=seed_data_subsample,
+            enable_reasoning=enable_reasoning,
+            number_of_summaries=number_of_summaries,
+            max_concurrency=max_concurrency,
+            inference_timeout=inference_timeout,
+            artifact_format=artifact_format,
+            workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
+            endpoint_max_in_flight=endpoint_max_in_flight,
+            endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+            shard_size=generation_shard_size,
+            llm_cache_dir=LLM_CACHE_MOUNT_PATH if LLM_CACHE_PVC else "",
+            llm_cache_max_size_gb=llm_cache_max_size_gb,
+        )
+        extractive_summary_task.set_caching_options(False)
+        extractive_summary_task.set_retry(num_retries=GENERATION_RETRIES)
+
+        key_facts_summary_task = generate_key_facts_summary(
+            input_dataset=document_processing_task.outputs["output_path"],
+            model_name=model_name,
+            api_key=api_key,
+            api_base=api_base,
+            seed_data_subsample=seed_data_subsample,
+            enable_reasoning=enable_reasoning,
+            max_concurrency=max_concurrency,
+            inference_timeout=inference_timeout,
+            artifact_format=artifact_format,
+            workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
+            endpoint_max_in_flight=endpoint_max_in_flight,
+            endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+            shard_size=generation_shard_size,
+            llm_cache_dir=LLM_CACHE_MOUNT_PATH if LLM_CACHE_PVC else "",
+            llm_cache_max_size_gb=llm_cache_max_size_gb,
+        )
+        key_facts_summary_task.set_caching_options(False)
+        key_facts_summary_task.set_retry(num_retries=GENERATION_RETRIES)
+
+        document_based_qa_task = generate_document_based_qa(
+            input_dataset=document_processing_task.outputs["output_path"],
+            model_name=model_name,
+            api_key=api_key,
+            api_base=api_base,
+            seed_data_subsample=seed_data_subsample,
+            enable_reasoning=enable_reasoning,
+            max_concurrency=max_concurrency,
+            inference_timeout=inference_timeout,
+            artifact_format=artifact_format,
+            workspace_path=dsl.WORKSPACE_PATH_PLACEHOLDER,
+            endpoint_max_in_flight=endpoint_max_in_flight,
+            endpoint_max_tokens_per_second=endpoint_max_tokens_per_second,
+            shard_size=generation_shard_size,
+            llm_cache_dir=LLM_CACHE_MOUNT_PATH if LLM_CACHE_PVC else "",
+            llm_cache_max_size_gb=llm_cache_max_size_gb,
+        )
+        document_based_qa_task.set_caching_options(False)
+        document_based_qa_task.set_retry(num_retries=GENERATION_RETRIES)
+
+        # The four flows run in parallel; the endpoint governor keeps their
+        # combined in-flight requests and tokens/sec under one budget on the
+        # workspace PVC
+        generation_tasks = [
+            detailed_summary_task,
+            extractive_summary_task,
+            key_facts_summary_task,
+            document_based_qa_task,
+        ]
+        generated_data = {
+            "extractive_data": extractive_summary_task.outputs["output_path"],
+            "detailed_data": detailed_summary_task.outputs["output_path"],
+            "key_facts_data": key_facts_summary_task.outputs["output_path"],
+            "doc_qa_data": document_based_qa_task.outputs["output_path"],
+        }
+
+    # Keep the LLM response cache on a PVC that outlives this run
+    if LLM_CACHE_PVC:
+        for generation_task in generation_tasks:
+            kfp.kubernetes.mount_pvc(
+                generation_task,
+                pvc_name=LLM_CACHE_PVC,
+                mount_path=LLM_CACHE_MOUNT_PATH,
+            )
 
     merged_dataset_task = merge_all_outputs_component(
-        extractive_data=extractive_summary_task.outputs["output_path"],
-        detailed_data=detailed_summary_task.outputs["output_path"],
-        key_facts_data=key_facts_summary_task.outputs["output_path"],
-        doc_qa_data=document_based_qa_task.outputs["output_path"],
+        **generated_data,
+        artifact_format=artifact_format,
     )
     merged_dataset_task.set_caching_options(False)
 
     # Step 3: Knowledge Mixing
+    # Download the tokenizer once per model and revision; cached across runs
+    tokenizer_task = download_tokenizer(
+        tokenizer_model_name=tokenizer_model_name,
+        revision=tokenizer_revision,
+    )
+    tokenizer_task.set_caching_options(True)
+
     # Knowledge Mixing
     knowledge_mixing_task = knowledge_mixing(
         datasets_path=merged_dataset_task.outputs["merged_output"],
+        tokenizer_path=tokenizer_task.outputs["output_path"],
         tokenizer_model_name=tokenizer_model_name,
         cut_size=cut_size,
         qa_per_doc=qa_per_doc,
         save_gpt_oss_format=save_gpt_oss_format,
+        streaming=streaming,
+        sampling_seed=sampling_seed,
+        dedup=dedup,
+        near_dup_threshold=near_dup_threshold,
+        packing_max_seq_len=packing_max_seq_len,
+        token_count_workers=token_count_workers,
     )
     knowledge_mixing_task.set_caching_options(False)
 
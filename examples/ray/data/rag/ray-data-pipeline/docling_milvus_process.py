@@ -51,6 +51,17 @@ DROP_EXISTING_COLLECTION = (
     os.environ.get("DROP_EXISTING_COLLECTION", "true").lower() == "true"
 )
 
+# Vector index: FLAT, IVF_FLAT, IVF_SQ8, IVF_PQ, HNSW or DISKANN.
+# MILVUS_INDEX_PARAMS_JSON overrides the per-type build defaults below.
+MILVUS_INDEX_TYPE = os.environ.get("MILVUS_INDEX_TYPE", "IVF_FLAT").upper()
+MILVUS_METRIC_TYPE = os.environ.get("MILVUS_METRIC_TYPE", "COSINE").upper()
+MILVUS_INDEX_PARAMS_JSON = os.environ.get("MILVUS_INDEX_PARAMS_JSON", "{}")
+# "none" searches the float32 vectors directly; "int8", "binary" or "mrl"
+# (Matryoshka-truncated to MILVUS_MRL_DIM) searches a smaller ANN field and
+# rescores the candidates with the float32 vectors, which stay memory-mapped.
+MILVUS_VECTOR_QUANT = os.environ.get("MILVUS_VECTOR_QUANT", "none").lower()
+MILVUS_MRL_DIM = int(os.environ.get("MILVUS_MRL_DIM", "256"))
+
 # Embedding mode: "local" (sentence-transformers, CPU) or "service" (vLLM, GPU)
 EMBEDDING_MODE = os.environ.get("EMBEDDING_MODE", "service")
 EMBEDDING_MODEL = os.environ.get(
@@ -404,6 +415,7 @@ class MilvusWriteActor:
         chunk_sizes = list(batch.get("chunk_size_chars", [0] * len(texts)))
         embeddings = list(batch["embedding"])
         batch_size = len(texts)
+        quantized = MILVUS_VECTOR_QUANT != "none"
 
         t0 = time.time()
         inserted = 0
@@ -424,12 +436,17 @@ class MilvusWriteActor:
                     )
                     tx = tx[:MILVUS_TEXT_MAX_CHARS]
                     batch_truncated += 1
-                data.append({
+                row = {
                     "source_file": str(source_files[j]),
                     "chunk_index": int(chunk_indices[j]),
                     "text": tx,
                     "embedding": list(embeddings[j]),
-                })
+                }
+                if quantized:
+                    row[ANN_FIELD] = quantize_embedding(
+                        embeddings[j], MILVUS_VECTOR_QUANT, MILVUS_MRL_DIM
+                    )
+                data.append(row)
 
             for attempt in range(3):
                 try:
@@ -487,6 +504,121 @@ class MilvusWriteActor:
 # Milvus collection setup
 # ---------------------------------------------------------------------------
 
+# Build-time defaults per index type. This file ships alone in the RayJob
+# working_dir, so keep it in sync with INDEX_BUILD_DEFAULTS in rag_helpers.py.
+INDEX_BUILD_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 128},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "DISKANN": {},
+}
+
+
+# Quantized ANN field (keep in sync with ANN_FIELD / quantize_embedding in
+# rag_helpers.py, which must encode queries exactly the same way).
+ANN_FIELD = "embedding_ann"
+VECTOR_QUANT_MODES = ("none", "int8", "binary", "mrl")
+
+
+def quantize_embedding(vec, mode: str, mrl_dim: int):
+    """Encode one normalized embedding for the quantized ANN field.
+
+    int8 uses per-vector absmax scaling, which cosine similarity ignores;
+    binary keeps the sign bits (Hamming distance); mrl keeps the first
+    ``mrl_dim`` dimensions, renormalized.
+    """
+    import numpy as np
+
+    v = np.asarray(vec, dtype=np.float32)
+    if mode == "int8":
+        scale = 127.0 / max(float(np.abs(v).max()), 1e-12)
+        return np.rint(v * scale).astype(np.int8)
+    if mode == "binary":
+        return np.packbits(v > 0).tobytes()
+    if mode == "mrl":
+        head = v[:mrl_dim]
+        return (head / max(float(np.linalg.norm(head)), 1e-12)).tolist()
+    raise ValueError(f"Unknown vector quantization mode: {mode!r}")
+
+
+def _index_spec(dim: int = EMBEDDING_DIM) -> Dict[str, Any]:
+    """Resolve the vector index spec from MILVUS_INDEX_* environment variables."""
+    if MILVUS_INDEX_TYPE not in INDEX_BUILD_DEFAULTS:
+        raise ValueError(
+            f"MILVUS_INDEX_TYPE must be one of {sorted(INDEX_BUILD_DEFAULTS)}, "
+            f"got: {MILVUS_INDEX_TYPE!r}"
+        )
+    try:
+        overrides = json.loads(MILVUS_INDEX_PARAMS_JSON)
+    except json.JSONDecodeError as exc:
+        raise ValueError(
+            f"MILVUS_INDEX_PARAMS_JSON is not valid JSON: {MILVUS_INDEX_PARAMS_JSON!r}"
+        ) from exc
+
+    params = {**INDEX_BUILD_DEFAULTS[MILVUS_INDEX_TYPE], **overrides}
+    if MILVUS_INDEX_TYPE == "IVF_PQ" and dim % int(params["m"]):
+        raise ValueError(
+            f"IVF_PQ requires the vector dim ({dim}) to be divisible "
+            f"by m ({params['m']})"
+        )
+    return {
+        "index_type": MILVUS_INDEX_TYPE,
+        "metric_type": MILVUS_METRIC_TYPE,
+        "params": params,
+    }
+
+
+def _ann_field_spec() -> Dict[str, Any] | None:
+    """Resolve the quantized ANN field from MILVUS_VECTOR_QUANT, or None.
+
+    Milvus indexes INT8_VECTOR with HNSW only and BINARY_VECTOR with BIN_*
+    indexes, so MILVUS_INDEX_TYPE applies to the "mrl" field alone.
+    """
+    if MILVUS_VECTOR_QUANT not in VECTOR_QUANT_MODES:
+        raise ValueError(
+            f"MILVUS_VECTOR_QUANT must be one of {list(VECTOR_QUANT_MODES)}, "
+            f"got: {MILVUS_VECTOR_QUANT!r}"
+        )
+    if MILVUS_VECTOR_QUANT == "none":
+        return None
+    if MILVUS_VECTOR_QUANT == "int8":
+        return {
+            "dtype": "INT8_VECTOR",
+            "dim": EMBEDDING_DIM,
+            "index": {
+                "index_type": "HNSW",
+                "metric_type": "COSINE",
+                "params": INDEX_BUILD_DEFAULTS["HNSW"],
+            },
+        }
+    if MILVUS_VECTOR_QUANT == "binary":
+        if EMBEDDING_DIM % 8:
+            raise ValueError(
+                f"binary quantization needs EMBEDDING_DIM ({EMBEDDING_DIM}) "
+                "divisible by 8"
+            )
+        return {
+            "dtype": "BINARY_VECTOR",
+            "dim": EMBEDDING_DIM,
+            "index": {
+                "index_type": "BIN_IVF_FLAT",
+                "metric_type": "HAMMING",
+                "params": {"nlist": 128},
+            },
+        }
+    if not 0 < MILVUS_MRL_DIM < EMBEDDING_DIM:
+        raise ValueError(
+            f"MILVUS_MRL_DIM must be between 1 and EMBEDDING_DIM ({EMBEDDING_DIM}), "
+            f"got: {MILVUS_MRL_DIM}"
+        )
+    return {
+        "dtype": "FLOAT_VECTOR",
+        "dim": MILVUS_MRL_DIM,
+        "index": _index_spec(MILVUS_MRL_DIM),
+    }
+
 
 def setup_milvus_collection():
     """Create or recreate the Milvus collection with vector index."""
@@ -505,32 +637,49 @@ def setup_milvus_collection():
                 f"or use a different MILVUS_COLLECTION name."
             )
 
-    schema = CollectionSchema(
-        fields=[
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="source_file", dtype=DataType.VARCHAR, max_length=512),
-            FieldSchema(name="chunk_index", dtype=DataType.INT64),
+    ann = _ann_field_spec()
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+        FieldSchema(name="source_file", dtype=DataType.VARCHAR, max_length=512),
+        FieldSchema(name="chunk_index", dtype=DataType.INT64),
+        FieldSchema(
+            name="text", dtype=DataType.VARCHAR, max_length=MILVUS_TEXT_MAX_CHARS
+        ),
+        # With a quantized ANN field the float32 vectors are only read back
+        # for rescoring, so memory-map them instead of holding them in RAM.
+        FieldSchema(
+            name="embedding",
+            dtype=DataType.FLOAT_VECTOR,
+            dim=EMBEDDING_DIM,
+            **({"mmap_enabled": True} if ann else {}),
+        ),
+    ]
+    if ann:
+        fields.append(
             FieldSchema(
-                name="text", dtype=DataType.VARCHAR, max_length=MILVUS_TEXT_MAX_CHARS
-            ),
-            FieldSchema(
-                name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM
-            ),
-        ],
-        description="RAG document chunks",
-    )
+                name=ANN_FIELD, dtype=getattr(DataType, ann["dtype"]), dim=ann["dim"]
+            )
+        )
+    schema = CollectionSchema(fields=fields, description="RAG document chunks")
     client.create_collection(collection_name=COLLECTION_NAME, schema=schema)
 
+    # Every vector field needs an index before the collection can load.
+    spec = ann["index"] if ann else _index_spec()
     index_params = client.prepare_index_params()
-    index_params.add_index(
-        field_name="embedding",
-        index_type="IVF_FLAT",
-        metric_type="COSINE",
-        params={"nlist": 128},
-    )
+    if ann:
+        index_params.add_index(field_name=ANN_FIELD, **spec)
+        index_params.add_index(
+            field_name="embedding", index_type="FLAT", metric_type="COSINE"
+        )
+    else:
+        index_params.add_index(field_name="embedding", **spec)
     client.create_index(collection_name=COLLECTION_NAME, index_params=index_params)
 
-    print(f"Collection '{COLLECTION_NAME}' created (dim={EMBEDDING_DIM})")
+    quant = f", {MILVUS_VECTOR_QUANT} ANN field dim={ann['dim']}" if ann else ""
+    print(
+        f"Collection '{COLLECTION_NAME}' created (dim={EMBEDDING_DIM}{quant}, "
+        f"index={spec['index_type']} {spec['params']})"
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -811,6 +960,8 @@ def _build_metrics(
         "min_chunk_size_chars": int(min_chunk),
         "max_chunk_size_chars": int(max_chunk),
         "embedding_dim": int(EMBEDDING_DIM),
+        "milvus_index_type": str(MILVUS_INDEX_TYPE),
+        "milvus_vector_quant": str(MILVUS_VECTOR_QUANT),
         "total_docs_skipped": int(total_docs_skipped),
         "total_docs_failed": int(total_docs_failed),
     }
@@ -858,6 +1009,9 @@ def _print_report(metrics: Dict[str, Any]):
     else:
         print(f"ST embed:        {NUM_EMBEDDING_ACTORS} actors (CPU)")
     print(f"Milvus actors:   {metrics['num_milvus_actors']} x 1 CPU")
+    print(f"Milvus index:    {metrics['milvus_index_type']}")
+    if metrics["milvus_vector_quant"] != "none":
+        print(f"Vector quant:    {metrics['milvus_vector_quant']} + float32 rescoring")
     print("-" * 60)
     print(f"Documents:       {metrics['total_documents']}")
     if metrics.get("total_docs_skipped") or metrics.get("total_docs_failed"):
@@ -927,6 +1081,9 @@ def run():
             f"EMBEDDING_MODE must be 'local' or 'service', got: {EMBEDDING_MODE!r}"
         )
     print(f"Embedding mode: {EMBEDDING_MODE} ({EMBEDDING_MODEL}, dim={EMBEDDING_DIM})")
+    # Fail fast on a bad index config before any PDFs are parsed.
+    _index_spec()
+    _ann_field_spec()
 
     _configure_ray_context()
 
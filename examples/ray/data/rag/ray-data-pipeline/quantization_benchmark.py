@@ -0,0 +1,196 @@
+"""Recall / latency / memory comparison for quantized ANN vectors.
+
+Encodes a corpus with each ``MILVUS_VECTOR_QUANT`` mode using the same
+``quantize_embedding`` the query side uses, searches the quantized vectors
+exhaustively (so index approximation does not blur the quantization error),
+then rescores the top ``k * rescore_factor`` candidates with the float32
+vectors, exactly like ``search_milvus`` does.  Reported per mode:
+
+  - recall@k of the quantized search alone and after float32 rescoring,
+    against exact float32 cosine ground truth;
+  - p50/p95 query latency including rescoring;
+  - bytes per vector for the ANN field and the projected ANN memory.
+
+Runs locally with numpy only (Milvus Lite has no INT8/BINARY vector types)::
+
+    python quantization_benchmark.py --embeddings chunks.npy --mrl-dims 128,256
+
+Use real chunk embeddings: sign bits and Matryoshka prefixes only work well
+on embeddings from models trained for them, which synthetic data cannot show.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from index_tuning import brute_force_topk, load_vectors, recall_at_k
+from rag_helpers import VECTOR_QUANT_MODES, quantize_embedding
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def _encode(base: np.ndarray, mode: str, mrl_dim: int) -> np.ndarray:
+    rows = [quantize_embedding(v, mode, mrl_dim) for v in base]
+    if mode == "binary":
+        return np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(base), -1)
+    return np.asarray(rows, dtype=np.int8 if mode == "int8" else np.float32)
+
+
+def _query_code(q: np.ndarray, mode: str, mrl_dim: int) -> np.ndarray:
+    if mode == "none":
+        return q
+    code = quantize_embedding(q, mode, mrl_dim)
+    if mode == "binary":
+        return np.frombuffer(code, dtype=np.uint8)
+    return np.asarray(code)
+
+
+def _scorer(codes: np.ndarray, mode: str):
+    """Return ``score(query_code) -> similarity per row`` (higher is better)."""
+    if mode == "binary":
+        return lambda q: -_POPCOUNT[np.bitwise_xor(codes, q)].sum(axis=1)
+    if mode == "int8":
+        # Milvus COSINE on INT8_VECTOR normalizes both sides.
+        as_float = codes.astype(np.float32)
+        norms = np.maximum(np.linalg.norm(as_float, axis=1), 1e-12)
+        return lambda q: (as_float @ q.astype(np.float32)) / norms
+    return lambda q: codes @ q.astype(np.float32)
+
+
+def _top(scores: np.ndarray, n: int) -> np.ndarray:
+    n = min(n, len(scores))
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top])]
+
+
+def evaluate_mode(
+    base: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    mode: str,
+    k: int,
+    rescore_factor: int,
+    mrl_dim: int = 0,
+) -> Dict[str, Any]:
+    """Quantized search + float32 rescoring for one mode."""
+    t0 = time.perf_counter()
+    codes = base if mode == "none" else _encode(base, mode, mrl_dim)
+    encode_s = time.perf_counter() - t0
+    score = _scorer(codes, mode)
+
+    ann_found, rescored, latencies = [], [], []
+    for q in queries:
+        t = time.perf_counter()
+        candidates = _top(score(_query_code(q, mode, mrl_dim)), k * rescore_factor)
+        found = candidates[_top(base[candidates] @ q, k)]
+        latencies.append(time.perf_counter() - t)
+        ann_found.append(candidates[:k].tolist())
+        rescored.append(found.tolist())
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "mode": f"mrl-{mrl_dim}" if mode == "mrl" else mode,
+        "bytes_per_vector": int(codes[0].nbytes),
+        "ann_memory_mb": round(codes.nbytes / 2**20, 1),
+        f"recall@{k}_ann": round(recall_at_k(ann_found, truth, k), 4),
+        f"recall@{k}_rescored": round(recall_at_k(rescored, truth, k), 4),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 3),
+        "encode_s": round(encode_s, 2),
+    }
+
+
+def print_table(results: List[Dict[str, Any]], k: int, project_rows: int):
+    fp32 = results[0]["bytes_per_vector"]
+    print(
+        f"{'Mode':<10} {'B/vec':>6} {'x smaller':>9} {f'R@{k} ANN':>9} "
+        f"{f'R@{k} resc':>10} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{f'GB @ {project_rows:,}':>14}"
+    )
+    print(
+        f"{'─' * 10} {'─' * 6} {'─' * 9} {'─' * 9} {'─' * 10} {'─' * 8} {'─' * 8} {'─' * 14}"
+    )
+    for r in results:
+        print(
+            f"{r['mode']:<10} {r['bytes_per_vector']:>6} "
+            f"{fp32 / r['bytes_per_vector']:>9.1f} {r[f'recall@{k}_ann']:>9.4f} "
+            f"{r[f'recall@{k}_rescored']:>10.4f} {r['p50_ms']:>8.3f} "
+            f"{r['p95_ms']:>8.3f} "
+            f"{r['bytes_per_vector'] * project_rows / 1e9:>14.2f}"
+        )
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--embeddings", help=".npy matrix of corpus embeddings")
+    parser.add_argument("--num-vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--modes", default="none,int8,binary,mrl")
+    parser.add_argument("--mrl-dims", type=_int_list, default=[256])
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument(
+        "--project-rows",
+        type=int,
+        default=10_000_000,
+        help="Collection size for the projected ANN memory column",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    modes = [m.strip().lower() for m in args.modes.split(",")]
+    unknown = set(modes) - set(VECTOR_QUANT_MODES)
+    if unknown:
+        parser.error(f"unknown modes: {sorted(unknown)}")
+
+    base, queries = load_vectors(
+        args.embeddings, args.num_vectors, args.dim, args.num_queries, args.seed
+    )
+    print(f"Corpus: {base.shape[0]} x {base.shape[1]}, queries: {len(queries)}")
+    truth = brute_force_topk(base, queries, args.top_k)
+
+    # float32 baseline for the size ratio, run first and only once
+    modes = ["none"] + [mode for mode in modes if mode != "none"]
+    results = []
+    for mode in modes:
+        for mrl_dim in args.mrl_dims if mode == "mrl" else [0]:
+            results.append(
+                evaluate_mode(
+                    base,
+                    queries,
+                    truth,
+                    mode,
+                    args.top_k,
+                    args.rescore_factor,
+                    mrl_dim,
+                )
+            )
+    print_table(results, args.top_k, args.project_rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "num_vectors": int(base.shape[0]),
+                    "dim": int(base.shape[1]),
+                    "num_queries": len(queries),
+                    "top_k": args.top_k,
+                    "rescore_factor": args.rescore_factor,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,46 @@ Import with: ``from rag_helpers import ask_llm, search_milvus, build_context``
 
 import json
 import logging
+import os
+import re
 import subprocess
 import time
+from collections import OrderedDict
 
 logger = logging.getLogger("rag-query")
 
+# Build-time defaults per index type (mirrors docling_milvus_process.py).
+INDEX_BUILD_DEFAULTS: dict[str, dict] = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 128},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "DISKANN": {},
+}
+
+# Search-time defaults per index type. Use index_tuning.py to pick values
+# that hit your recall target at the collection size you actually run.
+SEARCH_PARAM_DEFAULTS: dict[str, dict] = {
+    "FLAT": {},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 32},
+    "IVF_PQ": {"nprobe": 32},
+    "HNSW": {"ef": 64},
+    "DISKANN": {"search_list": 100},
+}
+
+# Quantized ANN field written when ingestion runs with MILVUS_VECTOR_QUANT
+# (mirrors docling_milvus_process.py; queries must be encoded the same way).
+ANN_FIELD = "embedding_ann"
+VECTOR_QUANT_MODES = ("none", "int8", "binary", "mrl")
+
+# Context tokens that fit the default vLLM deployment: max_model_len=4096 minus
+# ask_llm's max_tokens=1024 for the answer and ~500 for instructions + question.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2560
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
 
 # ---------------------------------------------------------------------------
 # KServe deployment helpers
@@ -236,6 +271,65 @@ def ask_llm(question: str, *, llm, model_name: str, context: str = "") -> str:
     return answer
 
 
+def search_params_for_index(
+    index_type: str | None = None, top_k: int = 0, **overrides
+) -> dict:
+    """Return Milvus ``search_params`` for an index type.
+
+    ``index_type`` defaults to the ``MILVUS_INDEX_TYPE`` environment variable
+    (``IVF_FLAT`` if unset) and ``MILVUS_SEARCH_PARAMS_JSON`` is merged on top
+    of the per-type defaults, so the query side follows the same environment
+    as ingestion.  Keyword ``overrides`` (e.g. ``nprobe=64``) win over both.
+    """
+    index_type = (index_type or os.environ.get("MILVUS_INDEX_TYPE", "IVF_FLAT")).upper()
+    if index_type not in SEARCH_PARAM_DEFAULTS:
+        raise ValueError(
+            f"Unknown index type {index_type!r}; expected one of "
+            f"{sorted(SEARCH_PARAM_DEFAULTS)}"
+        )
+    params = {
+        **SEARCH_PARAM_DEFAULTS[index_type],
+        **json.loads(os.environ.get("MILVUS_SEARCH_PARAMS_JSON", "{}")),
+        **overrides,
+    }
+    # HNSW and DiskANN cannot return more hits than their candidate list.
+    for key in ("ef", "search_list"):
+        if key in params:
+            params[key] = max(int(params[key]), top_k)
+    metric = os.environ.get("MILVUS_METRIC_TYPE", "COSINE").upper()
+    return {"metric_type": metric, "params": params}
+
+
+def quantize_embedding(vec, mode: str, mrl_dim: int = 256):
+    """Encode one normalized embedding for the quantized ANN field.
+
+    int8 uses per-vector absmax scaling, which cosine similarity ignores;
+    binary keeps the sign bits (Hamming distance); mrl keeps the first
+    ``mrl_dim`` dimensions, renormalized.
+    """
+    import numpy as np
+
+    v = np.asarray(vec, dtype=np.float32)
+    if mode == "int8":
+        scale = 127.0 / max(float(np.abs(v).max()), 1e-12)
+        return np.rint(v * scale).astype(np.int8)
+    if mode == "binary":
+        return np.packbits(v > 0).tobytes()
+    if mode == "mrl":
+        head = v[:mrl_dim]
+        return (head / max(float(np.linalg.norm(head)), 1e-12)).tolist()
+    raise ValueError(f"Unknown vector quantization mode: {mode!r}")
+
+
+def _ann_search_params(vector_quant: str, index_type: str | None, limit: int) -> dict:
+    """Search params for the quantized ANN field (see ``_ann_field_spec``)."""
+    if vector_quant == "int8":
+        return search_params_for_index("HNSW", top_k=limit)
+    if vector_quant == "binary":
+        return {"metric_type": "HAMMING", "params": {"nprobe": 16}}
+    return search_params_for_index(index_type, top_k=limit)
+
+
 def search_milvus(
     question: str,
     *,
@@ -244,17 +338,51 @@ def search_milvus(
     collection_name: str,
     top_k: int = 5,
     score_threshold: float = 0.5,
+    index_type: str | None = None,
+    search_params: dict | None = None,
+    vector_quant: str | None = None,
+    rescore_factor: int = 4,
 ) -> list:
-    """Embed the question and search Milvus for similar chunks."""
-    query_embedding = embed_model.encode([question], normalize_embeddings=True).tolist()
+    """Embed the question and search Milvus for similar chunks.
+
+    ``search_params`` defaults to :func:`search_params_for_index` for
+    ``index_type`` (or ``MILVUS_INDEX_TYPE`` from the environment).
+
+    ``vector_quant`` (default ``MILVUS_VECTOR_QUANT``, else ``"none"``) must
+    match ingestion. When it is ``int8``, ``binary`` or ``mrl``, the quantized
+    ANN field returns ``top_k * rescore_factor`` candidates, which are
+    rescored by exact cosine similarity against their float32 vectors.
+    """
+    vector_quant = (
+        vector_quant or os.environ.get("MILVUS_VECTOR_QUANT", "none")
+    ).lower()
+    if vector_quant not in VECTOR_QUANT_MODES:
+        raise ValueError(
+            f"Unknown vector quantization {vector_quant!r}; expected one of "
+            f"{list(VECTOR_QUANT_MODES)}"
+        )
+    query_embedding = embed_model.encode([question], normalize_embeddings=True)
+    output_fields = ["source_file", "chunk_index", "text"]
+    if vector_quant == "none":
+        anns_field, limit, data = "embedding", top_k, query_embedding.tolist()
+        if search_params is None:
+            search_params = search_params_for_index(index_type, top_k=top_k)
+    else:
+        mrl_dim = int(os.environ.get("MILVUS_MRL_DIM", "256"))
+        anns_field, limit = ANN_FIELD, top_k * rescore_factor
+        data = [quantize_embedding(query_embedding[0], vector_quant, mrl_dim)]
+        output_fields.append("embedding")
+        if search_params is None:
+            search_params = _ann_search_params(vector_quant, index_type, limit)
 
     try:
         results = milvus.search(
             collection_name=collection_name,
-            data=query_embedding,
-            limit=top_k,
-            output_fields=["source_file", "chunk_index", "text"],
-            search_params={"metric_type": "COSINE", "params": {"nprobe": 16}},
+            data=data,
+            anns_field=anns_field,
+            limit=limit,
+            output_fields=output_fields,
+            search_params=search_params,
         )
     except Exception as exc:
         logger.error("Milvus search failed: %s", exc)
@@ -269,6 +397,14 @@ def search_milvus(
                 "chunk_index": hit["entity"]["chunk_index"],
                 "score": hit["distance"],
             })
+            if vector_quant != "none":
+                # Both sides are unit-norm, so the dot product is the cosine.
+                contexts[-1]["score"] = float(
+                    query_embedding[0] @ hit["entity"]["embedding"]
+                )
+    if vector_quant != "none":
+        contexts.sort(key=lambda c: c["score"], reverse=True)
+        contexts = contexts[:top_k]
 
     total = len(contexts)
     # pymilvus COSINE returns similarity (higher = more similar); >= keeps strong matches.
@@ -281,13 +417,303 @@ def search_milvus(
     return contexts
 
 
+def count_tokens(text: str, tokenizer=None) -> int:
+    """Count tokens with a HF tokenizer, or estimate ~4 chars/token without one."""
+    if tokenizer is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class CrossEncoderReranker:
+    """Score (question, chunk) pairs with a small cross-encoder on CPU.
+
+    Pairs are scored in batches and kept in a bounded LRU cache, so repeated
+    questions (or the same chunk retrieved for a re-asked question) cost
+    nothing the second time.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        *,
+        batch_size: int = 32,
+        cache_size: int = 10_000,
+        device: str = "cpu",
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device=device)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def score(self, question: str, texts: list[str]) -> list[float]:
+        """Return one relevance score per text (higher = more relevant)."""
+        keys = [(question, t) for t in texts]
+        found = {k: self._cache[k] for k in keys if k in self._cache}
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        self.cache_hits += len(keys) - len(missing)
+        self.cache_misses += len(missing)
+
+        if missing:
+            scores = self.model.predict(
+                missing, batch_size=self.batch_size, show_progress_bar=False
+            )
+            found.update(zip(missing, map(float, scores), strict=True))
+
+        for key in found:
+            self._cache[key] = found[key]
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return [found[k] for k in keys]
+
+    def rerank(self, question: str, chunks: list, keep_k: int) -> list:
+        """Return the ``keep_k`` best chunks, each with a ``rerank_score``."""
+        scores = self.score(question, [c["text"] for c in chunks])
+        ranked = sorted(
+            ({**c, "rerank_score": s} for c, s in zip(chunks, scores, strict=True)),
+            key=lambda c: c["rerank_score"],
+            reverse=True,
+        )
+        return ranked[:keep_k]
+
+
+def search_and_rerank(
+    question: str,
+    *,
+    milvus,
+    embed_model,
+    collection_name: str,
+    reranker: CrossEncoderReranker,
+    fetch_k: int = 20,
+    keep_k: int = 5,
+    score_threshold: float = 0.3,
+    tokenizer=None,
+    index_type: str | None = None,
+    vector_quant: str | None = None,
+) -> tuple[list, dict]:
+    """Over-fetch ``fetch_k`` candidates, rerank, and keep the best ``keep_k``.
+
+    The cosine ``score_threshold`` is looser than :func:`search_milvus`'s
+    default because the cross-encoder, not raw similarity, decides what
+    reaches the prompt.  Returns ``(chunks, stats)``; ``stats`` reports the
+    latency the rerank stage added and the prompt tokens saved compared with
+    sending every fetched candidate.
+    """
+    candidates = search_milvus(
+        question,
+        milvus=milvus,
+        embed_model=embed_model,
+        collection_name=collection_name,
+        top_k=fetch_k,
+        score_threshold=score_threshold,
+        index_type=index_type,
+        vector_quant=vector_quant,
+    )
+
+    t0 = time.perf_counter()
+    kept = reranker.rerank(question, candidates, keep_k)
+    rerank_ms = (time.perf_counter() - t0) * 1000
+
+    candidate_tokens = sum(count_tokens(c["text"], tokenizer) for c in candidates)
+    kept_tokens = sum(count_tokens(c["text"], tokenizer) for c in kept)
+    stats = {
+        "fetch_k": fetch_k,
+        "keep_k": keep_k,
+        "candidates": len(candidates),
+        "kept": len(kept),
+        "rerank_ms": round(rerank_ms, 1),
+        "candidate_tokens": candidate_tokens,
+        "context_tokens": kept_tokens,
+        "tokens_saved": candidate_tokens - kept_tokens,
+        "cache_hit_rate": round(
+            reranker.cache_hits / max(1, reranker.cache_hits + reranker.cache_misses),
+            3,
+        ),
+    }
+    logger.info(
+        "Rerank: %d -> %d chunks in %.1f ms, %d prompt tokens saved",
+        len(candidates),
+        len(kept),
+        rerank_ms,
+        stats["tokens_saved"],
+    )
+    return kept, stats
+
+
+def _chunk_label(c: dict) -> str:
+    """``chunk 7`` or ``chunks 7-9`` for a merged run of neighbors."""
+    end = c.get("chunk_end", c["chunk_index"])
+    if end == c["chunk_index"]:
+        return f"chunk {c['chunk_index']}"
+    return f"chunks {c['chunk_index']}-{end}"
+
+
+def _format_chunk(i: int, c: dict) -> str:
+    return (
+        f"[{i}] ({c['source_file']}, {_chunk_label(c)}, "
+        f"score: {c['score']:.3f})\n{c['text']}"
+    )
+
+
 def build_context(chunks: list) -> str:
     """Format retrieved chunks with numbered references for citation."""
-    return "\n\n---\n\n".join(
-        f"[{i}] ({c['source_file']}, chunk {c['chunk_index']}, "
-        f"score: {c['score']:.3f})\n{c['text']}"
-        for i, c in enumerate(chunks, 1)
+    return "\n\n---\n\n".join(_format_chunk(i, c) for i, c in enumerate(chunks, 1))
+
+
+def merge_adjacent_chunks(chunks: list) -> list:
+    """Merge retrieved chunks that are consecutive in the same source file.
+
+    HybridChunker does not overlap chunks, so neighbors are joined verbatim.
+    A merged chunk keeps the best member's score and spans
+    ``chunk_index``..``chunk_end``.
+    """
+    by_source: dict[str, list] = {}
+    for c in chunks:
+        by_source.setdefault(c["source_file"], []).append(c)
+
+    merged = []
+    for group in by_source.values():
+        group.sort(key=lambda c: c["chunk_index"])
+        run = [group[0]]
+        for c in group[1:]:
+            if c["chunk_index"] == run[-1]["chunk_index"] + 1:
+                run.append(c)
+            elif c["chunk_index"] != run[-1]["chunk_index"]:
+                merged.append(_merge_run(run))
+                run = [c]
+        merged.append(_merge_run(run))
+    return merged
+
+
+def _merge_run(run: list) -> dict:
+    if len(run) == 1:
+        return dict(run[0])
+    best = max(run, key=_pack_score)
+    return {
+        **best,
+        "text": "\n\n".join(c["text"] for c in run),
+        "chunk_index": run[0]["chunk_index"],
+        "chunk_end": run[-1]["chunk_index"],
+    }
+
+
+def _pack_score(c: dict) -> float:
+    return c.get("rerank_score", c["score"])
+
+
+def trim_to_sentences(text: str, max_tokens: int, tokenizer=None) -> str:
+    """Return the longest prefix of ``text`` that ends on a sentence boundary
+    and fits in ``max_tokens``, or ``""`` if not even one sentence fits."""
+    kept: list[str] = []
+    used = 0
+    pos = 0
+    for match in [*_SENTENCE_END.finditer(text), None]:
+        end = match.start() if match else len(text)
+        sentence = text[pos:end]
+        pos = match.end() if match else len(text)
+        if not sentence.strip():
+            continue
+        # +1 approximates the whitespace token lost when sentences are split.
+        cost = count_tokens(sentence, tokenizer) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+    trimmed = " ".join(s.strip() for s in kept)
+    # Sentence-wise counts are an estimate; shave until the real count fits.
+    while kept and count_tokens(trimmed, tokenizer) > max_tokens:
+        kept.pop()
+        trimmed = " ".join(s.strip() for s in kept)
+    return trimmed
+
+
+def pack_context(
+    chunks: list,
+    *,
+    token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+    tokenizer=None,
+    min_trim_tokens: int = 48,
+) -> tuple[str, list, dict]:
+    """Build a citation-numbered context that fits in ``token_budget`` tokens.
+
+    Adjacent chunks from the same file are merged first, then whole chunks
+    are packed greedily by score (``rerank_score`` when present). A chunk
+    that does not fit is trimmed at a sentence boundary if at least
+    ``min_trim_tokens`` remain, otherwise skipped in favor of smaller ones.
+    Pass the LLM's HF tokenizer for exact counts; without one, counts are
+    estimated at ~4 chars/token.
+
+    Returns ``(context, packed_chunks, stats)``. ``packed_chunks`` are in
+    citation order, so pass them to :func:`print_comparison`.
+    """
+    separator_tokens = count_tokens("\n\n---\n\n", tokenizer)
+    units = sorted(merge_adjacent_chunks(chunks), key=_pack_score, reverse=True)
+
+    packed: list = []
+    used = 0
+    trimmed = dropped = 0
+    for unit in units:
+        header_tokens = count_tokens(
+            _format_chunk(len(packed) + 1, {**unit, "text": ""}), tokenizer
+        )
+        overhead = header_tokens + (separator_tokens if packed else 0)
+        room = token_budget - used - overhead
+        text_tokens = count_tokens(unit["text"], tokenizer)
+        if text_tokens <= room:
+            packed.append(unit)
+            used += overhead + text_tokens
+            continue
+        text = (
+            trim_to_sentences(unit["text"], room, tokenizer)
+            if room >= min_trim_tokens
+            else ""
+        )
+        if not text:
+            dropped += 1
+            continue
+        packed.append({**unit, "text": text, "trimmed": True})
+        used += overhead + count_tokens(text, tokenizer)
+        trimmed += 1
+
+    # Per-piece counts can drift from the joined text's count by a few tokens
+    # at the seams; shave the lowest-ranked chunk until the real count fits.
+    context = build_context(packed)
+    while packed and (over := count_tokens(context, tokenizer) - token_budget) > 0:
+        last = packed.pop()
+        text = trim_to_sentences(
+            last["text"], count_tokens(last["text"], tokenizer) - over, tokenizer
+        )
+        if text:
+            packed.append({**last, "text": text, "trimmed": True})
+            trimmed += not last.get("trimmed")
+        else:
+            dropped += 1
+            trimmed -= bool(last.get("trimmed"))
+        context = build_context(packed)
+    stats = {
+        "token_budget": token_budget,
+        "context_tokens": count_tokens(context, tokenizer),
+        "input_tokens": sum(count_tokens(c["text"], tokenizer) for c in chunks),
+        "chunks_in": len(chunks),
+        "chunks_packed": len(packed),
+        "merged": len(chunks) - len(units),
+        "trimmed": trimmed,
+        "dropped": dropped,
+    }
+    logger.info(
+        "Context: %d/%d tokens, %d chunks packed (%d merged, %d trimmed, %d dropped)",
+        stats["context_tokens"],
+        token_budget,
+        len(packed),
+        stats["merged"],
+        trimmed,
+        dropped,
     )
+    return context, packed, stats
 
 
 def print_comparison(
@@ -303,5 +729,5 @@ def print_comparison(
     print(f"\n{sep}\n  SOURCES\n{sep}\n")
     for i, c in enumerate(chunks, 1):
         print(
-            f"  [{i}] {c['source_file']}  (chunk {c['chunk_index']}, score: {c['score']:.3f})"
+            f"  [{i}] {c['source_file']}  ({_chunk_label(c)}, score: {c['score']:.3f})"
         )
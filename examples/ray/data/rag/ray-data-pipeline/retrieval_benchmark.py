@@ -0,0 +1,380 @@
+"""Retrieval quality and speed benchmark for the RAG collection.
+
+Runs the questions of an AutoRAG-style ``benchmark_data.json`` (a list of
+``{"question", "correct_answers", "correct_answer_document_ids"}`` objects)
+through a retriever and reports, per cutoff k:
+
+  - recall@k and nDCG@k over the ranked, de-duplicated source documents;
+  - MRR (reciprocal rank of the first correct document);
+
+plus p50/p95/p99 query latency and QPS.  Questions are submitted in batches
+to a thread pool, so ``--concurrency`` > 1 measures throughput under load.
+
+Retrievers:
+
+  - ``milvus`` (default): :func:`rag_helpers.search_milvus` against the
+    ingested collection, with the same index / quantization settings.
+  - ``bm25``: a lexical baseline over a directory of text/markdown files,
+    which needs no Milvus or embedding model.
+  - ``package.module:factory``: any callable returning a retriever, i.e. a
+    function ``(question, k) -> ranked list`` of document ids, or of chunk
+    dicts with a ``source_file`` key (what ``search_milvus`` returns).
+
+Example::
+
+    python retrieval_benchmark.py \\
+        --benchmark ../../../../autorag/data/rh_summit_2026/benchmark_data.json \\
+        --retriever bm25 \\
+        --docs-dir ../../../../autorag/data/rh_summit_2026/input_data \\
+        --output run.json --baseline previous_run.json
+
+Document ids are compared by file stem by default, so ``report.md`` in the
+benchmark matches a chunk ingested from ``report.pdf``.
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+Retriever = Callable[[str, int], list]
+
+
+# ---------------------------------------------------------------------------
+# Benchmark data and metrics
+# ---------------------------------------------------------------------------
+
+
+def load_benchmark(path: str) -> List[Dict[str, Any]]:
+    """Load benchmark items, validating the AutoRAG test-data format."""
+    with open(path) as f:
+        items = json.load(f)
+    if not isinstance(items, list):
+        raise ValueError(f"{path}: expected a JSON list of benchmark items")
+    for i, item in enumerate(items):
+        if not item.get("question") or not item.get("correct_answer_document_ids"):
+            raise ValueError(
+                f"{path}: item {i} needs 'question' and 'correct_answer_document_ids'"
+            )
+    return items
+
+
+def doc_key(doc_id: str, match: str = "stem") -> str:
+    """Normalize a document id for comparison (``stem``, ``name`` or ``exact``)."""
+    if match == "stem":
+        return Path(doc_id).stem
+    if match == "name":
+        return Path(doc_id).name
+    return doc_id
+
+
+def ranked_doc_ids(hits: list, match: str = "stem") -> List[str]:
+    """Collapse ranked hits (ids or chunk dicts) into unique document ids."""
+    seen: Dict[str, None] = {}
+    for hit in hits:
+        doc_id = hit["source_file"] if isinstance(hit, dict) else str(hit)
+        seen.setdefault(doc_key(doc_id, match), None)
+    return list(seen)
+
+
+def recall_at(ranked: List[str], relevant: set, k: int) -> float:
+    return len(set(ranked[:k]) & relevant) / len(relevant)
+
+
+def reciprocal_rank(ranked: List[str], relevant: set) -> float:
+    for rank, doc_id in enumerate(ranked, 1):
+        if doc_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at(ranked: List[str], relevant: set, k: int) -> float:
+    """Binary-relevance nDCG@k."""
+    dcg = sum(
+        1.0 / math.log2(rank + 1)
+        for rank, doc_id in enumerate(ranked[:k], 1)
+        if doc_id in relevant
+    )
+    ideal = sum(
+        1.0 / math.log2(rank + 1) for rank in range(1, min(k, len(relevant)) + 1)
+    )
+    return dcg / ideal
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[max(0, idx)]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+
+def run_benchmark(
+    items: List[Dict[str, Any]],
+    retriever: Retriever,
+    *,
+    ks: List[int],
+    fetch_k: int = 20,
+    batch_size: int = 8,
+    concurrency: int = 1,
+    match: str = "stem",
+    warmup: int = 1,
+) -> Dict[str, Any]:
+    """Run every question through ``retriever`` and aggregate the metrics."""
+    questions = [item["question"] for item in items]
+    for q in questions[:warmup]:
+        retriever(q, fetch_k)  # model / connection warm-up, not measured
+
+    def timed(question: str) -> tuple[list, float]:
+        t0 = time.perf_counter()
+        hits = retriever(question, fetch_k)
+        return hits, time.perf_counter() - t0
+
+    outputs: List[tuple[list, float]] = []
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for start in range(0, len(questions), batch_size):
+            outputs.extend(pool.map(timed, questions[start : start + batch_size]))
+    wall_s = time.perf_counter() - t_start
+
+    per_question = []
+    for item, (hits, latency) in zip(items, outputs, strict=True):
+        relevant = {doc_key(d, match) for d in item["correct_answer_document_ids"]}
+        ranked = ranked_doc_ids(hits, match)
+        per_question.append({
+            "question": item["question"],
+            "relevant": sorted(relevant),
+            "retrieved": ranked[: max(ks)],
+            "latency_ms": round(latency * 1000, 3),
+            "rr": reciprocal_rank(ranked, relevant),
+            **{f"recall@{k}": recall_at(ranked, relevant, k) for k in ks},
+            **{f"ndcg@{k}": ndcg_at(ranked, relevant, k) for k in ks},
+        })
+
+    n = len(per_question)
+    latencies = sorted(q["latency_ms"] for q in per_question)
+    summary = {
+        "questions": n,
+        "mrr": round(sum(q["rr"] for q in per_question) / n, 4),
+        **{
+            f"{m}@{k}": round(sum(q[f"{m}@{k}"] for q in per_question) / n, 4)
+            for m in ("recall", "ndcg")
+            for k in ks
+        },
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "qps": round(n / wall_s, 2) if wall_s > 0 else 0.0,
+        "wall_s": round(wall_s, 3),
+    }
+    return {"summary": summary, "per_question": per_question}
+
+
+def print_report(summary: Dict[str, Any], ks: List[int], baseline: Dict | None = None):
+    """Print the summary, with deltas against a previous run when given."""
+    keys = (
+        [f"recall@{k}" for k in ks]
+        + ["mrr"]
+        + [f"ndcg@{k}" for k in ks]
+        + ["p50_ms", "p95_ms", "p99_ms", "qps"]
+    )
+    print(
+        f"{'Metric':<12} {'Value':>10}"
+        + (f" {'Baseline':>10} {'Delta':>9}" if baseline else "")
+    )
+    print(f"{'─' * 12} {'─' * 10}" + (f" {'─' * 10} {'─' * 9}" if baseline else ""))
+    for key in keys:
+        line = f"{key:<12} {summary[key]:>10.4f}"
+        if baseline and key in baseline:
+            line += f" {baseline[key]:>10.4f} {summary[key] - baseline[key]:>+9.4f}"
+        print(line)
+    print(f"\n{summary['questions']} questions in {summary['wall_s']:.2f}s")
+
+
+# ---------------------------------------------------------------------------
+# Retrievers
+# ---------------------------------------------------------------------------
+
+
+def milvus_retriever(
+    uri: str,
+    collection_name: str,
+    embedding_model: str,
+    *,
+    db_name: str = "default",
+    index_type: str | None = None,
+    vector_quant: str | None = None,
+    score_threshold: float = 0.0,
+) -> Retriever:
+    """Retriever backed by :func:`rag_helpers.search_milvus`."""
+    from pymilvus import MilvusClient
+    from rag_helpers import search_milvus
+    from sentence_transformers import SentenceTransformer
+
+    milvus = MilvusClient(uri=uri, db_name=db_name)
+    milvus.load_collection(collection_name)
+    embed_model = SentenceTransformer(embedding_model)
+
+    def retrieve(question: str, k: int) -> list:
+        return search_milvus(
+            question,
+            milvus=milvus,
+            embed_model=embed_model,
+            collection_name=collection_name,
+            top_k=k,
+            score_threshold=score_threshold,
+            index_type=index_type,
+            vector_quant=vector_quant,
+        )
+
+    return retrieve
+
+
+_WORD = re.compile(r"\w+")
+
+
+def bm25_retriever(
+    docs_dir: str, *, passage_words: int = 200, k1: float = 1.5, b: float = 0.75
+) -> Retriever:
+    """Lexical BM25 baseline over passages of the files in ``docs_dir``."""
+    passages: List[tuple[str, Counter]] = []
+    for path in sorted(Path(docs_dir).iterdir()):
+        if not path.is_file():
+            continue
+        words = _WORD.findall(path.read_text(errors="ignore").lower())
+        for start in range(0, len(words), passage_words):
+            passages.append((path.name, Counter(words[start : start + passage_words])))
+    if not passages:
+        raise ValueError(f"No documents found in {docs_dir}")
+
+    avg_len = sum(sum(tf.values()) for _, tf in passages) / len(passages)
+    df = Counter(term for _, tf in passages for term in tf)
+    idf = {
+        t: math.log(1 + (len(passages) - n + 0.5) / (n + 0.5)) for t, n in df.items()
+    }
+
+    def retrieve(question: str, k: int) -> list:
+        terms = [t for t in _WORD.findall(question.lower()) if t in idf]
+        scored = []
+        for name, tf in passages:
+            norm = k1 * (1 - b + b * sum(tf.values()) / avg_len)
+            score = sum(
+                idf[t] * tf[t] * (k1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            )
+            scored.append((score, name))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return [{"source_file": name, "score": score} for score, name in scored[:k]]
+
+    return retrieve
+
+
+def load_retriever(spec: str) -> Retriever:
+    """Import ``package.module:factory`` and call the factory."""
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(
+            f"Custom retriever must look like 'module:factory', got {spec!r}"
+        )
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--benchmark", required=True, help="benchmark_data.json path")
+    parser.add_argument(
+        "--retriever", default="milvus", help="milvus, bm25 or module:factory"
+    )
+    parser.add_argument("--ks", type=_int_list, default=[1, 3, 5])
+    parser.add_argument(
+        "--fetch-k", type=int, default=20, help="Chunks retrieved per question"
+    )
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--match", choices=["stem", "name", "exact"], default="stem")
+    parser.add_argument("--output", help="Write summary + per-question results as JSON")
+    parser.add_argument("--baseline", help="Previous --output JSON to diff against")
+
+    milvus = parser.add_argument_group("milvus retriever")
+    milvus.add_argument(
+        "--uri",
+        default=f"http://{os.environ.get('MILVUS_HOST', 'localhost')}:"
+        f"{os.environ.get('MILVUS_PORT', '19530')}",
+    )
+    milvus.add_argument("--db-name", default=os.environ.get("MILVUS_DB", "default"))
+    milvus.add_argument(
+        "--collection", default=os.environ.get("MILVUS_COLLECTION", "rag_documents")
+    )
+    milvus.add_argument(
+        "--embedding-model",
+        default=os.environ.get(
+            "EMBEDDING_MODEL", "ibm-granite/granite-embedding-125m-english"
+        ),
+    )
+    milvus.add_argument("--index-type", default=None)
+    milvus.add_argument("--vector-quant", default=None)
+    milvus.add_argument("--score-threshold", type=float, default=0.0)
+
+    bm25 = parser.add_argument_group("bm25 retriever")
+    bm25.add_argument("--docs-dir", help="Directory of text/markdown documents")
+    args = parser.parse_args()
+
+    items = load_benchmark(args.benchmark)
+    if args.retriever == "milvus":
+        retriever = milvus_retriever(
+            args.uri,
+            args.collection,
+            args.embedding_model,
+            db_name=args.db_name,
+            index_type=args.index_type,
+            vector_quant=args.vector_quant,
+            score_threshold=args.score_threshold,
+        )
+    elif args.retriever == "bm25":
+        if not args.docs_dir:
+            parser.error("--retriever bm25 needs --docs-dir")
+        retriever = bm25_retriever(args.docs_dir)
+    else:
+        retriever = load_retriever(args.retriever)
+
+    result = run_benchmark(
+        items,
+        retriever,
+        ks=args.ks,
+        fetch_k=args.fetch_k,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        match=args.match,
+    )
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["summary"]
+    print(f"Retriever: {args.retriever}, benchmark: {args.benchmark}")
+    print_report(result["summary"], args.ks, baseline)
+
+    if args.output:
+        config = {
+            k: v for k, v in vars(args).items() if k not in ("output", "baseline")
+        }
+        with open(args.output, "w") as f:
+            json.dump({"config": config, **result}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
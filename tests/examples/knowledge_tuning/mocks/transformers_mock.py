@@ -9,7 +9,7 @@ class MockTokenizer:
     def __init__(self):
         self.vocab = {"<pad>": 0, "<unk>": 1, "test": 2, "token": 3}
 
-    def encode(self, text: str) -> list[int]:
+    def encode(self, text: str, add_special_tokens: bool = True) -> list[int]:
         """Mock encode method."""
         # Simple mock: return list of token IDs based on text length
         return list(range(len(text.split())))
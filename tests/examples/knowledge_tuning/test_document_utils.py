@@ -0,0 +1,348 @@
+"""Tests for the document processing component helpers in knowledge-tuning."""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+
+# Add the Kubeflow pipeline components to path
+repo_root = Path(__file__).parent.parent.parent.parent
+components_path = (
+    repo_root / "examples" / "knowledge-tuning" / "Kubeflow_Pipeline" / "components"
+)
+sys.path.insert(0, str(components_path))
+
+from document_utils import (  # noqa: E402
+    cache_conversions,
+    chunk_markdown,
+    source_fingerprint,
+    stream_conversions,
+    write_seed_data,
+)
+
+
+class TestStreamConversions:
+    """Test stream_conversions function."""
+
+    @pytest.fixture
+    def sources(self):
+        return [(f"url-{i + 1}", f"https://example.com/{i}") for i in range(6)]
+
+    def test_yields_every_source_with_its_index(self, sources):
+        """Test that each converted source is yielded once with its index."""
+        results = list(
+            stream_conversions(sources, lambda name, url: url.upper(), max_workers=3)
+        )
+
+        assert sorted(results) == [
+            (i, name, url.upper()) for i, (name, url) in enumerate(sources)
+        ]
+
+    def test_converts_in_parallel(self, sources):
+        """Test that up to max_workers sources are converted at the same time."""
+        lock = threading.Lock()
+        tracker = {"in_flight": 0, "peak": 0}
+
+        def convert(name, url):
+            with lock:
+                tracker["in_flight"] += 1
+                tracker["peak"] = max(tracker["peak"], tracker["in_flight"])
+            time.sleep(0.05)
+            with lock:
+                tracker["in_flight"] -= 1
+            return name
+
+        results = list(stream_conversions(sources, convert, max_workers=3))
+
+        assert len(results) == 6
+        assert tracker["peak"] == 3
+
+    def test_bounded_queue_holds_back_workers(self, sources):
+        """Test that workers wait while the consumer has not caught up."""
+        converted = []
+
+        def convert(name, url):
+            converted.append(name)
+            return name
+
+        stream = stream_conversions(sources, convert, max_workers=2, queue_size=1)
+        next(stream)
+        time.sleep(0.2)
+
+        # One result consumed, one queued and one held by each blocked worker
+        assert len(converted) <= 4
+        assert len(list(stream)) == 5
+
+    def test_raises_conversion_errors(self, sources):
+        """Test that a failed conversion stops the pool and is re-raised."""
+
+        def convert(name, url):
+            if name == "url-2":
+                raise ConnectionError(f"cannot fetch {url}")
+            return name
+
+        with pytest.raises(ConnectionError, match="example.com/1"):
+            list(stream_conversions(sources, convert, max_workers=2))
+
+
+@pytest.fixture
+def http_source():
+    """Serve /etag, /last-modified and /plain with a changeable body."""
+    state = {"body": b"version 1", "etag": '"v1"', "gets": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_page(self, with_body):
+            self.send_response(200)
+            if self.path == "/etag":
+                self.send_header("ETag", state["etag"])
+            elif self.path == "/last-modified":
+                self.send_header("Last-Modified", "Mon, 19 Oct 2026 10:00:00 GMT")
+            self.send_header("Content-Length", str(len(state["body"])))
+            self.end_headers()
+            if with_body:
+                state["gets"] += 1
+                self.wfile.write(state["body"])
+
+        def do_HEAD(self):
+            self.send_page(with_body=False)
+
+        def do_GET(self):
+            self.send_page(with_body=True)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", state
+    server.shutdown()
+
+
+class TestSourceFingerprint:
+    """Test source_fingerprint function."""
+
+    def test_uses_etag(self, http_source):
+        """Test that an ETag is used without downloading the page."""
+        base_url, state = http_source
+
+        assert source_fingerprint(f"{base_url}/etag") == 'etag:"v1"'
+        assert state["gets"] == 0
+
+    def test_uses_last_modified(self, http_source):
+        """Test that Last-Modified and Content-Length are used without an ETag."""
+        base_url, _ = http_source
+
+        fingerprint = source_fingerprint(f"{base_url}/last-modified")
+
+        assert fingerprint == "last-modified:Mon, 19 Oct 2026 10:00:00 GMT:9"
+
+    def test_hashes_content_without_validators(self, http_source):
+        """Test that a page without validators is hashed by its content."""
+        base_url, state = http_source
+
+        before = source_fingerprint(f"{base_url}/plain")
+        state["body"] = b"version 2"
+        after = source_fingerprint(f"{base_url}/plain")
+
+        assert before.startswith("sha256:")
+        assert before != after
+
+    def test_hashes_local_files(self, tmp_path):
+        """Test that a local file is hashed by its content."""
+        source = tmp_path / "guide.pdf"
+        source.write_bytes(b"%PDF-1.7 first")
+        before = source_fingerprint(str(source))
+        source.write_bytes(b"%PDF-1.7 second")
+
+        assert before != source_fingerprint(str(source))
+
+
+class TestCacheConversions:
+    """Test cache_conversions function."""
+
+    def test_unchanged_sources_are_not_converted_again(self, tmp_path):
+        """Test that a second run serves unchanged sources from the cache."""
+        sources = []
+        for i in range(3):
+            source = tmp_path / f"doc-{i}.html"
+            source.write_text(f"<p>document {i}</p>")
+            sources.append(str(source))
+        converted = []
+
+        def convert(name, source):
+            converted.append(source)
+            return f"# {Path(source).read_text()}"
+
+        cached_convert, stats = cache_conversions(convert, tmp_path / "cache")
+        first = [cached_convert(f"url-{i}", s) for i, s in enumerate(sources)]
+        Path(sources[1]).write_text("<p>document 1, revised</p>")
+        cached_convert, stats = cache_conversions(convert, tmp_path / "cache")
+        second = [cached_convert(f"url-{i}", s) for i, s in enumerate(sources)]
+
+        assert converted == sources + [sources[1]]
+        assert stats == {"hits": 2, "misses": 1}
+        assert second[0] == first[0]
+        assert second[1] == "# <p>document 1, revised</p>"
+
+    def test_config_is_part_of_the_key(self, tmp_path):
+        """Test that changed conversion settings invalidate the cache."""
+        source = tmp_path / "doc.html"
+        source.write_text("<p>document</p>")
+
+        for config in ["docling==2.53.0", "docling==2.54.0"]:
+            cached_convert, stats = cache_conversions(
+                lambda name, source: "# document", tmp_path / "cache", config=config
+            )
+            cached_convert("url-1", str(source))
+            assert stats == {"hits": 0, "misses": 1}
+
+
+class ByteEncoding:
+    """tiktoken stand-in with one token per UTF-8 byte."""
+
+    def encode_ordinary(self, text):
+        return list(text.encode("utf-8"))
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+    def decode_single_token_bytes(self, token):
+        return bytes([token])
+
+
+class TestChunkMarkdown:
+    """Test chunk_markdown function."""
+
+    @pytest.fixture(autouse=True)
+    def markdown_it(self):
+        pytest.importorskip("markdown_it")
+
+    def test_chunks_respect_max_tokens(self):
+        """Test that every chunk fits and its size is its real token count."""
+        encoding = ByteEncoding()
+        text = "# Title\n\n" + "\n\n".join(f"Paragraph {i} " * 20 for i in range(30))
+
+        chunks = chunk_markdown(text, max_tokens=200, overlap=20, encoding=encoding)
+
+        assert len(chunks) > 1
+        for chunk, num_tokens in chunks:
+            assert num_tokens <= 200
+            assert len(encoding.encode_ordinary(chunk)) == num_tokens
+
+    def test_packs_whole_blocks(self):
+        """Test that blocks that fit are kept together and never split."""
+        blocks = [f"Block {i} " + "x" * 40 for i in range(6)]
+
+        chunks = chunk_markdown(
+            "\n\n".join(blocks), max_tokens=100, overlap=0, encoding=ByteEncoding()
+        )
+
+        assert [chunk for chunk, _ in chunks] == [
+            "\n\n".join(blocks[i : i + 2]) for i in range(0, 6, 2)
+        ]
+
+    def test_long_blocks_are_split_with_overlap(self):
+        """Test that consecutive pieces of a long block share overlap tokens."""
+        text = "".join(chr(ord("a") + i % 26) for i in range(500))
+
+        chunks = chunk_markdown(
+            text, max_tokens=100, overlap=10, encoding=ByteEncoding()
+        )
+
+        assert [num_tokens for _, num_tokens in chunks] == [100] * 5 + [50]
+        for (previous, _), (current, _) in zip(chunks, chunks[1:], strict=False):
+            assert current[:10] == previous[-10:]
+        assert "".join(chunk[10:] for chunk, _ in chunks[1:]) == text[100:]
+
+    def test_does_not_split_characters(self):
+        """Test that multi-byte characters are never cut in two."""
+        chunks = chunk_markdown(
+            "日本語のテキスト" * 100, max_tokens=50, overlap=10, encoding=ByteEncoding()
+        )
+
+        assert all("\ufffd" not in chunk for chunk, _ in chunks)
+        assert all(num_tokens <= 50 for _, num_tokens in chunks)
+
+    def test_rejects_overlap_not_below_max_tokens(self):
+        """Test that an overlap as large as a chunk is rejected."""
+        with pytest.raises(ValueError, match="overlap"):
+            chunk_markdown("text", max_tokens=50, overlap=50, encoding=ByteEncoding())
+
+
+class TestWriteSeedData:
+    """Test write_seed_data function."""
+
+    @pytest.fixture
+    def pa(self):
+        return pytest.importorskip("pyarrow")
+
+    @pytest.fixture
+    def icl(self):
+        return {
+            "icl_document": ["first part", "second part"],
+            "icl_query_1": "What happened?",
+            "domain": "articles/essays",
+            "document_outline": None,
+        }
+
+    def test_writes_jsonl_with_constant_columns(self, pa, icl, tmp_path):
+        """Test that every JSONL line has its document and the constant columns."""
+        documents = [
+            f'document {i} with "quotes", ünïcode\nand newlines' for i in range(5)
+        ]
+        batches = [
+            pa.record_batch({"document": documents[:3]}),
+            pa.record_batch({"document": documents[3:]}),
+        ]
+        output_file = tmp_path / "seed_data.jsonl"
+
+        num_rows = write_seed_data(batches, icl, str(output_file))
+
+        lines = output_file.read_text(encoding="utf-8").splitlines()
+        assert num_rows == 5
+        assert [json.loads(line) for line in lines] == [
+            {"document": document, **icl} for document in documents
+        ]
+
+    def test_writes_parquet_with_constant_columns(self, pa, icl, tmp_path):
+        """Test that the Parquet rows match the JSONL rows."""
+        pq = pytest.importorskip("pyarrow.parquet")
+        batches = [
+            pa.record_batch({"document": ["a", "b"]}),
+            pa.table({"document": ["c"]}),
+        ]
+        output_file = tmp_path / "seed_data.parquet"
+
+        num_rows = write_seed_data(batches, icl, str(output_file), "parquet")
+
+        assert num_rows == 3
+        assert pq.read_table(output_file).to_pylist() == [
+            {"document": document, **icl} for document in "abc"
+        ]
+
+    def test_writes_empty_parquet_without_batches(self, pa, icl, tmp_path):
+        """Test that no batches still give a readable Parquet file."""
+        pq = pytest.importorskip("pyarrow.parquet")
+        output_file = tmp_path / "seed_data.parquet"
+
+        assert write_seed_data([], icl, str(output_file), "parquet") == 0
+        assert pq.read_table(output_file).num_rows == 0
+
+    def test_rejects_columns_that_are_also_constant(self, pa, icl, tmp_path):
+        """Test that a per-row column cannot be overwritten by a constant."""
+        batches = [pa.record_batch({"document": ["a"], "domain": ["finance"]})]
+
+        with pytest.raises(ValueError, match="domain"):
+            write_seed_data(batches, icl, str(tmp_path / "seed_data.jsonl"))
+
+    def test_rejects_unknown_format(self, pa, icl, tmp_path):
+        """Test that only jsonl and parquet are accepted."""
+        with pytest.raises(ValueError, match="artifact_format"):
+            write_seed_data([], icl, str(tmp_path / "seed_data.csv"), "csv")
@@ -0,0 +1,852 @@
+"""Tests for the SDG generation component helpers in knowledge-tuning."""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# Add the Kubeflow pipeline components to path
+repo_root = Path(__file__).parent.parent.parent.parent
+components_path = (
+    repo_root / "examples" / "knowledge-tuning" / "Kubeflow_Pipeline" / "components"
+)
+sys.path.insert(0, str(components_path))
+
+from inference_utils import (  # noqa: E402
+    generate_flows_in_shards,
+    generate_in_shards,
+    install_endpoint_balancer,
+    install_endpoint_governor,
+    install_generation_services,
+    install_prefix_tracker,
+    install_request_telemetry,
+    install_response_cache,
+    load_seed_data,
+    order_by_shared_prefix,
+    parse_endpoints,
+    write_generation_metrics,
+)
+
+
+class RateLimitError(Exception):
+    """Stand-in for a LiteLLM rate limit error."""
+
+    status_code = 429
+
+
+def make_llm_module(failures=None, delay=0.01):
+    """Return a module-like object whose acompletion tracks concurrency."""
+    failures = list(failures or [])
+    tracker = {"in_flight": 0, "peak": 0, "calls": 0}
+
+    async def acompletion(**kwargs):
+        tracker["calls"] += 1
+        tracker["in_flight"] += 1
+        tracker["peak"] = max(tracker["peak"], tracker["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+            if failures:
+                raise failures.pop(0)
+            return SimpleNamespace(
+                usage=SimpleNamespace(
+                    prompt_tokens=7, completion_tokens=3, total_tokens=10
+                )
+            )
+        finally:
+            tracker["in_flight"] -= 1
+
+    return SimpleNamespace(acompletion=acompletion), tracker
+
+
+class TestInstallEndpointGovernor:
+    """Test install_endpoint_governor function."""
+
+    def test_limits_in_flight_across_components(self, tmp_path):
+        """Test that two governed modules share one in-flight budget."""
+        tracker = {"in_flight": 0, "peak": 0}
+        modules = []
+        for _ in range(2):
+            module, _ = make_llm_module()
+            original = module.acompletion
+
+            async def counted(original=original, **kwargs):
+                tracker["in_flight"] += 1
+                tracker["peak"] = max(tracker["peak"], tracker["in_flight"])
+                try:
+                    return await original(**kwargs)
+                finally:
+                    tracker["in_flight"] -= 1
+
+            module.acompletion = counted
+            install_endpoint_governor(
+                str(tmp_path), "http://vllm:8000/v1", 3, llm_module=module
+            )
+            modules.append(module)
+
+        async def run():
+            await asyncio.gather(*[
+                module.acompletion(messages=[]) for module in modules for _ in range(10)
+            ])
+
+        asyncio.run(run())
+
+        assert tracker["peak"] <= 3
+        assert tracker["in_flight"] == 0
+
+    def test_records_stats(self, tmp_path):
+        """Test that requests and tokens are counted."""
+        module, tracker = make_llm_module()
+        stats = install_endpoint_governor(
+            str(tmp_path), "http://vllm:8000/v1", 4, llm_module=module
+        )
+
+        async def run():
+            await asyncio.gather(*[module.acompletion(messages=[]) for _ in range(5)])
+
+        asyncio.run(run())
+
+        assert stats["requests"] == 5
+        assert stats["total_tokens"] == 50
+        assert 1 <= stats["peak_in_flight"] <= 4
+        assert tracker["calls"] == 5
+
+    def test_rate_limit_backs_off_and_retries(self, tmp_path):
+        """Test that a 429 halves the shared limit and the request is retried."""
+        module, tracker = make_llm_module(failures=[RateLimitError("slow down")])
+        stats = install_endpoint_governor(
+            str(tmp_path), "http://vllm:8000/v1", 4, llm_module=module
+        )
+
+        response = asyncio.run(module.acompletion(messages=[]))
+
+        assert response.usage.total_tokens == 10
+        assert tracker["calls"] == 2
+        assert stats["rate_limited"] == 1
+        assert stats["retries"] == 1
+        (state_file,) = tmp_path.glob("*/state.json")
+        state = json.loads(state_file.read_text())
+        assert state["limit"] == 2
+        assert state["backoff"] == 0.0
+
+    def test_other_errors_are_not_retried(self, tmp_path):
+        """Test that errors other than 429/timeout propagate immediately."""
+        module, tracker = make_llm_module(failures=[ValueError("bad request")])
+        stats = install_endpoint_governor(
+            str(tmp_path), "http://vllm:8000/v1", 4, llm_module=module
+        )
+
+        with pytest.raises(ValueError, match="bad request"):
+            asyncio.run(module.acompletion(messages=[]))
+
+        assert tracker["calls"] == 1
+        assert stats["retries"] == 0
+
+    def test_one_waiter_polls_the_shared_state(self, tmp_path, monkeypatch):
+        """Test that waiting requests do not each poll the state file."""
+        state_writes = []
+        original_replace = os.replace
+
+        def counted_replace(src, dst):
+            if str(dst).endswith("state.json"):
+                state_writes.append(dst)
+            original_replace(src, dst)
+
+        monkeypatch.setattr(os, "replace", counted_replace)
+        module, tracker = make_llm_module(delay=0.2)
+        install_endpoint_governor(
+            str(tmp_path), "http://vllm:8000/v1", 1, llm_module=module
+        )
+
+        async def run():
+            await asyncio.gather(*[module.acompletion(messages=[]) for _ in range(8)])
+
+        asyncio.run(run())
+
+        assert tracker["peak"] == 1
+        # One take and one release per request, plus about one failed poll each;
+        # every waiter polling on its own writes the state several times more
+        assert len(state_writes) < 40
+
+    def test_endpoints_get_separate_budgets(self, tmp_path):
+        """Test that each endpoint keeps its own state directory."""
+        for endpoint in ["http://vllm-a:8000/v1", "http://vllm-b:8000/v1"]:
+            module, _ = make_llm_module()
+            install_endpoint_governor(str(tmp_path), endpoint, 2, llm_module=module)
+            asyncio.run(module.acompletion(messages=[]))
+
+        assert len(list(tmp_path.glob("*/state.json"))) == 2
+
+
+class ServiceUnavailableError(Exception):
+    """Stand-in for a LiteLLM 503 error."""
+
+    status_code = 503
+
+
+def make_endpoint_module(failing=(), delay=0.01):
+    """Return a module-like object that records which endpoint served a call."""
+    calls = []
+
+    async def acompletion(**kwargs):
+        calls.append(kwargs["api_base"])
+        await asyncio.sleep(delay)
+        if kwargs["api_base"] in failing:
+            raise ServiceUnavailableError(kwargs["api_base"])
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+
+    return SimpleNamespace(acompletion=acompletion), calls
+
+
+class TestParseEndpoints:
+    """Test parse_endpoints function."""
+
+    def test_single_endpoint(self):
+        """Test that a plain URL is one endpoint with weight 1."""
+        assert parse_endpoints("http://vllm:8000/v1") == [("http://vllm:8000/v1", 1.0)]
+
+    def test_weighted_list(self):
+        """Test a comma-separated list with optional weights."""
+        endpoints = parse_endpoints("http://a:8000/v1=3, http://b:8000/v1")
+
+        assert endpoints == [("http://a:8000/v1", 3.0), ("http://b:8000/v1", 1.0)]
+
+    def test_equals_sign_in_url(self):
+        """Test that an '=' without a numeric weight stays part of the URL."""
+        assert parse_endpoints("http://a/v1?key=abc") == [("http://a/v1?key=abc", 1.0)]
+
+    def test_invalid_weight(self):
+        """Test that non-positive weights are rejected."""
+        with pytest.raises(ValueError, match="must be positive"):
+            parse_endpoints("http://a:8000/v1=0")
+
+
+class TestInstallEndpointBalancer:
+    """Test install_endpoint_balancer function."""
+
+    def test_spreads_requests_by_weight(self):
+        """Test that concurrent requests follow the endpoint weights."""
+        module, calls = make_endpoint_module()
+        stats = install_endpoint_balancer(
+            [("http://a/v1", 3.0), ("http://b/v1", 1.0)],
+            health_check=False,
+            llm_module=module,
+        )
+
+        async def run():
+            await asyncio.gather(*[module.acompletion(messages=[]) for _ in range(8)])
+
+        asyncio.run(run())
+
+        assert calls.count("http://a/v1") == 6
+        assert calls.count("http://b/v1") == 2
+        assert stats["http://a/v1"]["total_tokens"] == 60
+        assert stats["http://a/v1"]["outstanding"] == 0
+        assert stats["http://a/v1"]["tokens_per_second"] > 0
+
+    def test_fails_over_and_ejects(self):
+        """Test that failing endpoints are retried elsewhere and then ejected."""
+        module, calls = make_endpoint_module(failing={"http://a/v1"})
+        stats = install_endpoint_balancer(
+            [("http://a/v1", 1.0), ("http://b/v1", 1.0)],
+            health_check=False,
+            max_failures=2,
+            llm_module=module,
+        )
+
+        async def run():
+            for _ in range(6):
+                response = await module.acompletion(messages=[])
+                assert response.usage.total_tokens == 10
+
+        asyncio.run(run())
+
+        assert stats["http://a/v1"]["failures"] == 2
+        assert stats["http://a/v1"]["ejections"] == 1
+        assert calls.count("http://b/v1") == 6
+
+    def test_raises_when_all_endpoints_fail(self):
+        """Test that the last endpoint error is raised."""
+        module, _ = make_endpoint_module(failing={"http://a/v1", "http://b/v1"})
+        install_endpoint_balancer(
+            [("http://a/v1", 1.0), ("http://b/v1", 1.0)],
+            health_check=False,
+            llm_module=module,
+        )
+
+        with pytest.raises(ServiceUnavailableError):
+            asyncio.run(module.acompletion(messages=[]))
+
+    def test_unreachable_endpoint_fails_health_check(self):
+        """Test that an endpoint that does not answer is ejected up front."""
+
+        class ModelsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200 if self.path == "/v1/models" else 404)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), ModelsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        healthy = f"http://127.0.0.1:{server.server_port}/v1"
+        try:
+            module, calls = make_endpoint_module()
+            stats = install_endpoint_balancer(
+                [("http://127.0.0.1:9/v1", 1.0), (healthy, 1.0)],
+                llm_module=module,
+            )
+            asyncio.run(module.acompletion(messages=[]))
+        finally:
+            server.shutdown()
+
+        assert stats["http://127.0.0.1:9/v1"]["ejections"] == 1
+        assert stats[healthy]["ejections"] == 0
+        assert calls == [healthy]
+
+
+def make_chat_module():
+    """Return a module-like object whose acompletion returns chat responses."""
+    tracker = {"calls": 0}
+
+    async def acompletion(messages, **kwargs):
+        tracker["calls"] += 1
+        choices = [
+            SimpleNamespace(
+                message=SimpleNamespace(
+                    content=f"answer {i} to {messages[-1]['content']}",
+                    role="assistant",
+                )
+            )
+            for i in range(kwargs.get("n", 1))
+        ]
+        return SimpleNamespace(choices=choices, usage=None)
+
+    return SimpleNamespace(acompletion=acompletion), tracker
+
+
+class TestInstallResponseCache:
+    """Test install_response_cache function."""
+
+    def test_repeated_requests_are_served_from_cache(self, tmp_path):
+        """Test that an identical request does not reach the endpoint again."""
+        module, tracker = make_chat_module()
+        stats = install_response_cache(str(tmp_path), llm_module=module)
+        request = {
+            "model": "hosted_vllm/model",
+            "messages": [{"role": "user", "content": "hi"}],
+            "n": 2,
+        }
+
+        first = asyncio.run(module.acompletion(**request, api_key="a"))
+        second = asyncio.run(module.acompletion(**request, api_key="b"))
+
+        assert tracker["calls"] == 1
+        assert [c.message.content for c in second.choices] == [
+            c.message.content for c in first.choices
+        ]
+        assert second.choices[0].message.role == "assistant"
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_sampling_params_are_part_of_the_key(self, tmp_path):
+        """Test that a different n, seed or prompt is a cache miss."""
+        module, tracker = make_chat_module()
+        install_response_cache(str(tmp_path), llm_module=module)
+        messages = [{"role": "user", "content": "hi"}]
+
+        async def run():
+            await module.acompletion(model="m", messages=messages, n=1)
+            await module.acompletion(model="m", messages=messages, n=2)
+            await module.acompletion(model="m", messages=messages, n=1, seed=7)
+            await module.acompletion(
+                model="m", messages=[{"role": "user", "content": "bye"}], n=1
+            )
+
+        asyncio.run(run())
+
+        assert tracker["calls"] == 4
+
+    def test_cache_persists_across_installs(self, tmp_path):
+        """Test that a new process reuses responses cached by an earlier one."""
+        request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+        for _ in range(2):
+            module, tracker = make_chat_module()
+            stats = install_response_cache(str(tmp_path), llm_module=module)
+            asyncio.run(module.acompletion(**request))
+
+        assert tracker["calls"] == 0
+        assert stats["hits"] == 1
+
+    def test_evicts_least_recently_used_entries(self, tmp_path):
+        """Test that the cache stays under its size limit."""
+        module, _ = make_chat_module()
+        stats = install_response_cache(
+            str(tmp_path), max_size_gb=500 / 1024**3, llm_module=module
+        )
+
+        async def run():
+            for i in range(20):
+                await module.acompletion(
+                    model="m", messages=[{"role": "user", "content": f"q{i}"}]
+                )
+
+        asyncio.run(run())
+
+        cache_bytes = sum(f.stat().st_size for f in tmp_path.glob("*/*.json"))
+        assert stats["evicted"] > 0
+        assert cache_bytes <= 500
+
+    def test_uncacheable_response_is_returned(self, tmp_path):
+        """Test that a failed cache write does not lose the paid response."""
+        tracker = {"calls": 0}
+
+        async def acompletion(messages, **kwargs):
+            tracker["calls"] += 1
+            message = SimpleNamespace(content="answer", tool_calls=[object()])
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        module = SimpleNamespace(acompletion=acompletion)
+        stats = install_response_cache(str(tmp_path), llm_module=module)
+        request = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+
+        first = asyncio.run(module.acompletion(**request))
+        asyncio.run(module.acompletion(**request))
+
+        assert first.choices[0].message.content == "answer"
+        assert tracker["calls"] == 2
+        assert stats["write_errors"] == 2
+        assert list(tmp_path.glob("*/*")) == []
+
+
+class TestInstallPrefixTracker:
+    """Test install_prefix_tracker function."""
+
+    def test_counts_prefix_shared_with_previous_request(self):
+        """Test that each prompt is compared with the one sent before it."""
+        llm_module, tracker = make_chat_module()
+        stats = install_prefix_tracker(llm_module=llm_module)
+
+        for content in ["doc A question 1", "doc A question 2", "doc B question 1"]:
+            asyncio.run(
+                llm_module.acompletion(messages=[{"role": "user", "content": content}])
+            )
+
+        assert tracker["calls"] == 3
+        assert stats["requests"] == 3
+        prompt_chars = 3 * len("user\ndoc A question 1\n")
+        assert stats["prompt_chars"] == prompt_chars
+        # "user\ndoc A question " is shared, then only "user\ndoc "
+        assert stats["shared_prefix_chars"] == len("user\ndoc A question ") + len(
+            "user\ndoc "
+        )
+        assert stats["shared_prefix_ratio"] == round(
+            stats["shared_prefix_chars"] / prompt_chars, 4
+        )
+
+    def test_passes_responses_through(self):
+        """Test that the wrapped acompletion returns the endpoint response."""
+        llm_module, _ = make_chat_module()
+        install_prefix_tracker(llm_module=llm_module)
+
+        response = asyncio.run(
+            llm_module.acompletion(messages=[{"role": "user", "content": "hi"}], n=2)
+        )
+
+        assert [c.message.content for c in response.choices] == [
+            "answer 0 to hi",
+            "answer 1 to hi",
+        ]
+
+
+class TestInstallRequestTelemetry:
+    """Test install_request_telemetry function."""
+
+    def test_records_tokens_latency_and_concurrency(self):
+        """Test that each request is recorded with its usage and concurrency."""
+        llm_module, _ = make_llm_module(delay=0.05)
+        telemetry = install_request_telemetry(llm_module=llm_module)
+
+        async def run():
+            await asyncio.gather(*(llm_module.acompletion(n=2) for _ in range(4)))
+
+        asyncio.run(run())
+
+        records = telemetry["requests"]
+        assert len(records) == 4
+        assert all(r["prompt_tokens"] == 7 for r in records)
+        assert all(r["completion_tokens"] == 3 for r in records)
+        assert all(r["n"] == 2 for r in records)
+        assert all(r["latency_seconds"] >= 0.04 for r in records)
+        assert max(r["concurrency"] for r in records) == 4
+        assert all(r["error"] is None for r in records)
+
+    def test_records_error_class_and_reraises(self):
+        """Test that failed requests are recorded before the error propagates."""
+        llm_module, _ = make_llm_module(failures=[RateLimitError("slow down")])
+        telemetry = install_request_telemetry(llm_module=llm_module)
+
+        with pytest.raises(RateLimitError):
+            asyncio.run(llm_module.acompletion())
+
+        (record,) = telemetry["requests"]
+        assert record["error"] == "RateLimitError"
+        assert record["completion_tokens"] == 0
+
+
+class TestWriteGenerationMetrics:
+    """Test write_generation_metrics function."""
+
+    @pytest.fixture
+    def telemetry(self):
+        def record(start, latency, concurrency, error=None):
+            return {
+                "start_seconds": start,
+                "concurrency": concurrency,
+                "n": 1,
+                "prompt_tokens": 0 if error else 100,
+                "completion_tokens": 0 if error else 50,
+                "error": error,
+                "latency_seconds": latency,
+            }
+
+        return {
+            "started_at": 0.0,
+            "requests": [
+                record(0.0, 1.0, 1),
+                record(0.0, 2.0, 2),
+                record(0.5, 1.5, 2),
+                record(1.0, 3.0, 2, error="Timeout"),
+            ],
+        }
+
+    def test_summarizes_requests(self, telemetry, tmp_path):
+        """Test the run summary computed from the request records."""
+        summary = write_generation_metrics(telemetry, tmp_path)
+
+        assert summary["requests"] == 4
+        assert summary["errors"] == 1
+        assert summary["timeouts"] == 1
+        assert summary["error_rate"] == 0.25
+        assert summary["prompt_tokens"] == 300
+        assert summary["completion_tokens"] == 150
+        assert summary["wall_seconds"] == 4.0
+        assert summary["completion_tokens_per_second"] == 37.5
+        assert summary["latency_p50_seconds"] == 1.5
+        assert summary["latency_p99_seconds"] == 2.0
+        assert summary["peak_concurrency"] == 2
+
+    def test_writes_json_and_markdown(self, telemetry, tmp_path):
+        """Test that the artifact holds the metrics JSON and a summary table."""
+        write_generation_metrics(
+            telemetry, tmp_path, extra_stats={"cache": {"hits": 3}}
+        )
+
+        metrics = json.loads((tmp_path / "metrics.json").read_text())
+        assert metrics["stats"] == {"cache": {"hits": 3}}
+        assert metrics["error_classes"] == {"Timeout": 1}
+        assert len(metrics["requests"]) == 4
+        by_concurrency = {row["concurrency"]: row for row in metrics["by_concurrency"]}
+        assert by_concurrency[1]["requests"] == 1
+        assert by_concurrency[2]["errors"] == 1
+        # Two requests in flight at 25 and 33.3 completion tokens/sec each
+        assert by_concurrency[2]["estimated_completion_tokens_per_second"] == 58.3
+
+        summary_markdown = (tmp_path / "summary.md").read_text()
+        assert "## Generation summary" in summary_markdown
+        assert "| Timeout | 1 |" in summary_markdown
+        assert "## By concurrency" in summary_markdown
+
+
+class TestInstallGenerationServices:
+    """Test install_generation_services function."""
+
+    def test_without_workspace_only_telemetry_is_installed(self, tmp_path):
+        """Test that no governor, balancer, cache or checkpoints are set up."""
+        llm_module, _ = make_llm_module()
+        checkpoint_dir, report = install_generation_services(
+            [("http://a/v1", 1)],
+            endpoint_max_in_flight=2,
+            llm_cache_max_size_gb=1.0,
+            llm_module=llm_module,
+        )
+
+        asyncio.run(llm_module.acompletion())
+        summary = report(tmp_path)
+
+        assert checkpoint_dir == ""
+        assert summary["requests"] == 1
+        metrics = json.loads((tmp_path / "metrics.json").read_text())
+        assert metrics["stats"] == {"governor": None, "balancer": None, "cache": None}
+
+    def test_workspace_enables_governor_cache_and_checkpoints(self, tmp_path):
+        """Test that the wrapper stats end up in the written metrics."""
+        llm_module, tracker = make_chat_module()
+        workspace = tmp_path / "workspace"
+        checkpoint_dir, report = install_generation_services(
+            [("http://a/v1", 1)],
+            workspace_path=str(workspace),
+            endpoint_max_in_flight=2,
+            llm_cache_dir=str(tmp_path / "cache"),
+            llm_cache_max_size_gb=1.0,
+            track_prefixes=True,
+            llm_module=llm_module,
+        )
+
+        for _ in range(2):
+            asyncio.run(
+                llm_module.acompletion(
+                    model="m", messages=[{"role": "user", "content": "hi"}]
+                )
+            )
+        report(tmp_path / "metrics", extra_stats={"seed_prefix_ordering": {"rows": 1}})
+
+        assert checkpoint_dir == str(workspace / "sdg_checkpoints")
+        assert tracker["calls"] == 1
+        stats = json.loads((tmp_path / "metrics" / "metrics.json").read_text())["stats"]
+        assert stats["governor"]["requests"] == 1
+        assert stats["cache"]["hits"] == 1
+        assert stats["balancer"] is None
+        # The tracker sits under the cache, so it only sees the endpoint request
+        assert stats["prompt_prefix_sharing"]["requests"] == 1
+        assert stats["seed_prefix_ordering"] == {"rows": 1}
+
+    def test_cache_is_not_kept_on_the_workspace(self, tmp_path):
+        """Test that the per-run workspace alone does not enable the cache."""
+        llm_module, tracker = make_chat_module()
+        workspace = tmp_path / "workspace"
+        _, report = install_generation_services(
+            [("http://a/v1", 1)],
+            workspace_path=str(workspace),
+            llm_cache_max_size_gb=1.0,
+            llm_module=llm_module,
+        )
+
+        for _ in range(2):
+            asyncio.run(
+                llm_module.acompletion(
+                    model="m", messages=[{"role": "user", "content": "hi"}]
+                )
+            )
+        report(tmp_path / "metrics")
+
+        assert tracker["calls"] == 2
+        assert not (workspace / "llm_cache").exists()
+        stats = json.loads((tmp_path / "metrics" / "metrics.json").read_text())["stats"]
+        assert stats["cache"] is None
+
+
+class TestLoadSeedData:
+    """Test load_seed_data function."""
+
+    @pytest.fixture
+    def seed_data(self):
+        pd = pytest.importorskip("pandas")
+        return pd.DataFrame({
+            "document": ["chunk 1", "chunk 2", "chunk 3"],
+            "document_outline": ["Guide", "Guide", "Manual"],
+            "domain": ["docs", "docs", "docs"],
+            "icl_document": ["example", "example", "example"],
+        })
+
+    def test_prefers_parquet(self, seed_data, tmp_path):
+        """Test that seed_data.parquet is read before seed_data.jsonl."""
+        pytest.importorskip("pyarrow")
+        seed_data.to_parquet(tmp_path / "seed_data.parquet")
+        seed_data.iloc[:1].to_json(
+            tmp_path / "seed_data.jsonl", orient="records", lines=True
+        )
+
+        loaded = load_seed_data(str(tmp_path))
+
+        assert loaded.equals(seed_data)
+
+    def test_falls_back_to_jsonl_and_subsamples(self, seed_data, tmp_path):
+        """Test that JSONL seed data is read and cut to the first rows."""
+        seed_data.to_json(tmp_path / "seed_data.jsonl", orient="records", lines=True)
+
+        loaded = load_seed_data(str(tmp_path), seed_data_subsample=2)
+
+        assert loaded["document"].tolist() == ["chunk 1", "chunk 2"]
+
+    def test_missing_columns(self, seed_data, tmp_path):
+        """Test that seed data without the flow columns is rejected."""
+        seed_data.drop(columns=["icl_document"]).to_json(
+            tmp_path / "seed_data.jsonl", orient="records", lines=True
+        )
+
+        with pytest.raises(ValueError, match="icl_document"):
+            load_seed_data(str(tmp_path))
+
+
+class TestOrderBySharedPrefix:
+    """Test order_by_shared_prefix function."""
+
+    @pytest.fixture
+    def seed_data(self):
+        pd = pytest.importorskip("pandas")
+        return pd.DataFrame({
+            "document_outline": ["Guide", "Manual", "Guide", "Manual", "Guide"],
+            "document": ["chunk 2", "chunk 1", "chunk 1", "chunk 1", "chunk 2"],
+            "row_id": [0, 1, 2, 3, 4],
+        })
+
+    def test_groups_rows_with_equal_prefixes(self, seed_data):
+        """Test that rows sharing a prefix are adjacent and keep their order."""
+        ordered, _ = order_by_shared_prefix(seed_data, ["document_outline", "document"])
+
+        assert ordered["row_id"].tolist() == [2, 0, 4, 1, 3]
+        assert ordered.index.tolist() == [0, 1, 2, 3, 4]
+
+    def test_reports_adjacent_shared_chars(self, seed_data):
+        """Test that ordering increases the prefix shared by adjacent rows."""
+        _, stats = order_by_shared_prefix(seed_data, ["document_outline", "document"])
+
+        assert stats["rows"] == 5
+        assert stats["unique_prefixes"] == 3
+        assert (
+            stats["adjacent_shared_chars_after"] > stats["adjacent_shared_chars_before"]
+        )
+
+
+class FakeFlow:
+    """Flow stand-in that turns each seed row into two Q&A records."""
+
+    def __init__(self, fail_on_call=None, name="Fake Summary Flow", call_log=None):
+        self.metadata = SimpleNamespace(name=name)
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+        self.call_log = call_log if call_log is not None else []
+
+    def generate(self, dataset, **kwargs):
+        self.calls += 1
+        self.call_log.append((self.metadata.name, dataset["document"].iloc[0]))
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("pod evicted")
+        return dataset.loc[dataset.index.repeat(2)].assign(question="q")
+
+
+class TestGenerateInShards:
+    """Test generate_in_shards function."""
+
+    @pytest.fixture
+    def seed_data(self):
+        pd = pytest.importorskip("pandas")
+        return pd.DataFrame({"document": [f"doc {i}" for i in range(10)]})
+
+    def test_writes_one_file_per_shard(self, seed_data, tmp_path):
+        """Test that shards are written as separate files."""
+        flow = FakeFlow()
+
+        num_rows = generate_in_shards(
+            flow, seed_data, tmp_path / "out", shard_size=4, runtime_params={}
+        )
+
+        assert num_rows == 20
+        assert flow.calls == 3
+        shard_files = sorted(p.name for p in (tmp_path / "out").glob("*.jsonl"))
+        assert shard_files == ["gen-00000.jsonl", "gen-00001.jsonl", "gen-00002.jsonl"]
+
+    def test_resumes_from_checkpoints(self, seed_data, tmp_path):
+        """Test that a restarted run only generates the unfinished shards."""
+        with pytest.raises(RuntimeError, match="pod evicted"):
+            generate_in_shards(
+                FakeFlow(fail_on_call=2),
+                seed_data,
+                tmp_path / "out1",
+                checkpoint_dir=tmp_path / "checkpoints",
+                shard_size=4,
+            )
+
+        flow = FakeFlow()
+        num_rows = generate_in_shards(
+            flow,
+            seed_data,
+            tmp_path / "out2",
+            checkpoint_dir=tmp_path / "checkpoints",
+            shard_size=4,
+        )
+
+        assert num_rows == 20
+        assert flow.calls == 2
+        assert len(list((tmp_path / "out2").glob("*.jsonl"))) == 3
+
+    def test_changed_inputs_are_regenerated(self, seed_data, tmp_path):
+        """Test that checkpoints are not reused for a different configuration."""
+        for fingerprint in ["model-a", "model-b"]:
+            flow = FakeFlow()
+            generate_in_shards(
+                flow,
+                seed_data,
+                tmp_path / fingerprint,
+                checkpoint_dir=tmp_path / "checkpoints",
+                shard_size=5,
+                fingerprint=fingerprint,
+            )
+            assert flow.calls == 2
+
+
+class TestGenerateFlowsInShards:
+    """Test generate_flows_in_shards function."""
+
+    @pytest.fixture
+    def seed_data(self):
+        pd = pytest.importorskip("pandas")
+        return pd.DataFrame({"document": [f"doc {i}" for i in range(10)]})
+
+    def test_runs_every_flow_on_a_shard_before_the_next(self, seed_data, tmp_path):
+        """Test that the flows take turns on each shard of the seed data."""
+        call_log = []
+        flows = [FakeFlow(name=name, call_log=call_log) for name in ["A", "B"]]
+
+        num_rows = generate_flows_in_shards(
+            [(flow, tmp_path / flow.metadata.name, {}) for flow in flows],
+            seed_data,
+            shard_size=5,
+        )
+
+        assert num_rows == [20, 20]
+        assert call_log == [
+            ("A", "doc 0"),
+            ("B", "doc 0"),
+            ("A", "doc 5"),
+            ("B", "doc 5"),
+        ]
+        for name in ["A", "B"]:
+            assert len(list((tmp_path / name).glob("*.jsonl"))) == 2
+
+    def test_checkpoints_each_flow_separately(self, seed_data, tmp_path):
+        """Test that a restarted run resumes every flow from its own shards."""
+        flow_a = FakeFlow(name="A")
+        flow_b = FakeFlow(name="B", fail_on_call=2)
+        with pytest.raises(RuntimeError, match="pod evicted"):
+            generate_flows_in_shards(
+                [(flow_a, tmp_path / "a1", {}), (flow_b, tmp_path / "b1", {})],
+                seed_data,
+                checkpoint_dir=tmp_path / "checkpoints",
+                shard_size=5,
+            )
+
+        flow_a, flow_b = FakeFlow(name="A"), FakeFlow(name="B")
+        num_rows = generate_flows_in_shards(
+            [(flow_a, tmp_path / "a2", {}), (flow_b, tmp_path / "b2", {})],
+            seed_data,
+            checkpoint_dir=tmp_path / "checkpoints",
+            shard_size=5,
+        )
+
+        assert num_rows == [20, 20]
+        # A finished the second shard before B failed on it
+        assert flow_a.calls == 0
+        assert flow_b.calls == 1
+        assert sorted(p.name for p in (tmp_path / "checkpoints").iterdir()) == [
+            "a",
+            "b",
+        ]
@@ -17,9 +17,14 @@ sys.path.insert(0, str(utils_path))
 
 from knowledge_utils import (  # noqa: E402
     count_len_in_tokens,
+    dedup_qa,
     generate_knowledge_qa_dataset,
     get_avg_summaries_per_raw_doc,
+    pack_by_token_length,
+    pack_token_lengths,
+    rank_doc_qa,
     sample_doc_qa,
+    scan_generated_data,
 )
 
 
@@ -58,6 +63,49 @@ class TestGetAvgSummariesPerRawDoc:
             get_avg_summaries_per_raw_doc(df)
 
 
+class TestScanGeneratedData:
+    """Test scan_generated_data function."""
+
+    @pytest.fixture
+    def shards(self):
+        # The first shard has no value in "reasoning", the second one has
+        return [
+            pl.DataFrame({"question": ["q1"], "reasoning": [None]}),
+            pl.DataFrame({"question": ["q2", "q3"], "reasoning": ["r2", None]}),
+        ]
+
+    def test_unifies_parquet_shards(self, shards, tmp_path):
+        """Test that a Null column in one Parquet shard is read as String."""
+        for i, shard in enumerate(shards):
+            shard.write_parquet(tmp_path / f"gen-{i:05d}.parquet")
+
+        lf = scan_generated_data(str(tmp_path))
+
+        assert lf.collect_schema()["reasoning"] == pl.String
+        result = lf.collect(engine="streaming")
+        assert result["question"].to_list() == ["q1", "q2", "q3"]
+        assert result["reasoning"].to_list() == [None, "r2", None]
+
+    def test_unifies_jsonl_shards(self, shards, tmp_path):
+        """Test that JSONL shards with mixed types and empty shards are read."""
+        for i, shard in enumerate(shards):
+            shard.write_ndjson(tmp_path / f"gen-{i:05d}.jsonl")
+        (tmp_path / "gen-00002.jsonl").write_text("")
+        # A later shard may also lack a column entirely
+        pl.DataFrame({"question": ["q4"]}).write_ndjson(tmp_path / "gen-00003.jsonl")
+
+        result = scan_generated_data(str(tmp_path)).collect()
+
+        assert result.schema["reasoning"] == pl.String
+        assert result["question"].to_list() == ["q1", "q2", "q3", "q4"]
+        assert result["reasoning"].to_list() == [None, "r2", None, None]
+
+    def test_no_data_files(self, tmp_path):
+        """Test that a directory without shard files is an error."""
+        with pytest.raises(FileNotFoundError):
+            scan_generated_data(str(tmp_path))
+
+
 class TestSampleDocQa:
     """Test sample_doc_qa function."""
 
@@ -101,6 +149,178 @@ class TestSampleDocQa:
         result = sample_doc_qa(df, n_docs_per_raw=1, qa_per_doc=1)
         assert isinstance(result, pl.DataFrame)
 
+    def test_seed_is_deterministic(self):
+        """Test that a fixed seed selects the same summaries in any row order."""
+        df = pl.DataFrame({
+            "question": [f"q{i}" for i in range(60)],
+            "response": [f"r{i}" for i in range(60)],
+            "document": [f"doc{i // 2}" for i in range(60)],
+            "raw_document": [f"raw{i // 20}" for i in range(60)],
+            "document_outline": [f"outline{i // 20}" for i in range(60)],
+        })
+
+        first = sample_doc_qa(df, n_docs_per_raw=3, qa_per_doc=2, seed=7)
+        second = sample_doc_qa(df.reverse(), n_docs_per_raw=3, qa_per_doc=2, seed=7)
+
+        counts = first.group_by("raw_document").agg(pl.col("document").n_unique())
+        assert counts["document"].to_list() == [3, 3, 3]
+        assert set(first["document"]) == set(second["document"])
+
+
+class TestRankDocQa:
+    """Test rank_doc_qa function."""
+
+    def test_cuts_are_nested(self):
+        """Test that every cut taken from one ranking is nested in larger ones."""
+        df = pl.DataFrame({
+            "question": [f"q{i}" for i in range(40)],
+            "response": [f"r{i}" for i in range(40)],
+            "document": [f"doc{i // 2}" for i in range(40)],
+            "raw_document": [f"raw{i // 10}" for i in range(40)],
+            "document_outline": [f"outline{i // 10}" for i in range(40)],
+        })
+
+        ranked = rank_doc_qa(df, max_docs_per_raw=4, qa_per_doc=1, seed=0)
+        assert "doc_rank" in ranked.columns
+        assert ranked.group_by("raw_document").len()["len"].to_list() == [4] * 4
+
+        previous = set()
+        for cut in (1, 2, 4):
+            docs = set(ranked.filter(pl.col("doc_rank") < cut)["document"])
+            assert len(docs) == cut * 4
+            assert previous <= docs
+            previous = docs
+
+    def test_ranking_follows_seeded_polars_hash(self):
+        """Test that summaries are ranked by their seeded Polars hash."""
+        df = pl.DataFrame({
+            "question": [f"q{i}" for i in range(12)],
+            "response": [f"r{i}" for i in range(12)],
+            "document": [f"doc{i}" for i in range(12)],
+            "raw_document": [f"raw{i // 6}" for i in range(12)],
+            "document_outline": [f"outline{i // 6}" for i in range(12)],
+        })
+
+        ranked = rank_doc_qa(df, qa_per_doc=1, seed=42)
+        for raw in range(2):
+            docs = pl.Series([f"doc{i}" for i in range(6 * raw, 6 * raw + 6)])
+            expected = docs.gather(docs.hash(seed=42).arg_sort()).to_list()
+            ranked_docs = ranked.filter(pl.col("raw_document") == f"raw{raw}")
+            assert ranked_docs.sort("doc_rank")["document"].to_list() == expected
+
+    def test_lazy_frame_matches_eager(self):
+        """Test that a LazyFrame stays lazy and keeps the first Q&A pairs."""
+        df = pl.DataFrame({
+            "question": [f"q{i}" for i in range(40)],
+            "response": [f"r{i}" for i in range(40)],
+            "document": [f"doc{i % 8}" for i in range(40)],
+            "raw_document": [f"raw{i % 2}" for i in range(40)],
+            "document_outline": [f"outline{i % 2}" for i in range(40)],
+        })
+
+        eager = rank_doc_qa(df, max_docs_per_raw=2, qa_per_doc=3, seed=0)
+        lazy = rank_doc_qa(df.lazy(), max_docs_per_raw=2, qa_per_doc=3, seed=0)
+
+        assert isinstance(lazy, pl.LazyFrame)
+        assert lazy.collect(engine="streaming").equals(eager)
+        # Rows keep the input order, and each summary keeps its first pairs
+        assert eager["question"].to_list() == sorted(
+            eager["question"], key=lambda q: int(q[1:])
+        )
+        first_pairs = eager.group_by("document").agg(pl.col("question"))
+        for questions in first_pairs["question"].to_list():
+            doc = int(questions[0][1:]) % 8
+            assert questions == [f"q{doc + 8 * k}" for k in range(3)]
+
+
+class TestDedupQa:
+    """Test dedup_qa function."""
+
+    @staticmethod
+    def _near_copies(n_changed):
+        """Return a 60-word text and copies with n words replaced."""
+        words = [f"w{i % 17}x{i % 5}" for i in range(60)]
+        texts = []
+        for n in n_changed:
+            copy = list(words)
+            copy[: 2 * n : 2] = [f"changed{i}" for i in range(n)]
+            texts.append(" ".join(copy))
+        return texts
+
+    def test_required_columns_validation(self):
+        """Test that function validates required columns."""
+        df = pl.DataFrame({"question": ["q1"], "response": ["r1"]})
+
+        with pytest.raises(ValueError, match="Missing required columns"):
+            dedup_qa(df)
+
+    def test_exact_duplicates_within_raw_document(self):
+        """Test that normalized exact duplicates are dropped per raw document."""
+        df = pl.DataFrame({
+            "question": ["What is X?", "what is x", "What is Y?", "What is X?"],
+            "response": ["It is X.", "It is X", "It is Y.", "It is X."],
+            "raw_document": ["raw1", "raw1", "raw1", "raw2"],
+        })
+
+        result = dedup_qa(df, near_dup_threshold=1.0)
+
+        assert result["question"].to_list() == [
+            "What is X?",
+            "What is Y?",
+            "What is X?",
+        ]
+        assert result.columns == df.columns
+
+    def test_near_duplicates_follow_threshold(self):
+        """Test that only copies above the similarity threshold are dropped."""
+        texts = self._near_copies([0, 1, 20])
+        df = pl.DataFrame({
+            "question": texts,
+            "response": ["same answer"] * 3,
+            "raw_document": ["raw1"] * 3,
+        })
+
+        result = dedup_qa(df, near_dup_threshold=0.8)
+
+        # One word changed keeps most n-grams; twenty changed words do not
+        assert result["question"].to_list() == [texts[0], texts[2]]
+
+    def test_lazy_frame_matches_eager(self):
+        """Test that a LazyFrame gives the same result as eager."""
+        texts = self._near_copies([0, 1, 2, 20, 30])
+        df = pl.DataFrame({
+            "question": texts * 2,
+            "response": ["a", "b", "a", "c", "d"] * 2,
+            "raw_document": ["raw1"] * 5 + ["raw2"] * 5,
+        })
+
+        eager = dedup_qa(df)
+        lazy = dedup_qa(df.lazy())
+
+        assert isinstance(lazy, pl.LazyFrame)
+        assert lazy.collect(engine="streaming").equals(eager)
+
+    def test_reports_removed_tokens(self, capsys):
+        """Test that removed tokens are reported when a tokenizer is given."""
+        import sys
+        from pathlib import Path
+
+        # Add mocks to path
+        mocks_path = Path(__file__).parent / "mocks"
+        sys.path.insert(0, str(mocks_path))
+        from transformers_mock import MockTokenizer
+
+        df = pl.DataFrame({
+            "question": ["q one", "q one"],
+            "response": ["r two three", "r two three"],
+            "raw_document": ["raw1", "raw1"],
+        })
+
+        dedup_qa(df, tokenizer=MockTokenizer())
+
+        output = capsys.readouterr().out
+        assert "Removed 1 exact and 0 near-duplicate Q&A pairs (5 tokens)" in output
+
 
 class TestGenerateKnowledgeQaDataset:
     """Test generate_knowledge_qa_dataset function."""
@@ -184,6 +404,54 @@ class TestGenerateKnowledgeQaDataset:
         assert isinstance(result, pl.DataFrame)
         assert "messages" in result.columns
 
+    def test_metadata_matches_json_dumps(self):
+        """Test metadata is byte-identical to json.dumps, including escapes."""
+        df = pl.DataFrame({
+            "question": ["q1", "q2"],
+            "response": ["r1", "r2"],
+            "document": ['a "quoted"\nline', "café 🚀"],
+            "document_outline": ["outline1", None],
+            "raw_document": ["back\\slash\ttab", "日本語"],
+        })
+
+        result = generate_knowledge_qa_dataset(df, keep_document_in_context=True)
+        for row, metadata in zip(
+            df.iter_rows(named=True), result["metadata"], strict=True
+        ):
+            assert metadata == json.dumps({
+                "sdg_document": row["document"],
+                "dataset": "document_knowledge_qa",
+                "raw_document": row["raw_document"],
+            })
+        assert result["messages"][1][0]["content"] == "None\ncafé 🚀\n\nq2"
+
+    def test_metadata_with_repeated_and_missing_documents(self):
+        """Test that repeated and null raw documents encode like json.dumps."""
+        raw_documents = ["long café document " * 500, None] * 3
+        df = pl.DataFrame({
+            "question": [f"q{i}" for i in range(6)],
+            "response": ["r"] * 6,
+            "document": ["summary", "other"] * 3,
+            "document_outline": ["outline"] * 6,
+            "raw_document": raw_documents,
+        })
+
+        eager = generate_knowledge_qa_dataset(df)
+        lazy = generate_knowledge_qa_dataset(df.lazy()).collect()
+
+        expected = [
+            json.dumps({
+                "sdg_document": document,
+                "dataset": "document_knowledge_qa",
+                "raw_document": raw_document,
+            })
+            for document, raw_document in zip(
+                df["document"], raw_documents, strict=True
+            )
+        ]
+        assert eager["metadata"].to_list() == expected
+        assert lazy["metadata"].to_list() == expected
+
     def test_pre_training_flag(self):
         """Test pre_training flag adds unmask column."""
         df = pl.DataFrame({
@@ -202,6 +470,37 @@ class TestGenerateKnowledgeQaDataset:
         assert result_no_pretrain["unmask"][0] is False
 
 
+@pytest.fixture
+def fast_tokenizer():
+    """Small word-level fast tokenizer with special tokens and a chat template."""
+    tokenizers = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+
+    words = ["[UNK]", "what", "is", "the", "answer", "document", "summary", "?"]
+    backend = tokenizers.Tokenizer(
+        tokenizers.models.WordLevel(
+            {word: i for i, word in enumerate(words)}, unk_token="[UNK]"
+        )
+    )
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        unk_token="[UNK]",
+        additional_special_tokens=[
+            "<|system|>",
+            "<|user|>",
+            "<|assistant|>",
+            "<|end|>",
+        ],
+    )
+    tokenizer.chat_template = (
+        "<|system|>You are a helpful assistant.<|end|>"
+        "{% for m in messages %}<|{{ m['role'] }}|>{{ m['content'] }}<|end|>"
+        "{% endfor %}"
+    )
+    return tokenizer
+
+
 class TestCountLenInTokens:
     """Test count_len_in_tokens function."""
 
@@ -242,6 +541,116 @@ class TestCountLenInTokens:
         assert "token_length" in result.columns
         assert len(result) == 2
 
+    def test_batched_counts_match_per_row(self):
+        """Test batched, threaded counting matches encoding row by row."""
+        import sys
+        from pathlib import Path
+
+        # Add mocks to path
+        mocks_path = Path(__file__).parent / "mocks"
+        sys.path.insert(0, str(mocks_path))
+        from transformers_mock import MockTokenizer
+
+        df = pl.DataFrame({
+            "messages": [
+                [{"role": "user", "content": " ".join(["word"] * i)}] for i in range(10)
+            ],
+        })
+
+        mock_tokenizer = MockTokenizer()
+        result = count_len_in_tokens(df, mock_tokenizer, batch_size=3, num_workers=2)
+
+        expected = [
+            len(mock_tokenizer.encode(mock_tokenizer.apply_chat_template(messages)))
+            for messages in df["messages"].to_list()
+        ]
+        assert result["token_length"].to_list() == expected
+
+    def test_fast_tokenizer_uses_batch_api(self, fast_tokenizer, monkeypatch):
+        """Test that a fast tokenizer is called on whole batches, not per row."""
+        df = pl.DataFrame({
+            "messages": [
+                [
+                    {"role": "user", "content": "what is the " + "answer " * i},
+                    {"role": "assistant", "content": "the summary ?"},
+                ]
+                for i in range(7)
+            ],
+        })
+        expected = [
+            len(
+                fast_tokenizer.encode(
+                    fast_tokenizer.apply_chat_template(m, tokenize=False)
+                )
+            )
+            for m in df["messages"].to_list()
+        ]
+
+        def encode(*args, **kwargs):
+            raise AssertionError("fast tokenizers must not encode row by row")
+
+        monkeypatch.setattr(fast_tokenizer, "encode", encode)
+        result = count_len_in_tokens(df, fast_tokenizer, batch_size=3, num_workers=2)
+
+        assert result["token_length"].to_list() == expected
+
+    def test_template_prefix_is_counted_once(self, fast_tokenizer, monkeypatch):
+        """Test that the shared chat-template prefix is encoded once and cached."""
+        import knowledge_utils
+
+        monkeypatch.setattr(knowledge_utils, "_PREFIX_TOKEN_COUNTS", {})
+        df = pl.DataFrame({
+            "messages": [
+                [{"role": "user", "content": f"what is document {i} ?"}]
+                for i in range(6)
+            ],
+        })
+
+        first = count_len_in_tokens(df, fast_tokenizer, batch_size=2)
+        second = count_len_in_tokens(df, fast_tokenizer, batch_size=4)
+
+        prefix = "<|system|>You are a helpful assistant.<|end|><|user|>"
+        assert knowledge_utils._PREFIX_TOKEN_COUNTS == {
+            (fast_tokenizer.name_or_path, prefix): len(fast_tokenizer.encode(prefix))
+        }
+        expected = [
+            len(
+                fast_tokenizer.encode(
+                    fast_tokenizer.apply_chat_template(m, tokenize=False)
+                )
+            )
+            for m in df["messages"].to_list()
+        ]
+        assert first["token_length"].to_list() == expected
+        assert second["token_length"].to_list() == expected
+
+    def test_lazy_frame_matches_eager(self):
+        """Test that a streamed LazyFrame gives the same result as eager."""
+        import sys
+        from pathlib import Path
+
+        # Add mocks to path
+        mocks_path = Path(__file__).parent / "mocks"
+        sys.path.insert(0, str(mocks_path))
+        from transformers_mock import MockTokenizer
+
+        df = pl.DataFrame({
+            "question": ["q1", "q2 with more words"],
+            "response": ["[ANSWER] r1 [END]", "r2"],
+            "document": ['doc "one"', "doc two"],
+            "document_outline": ["outline1", "outline2"],
+            "raw_document": ["raw1", "raw2 café"],
+        })
+
+        mock_tokenizer = MockTokenizer()
+        eager = count_len_in_tokens(generate_knowledge_qa_dataset(df), mock_tokenizer)
+        lazy = count_len_in_tokens(
+            generate_knowledge_qa_dataset(df.lazy()), mock_tokenizer
+        )
+
+        assert isinstance(lazy, pl.LazyFrame)
+        assert lazy.collect(engine="streaming").equals(eager)
+
     def test_tokenizer_mock_behavior(self):
         """Test that tokenizer mocks work correctly."""
         import sys
@@ -263,3 +672,70 @@ class TestCountLenInTokens:
         messages = [{"role": "user", "content": "test"}]
         template = tokenizer.apply_chat_template(messages, tokenize=False)
         assert isinstance(template, str)
+
+
+class TestPackTokenLengths:
+    """Test pack_token_lengths function."""
+
+    def test_packs_respect_max_seq_len(self):
+        """Test that no pack holds more than max_seq_len tokens."""
+        token_lengths = [5, 3, 3, 2, 9, 1, 7, 4, 6, 8]
+
+        pack_ids, stats = pack_token_lengths(token_lengths, max_seq_len=10)
+
+        pack_tokens = {}
+        for pack_id, length in zip(pack_ids, token_lengths, strict=True):
+            pack_tokens[pack_id] = pack_tokens.get(pack_id, 0) + length
+        assert max(pack_tokens.values()) <= 10
+        assert stats["packs"] == len(pack_tokens) == 5
+        assert stats["efficiency"] == sum(token_lengths) / 50
+        assert stats["oversized"] == 0
+
+    def test_oversized_samples_get_own_pack(self):
+        """Test that samples longer than max_seq_len are packed alone."""
+        pack_ids, stats = pack_token_lengths([12, 2, 3], max_seq_len=10)
+
+        assert pack_ids[0] not in pack_ids[1:]
+        assert pack_ids[1] == pack_ids[2]
+        assert stats["oversized"] == 1
+
+    def test_max_seq_len_validation(self):
+        """Test that max_seq_len must be positive."""
+        with pytest.raises(ValueError, match="max_seq_len must be positive"):
+            pack_token_lengths([1, 2], max_seq_len=0)
+
+
+class TestPackByTokenLength:
+    """Test pack_by_token_length function."""
+
+    def test_rows_are_ordered_by_pack(self):
+        """Test that rows get a pack_id and are written pack by pack."""
+        df = pl.DataFrame({
+            "sample": ["a", "b", "c", "d", "e", "f"],
+            "token_length": [6, 4, 5, 5, 3, 7],
+        })
+
+        packed, stats = pack_by_token_length(df, max_seq_len=10)
+
+        assert packed["pack_id"].is_sorted()
+        assert sorted(packed["sample"]) == sorted(df["sample"])
+        pack_tokens = packed.group_by("pack_id").agg(pl.col("token_length").sum())
+        assert pack_tokens["token_length"].to_list() == [10, 10, 10]
+        assert stats["efficiency"] == 1.0
+
+    def test_lazy_frame_matches_eager(self):
+        """Test that a LazyFrame gives the same result as eager."""
+        df = pl.DataFrame({
+            "sample": [f"s{i}" for i in range(20)],
+            "token_length": [(i * 7) % 11 + 1 for i in range(20)],
+        })
+
+        eager, eager_stats = pack_by_token_length(df, max_seq_len=16)
+        lazy, lazy_stats = pack_by_token_length(df.lazy(), max_seq_len=16)
+
+        assert isinstance(lazy, pl.LazyFrame)
+        # A LazyFrame is not sorted pack by pack, but keeps the sample order
+        lazy = lazy.collect(engine="streaming")
+        assert lazy["sample"].to_list() == df["sample"].to_list()
+        assert lazy.sort("pack_id", maintain_order=True).equals(eager)
+        assert lazy_stats == eager_stats